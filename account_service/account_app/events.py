@@ -0,0 +1,36 @@
+import time
+from decimal import Decimal
+
+from account_service.utils import Hub, Subscription
+
+
+__all__ = ['balance_hub', 'publish_balance_change', 'balance_events']
+
+# Balance change events keyed by the account owner id
+balance_hub = Hub()
+
+
+def publish_balance_change(user_id: str, account_id: str, balance: Decimal, change: Decimal, kind: str):
+    balance_hub.publish(user_id, ('balance', {
+        'account': account_id,
+        'balance': str(balance),
+        'change': str(change),
+        'kind': kind
+    }))
+
+
+def balance_events(subscription: Subscription, heartbeat: float, max_duration: float):
+    """
+    Yields published events and None as a heartbeat when nothing happened within the interval.
+    Stops when the subscription is dropped for being too slow or when max duration is reached,
+    clients are expected to reconnect.
+    """
+    ends_at = time.monotonic() + max_duration
+    try:
+        while not subscription.dropped:
+            remaining = ends_at - time.monotonic()
+            if remaining <= 0:
+                break
+            yield subscription.get(timeout=min(heartbeat, remaining))
+    finally:
+        subscription.close()
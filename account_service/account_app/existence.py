@@ -0,0 +1,118 @@
+import logging
+import threading
+import time
+
+from account_service.utils import BloomFilter
+from account_service.service import config, db_session, shard_indexes
+from .models import Account
+
+
+__all__ = ['AccountIdFilter', 'account_id_filter', 'start_account_id_filter']
+_logger = logging.getLogger(__name__)
+
+# Accounts created this long before a scan are guaranteed to be visible to it
+# (covers clock skew between hosts and transactions in flight)
+SCAN_MARGIN_SECONDS = 60
+SCAN_BATCH_SIZE = 10000
+
+
+def _object_id_timestamp(account_id: str):
+    """ Account ids are ObjectIds: the first 4 bytes are the creation unix time """
+    if len(account_id) != 24:
+        return None
+    try:
+        return int(account_id[:8], 16)
+    except ValueError:
+        return None
+
+
+class AccountIdFilter(object):
+    """
+    Bloom filter of existing account ids, answers "definitely does not exist" without a database query.
+
+    Accounts created by other processes after the last scan are not in the filter yet,
+    but since ids are ObjectIds their creation time is known: the filter only answers for ids
+    created before the point it has scanned up to and lets newer ones through to the database.
+    """
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = int(capacity)
+        self.error_rate = float(error_rate)
+        self.ready = False
+        self._bloom = BloomFilter(self.capacity, self.error_rate)
+        self._covered_until = 0
+        self._lock = threading.Lock()
+
+    def add(self, account_id: str):
+        self._bloom.add(account_id)
+
+    def might_exist(self, account_id: str) -> bool:
+        if not self.ready:
+            return True
+        timestamp = _object_id_timestamp(account_id)
+        if timestamp is not None and timestamp >= self._covered_until:
+            return True
+        return account_id in self._bloom
+
+    def _scan(self, bloom: BloomFilter, since: int = None) -> int:
+        """ Streams account ids into the filter, ids are ordered by creation time so the PK index is used """
+        count = 0
+        for shard in shard_indexes():
+            with db_session(shard=shard) as session:
+                query = session.query(Account.id).execution_options(stream_results=True)
+                if since is not None:
+                    query = query.filter(Account.id >= format(max(since, 0), '08x'))
+                for account_id, in query.yield_per(SCAN_BATCH_SIZE):
+                    # Incremental scans overlap, do not count the same id twice
+                    if since is None or account_id not in bloom:
+                        bloom.add(account_id)
+                        count += 1
+        return count
+
+    def build(self):
+        """ Full scan into a new filter """
+        started = time.time()
+        bloom = BloomFilter(self.capacity, self.error_rate)
+        count = self._scan(bloom)
+        if count > self.capacity:
+            self.capacity = count * 2
+            _logger.warning(f'Account filter capacity exceeded, rebuilding for {self.capacity} ids')
+            return self.build()
+
+        with self._lock:
+            self._bloom = bloom
+            self._covered_until = int(started) - SCAN_MARGIN_SECONDS
+            self.ready = True
+        _logger.info(f'Account filter built: {count} ids in {time.time() - started:.2f}s')
+
+    def refresh(self):
+        """ Incremental scan of accounts created since the previous scan """
+        if not self.ready or len(self._bloom) > self.capacity:
+            return self.build()
+
+        started = time.time()
+        self._scan(self._bloom, since=self._covered_until - SCAN_MARGIN_SECONDS)
+        with self._lock:
+            self._covered_until = int(started) - SCAN_MARGIN_SECONDS
+
+
+account_id_filter = AccountIdFilter(capacity=config.ACCOUNT_BLOOM_CAPACITY,
+                                    error_rate=config.ACCOUNT_BLOOM_ERROR_RATE)  # type: AccountIdFilter
+_refresh_thread = None  # type: threading.Thread
+
+
+def start_account_id_filter(interval: float):
+    """ Builds the filter and keeps it up to date in a background thread, startup is not blocked """
+    global _refresh_thread
+    if _refresh_thread is not None:
+        return
+
+    def _run():
+        while True:
+            try:
+                account_id_filter.refresh()
+            except Exception as err:
+                _logger.warning(f'Failed to refresh account filter: {err}')
+            time.sleep(interval)
+
+    _refresh_thread = threading.Thread(target=_run, name='account-filter-refresh', daemon=True)
+    _refresh_thread.start()
@@ -0,0 +1,107 @@
+import csv
+import heapq
+import json
+from datetime import datetime
+from typing import Iterator, Optional
+
+from sqlalchemy import select, func
+
+from account_service.service import db_session, shard_for, shard_indexes
+from .models import Account, AccountSlot
+
+
+__all__ = ['EXPORT_FORMATS', 'export_accounts']
+
+EXPORT_FIELDS = ['id', 'user_id', 'balance', 'created', 'updated']
+# format: content type
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class _ByteBuffer(object):
+    """ Text sink for csv.writer, rows are encoded straight into a byte buffer """
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, text: str):
+        self.data += text.encode('utf-8')
+
+
+def _export_query(user_id: Optional[str], updated_since: Optional[datetime], updated_until: Optional[datetime]):
+    # Balances of hot accounts are spread over slots
+    slot_totals = select([AccountSlot.account_id, func.sum(AccountSlot.balance).label('balance')])\
+        .group_by(AccountSlot.account_id)\
+        .alias('slot_totals')
+    balance = (Account.balance + func.coalesce(slot_totals.c.balance, 0)).label('balance')
+    query = select([Account.id, Account.user_id, balance, Account.created, Account.updated])\
+        .select_from(Account.__table__.outerjoin(slot_totals, slot_totals.c.account_id == Account.id))\
+        .order_by(Account.id)
+    if user_id is not None:
+        query = query.where(Account.user_id == user_id)
+    if updated_since is not None:
+        query = query.where(Account.updated >= updated_since)
+    if updated_until is not None:
+        query = query.where(Account.updated < updated_until)
+    return query
+
+
+def _rows(query, batch_size: int, shard: Optional[int]) -> Iterator[tuple]:
+    """ Rows are fetched in batches from a server-side cursor, the result is never loaded as a whole """
+    with db_session(readonly=True, shard=shard) as session:
+        result = session.connection(execution_options={'stream_results': True}).execute(query)
+        try:
+            while True:
+                rows = result.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            result.close()
+
+
+def _format(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if value is None:
+        return None
+    return str(value)
+
+
+def export_accounts(export_format: str,
+                    user_id: str = None,
+                    updated_since: datetime = None,
+                    updated_until: datetime = None,
+                    batch_size: int = 1000,
+                    chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """
+    Streams accounts as CSV (with a header) or NDJSON, yields chunks of exactly chunk_size bytes (but the last).
+    Rows are ordered by account id.
+    """
+    buffer = _ByteBuffer()
+    if export_format == 'csv':
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_FIELDS)
+        write_row = writer.writerow
+    elif export_format == 'ndjson':
+        def write_row(row):
+            buffer.write(json.dumps(dict(zip(EXPORT_FIELDS, row)), separators=(',', ':')))
+            buffer.write('\n')
+    else:
+        raise ValueError(f'Unknown export format: {export_format}')
+
+    query = _export_query(user_id, updated_since, updated_until)
+    if user_id is not None:
+        shards = [shard_for(user_id)]
+    else:
+        shards = shard_indexes()
+    # Rows of every shard are ordered by id, merged they stay ordered
+    rows = heapq.merge(*[_rows(query, batch_size, shard) for shard in shards], key=lambda row: row[0])
+    for row in rows:
+        write_row([_format(value) for value in row])
+        while len(buffer.data) >= chunk_size:
+            yield bytes(buffer.data[:chunk_size])
+            del buffer.data[:chunk_size]
+    if buffer.data:
+        yield bytes(buffer.data)
@@ -4,7 +4,7 @@ import bson
 from sqlalchemy import Column, Integer, String, DECIMAL, TIMESTAMP, func
 from account_service.models import BaseModel, JsonSerializable
 
-__all__ = ['Account', 'tables']
+__all__ = ['Account', 'AccountSlot', 'TransferOutbox', 'TransferInbox', 'tables']
 
 
 class CreatedUpdatedMixin(object):
@@ -14,10 +14,13 @@ class CreatedUpdatedMixin(object):
 
 class Account(BaseModel, CreatedUpdatedMixin, JsonSerializable):
     id = Column(String(255), primary_key=True)
-    user_id = Column(String(255), nullable=False)
+    user_id = Column(String(255), nullable=False, index=True)
     balance = Column(DECIMAL(19, 4), nullable=False)
     state = Column(Integer, nullable=False, default=0)
 
+    # Number of balance slots of a "hot" account, 0 - regular account
+    slots = Column(Integer, nullable=False, default=0, server_default='0')
+
     serialize_fields = [id, user_id, balance]
 
     def __init__(self, user_id, balance: Decimal = Decimal('0')):
@@ -29,4 +32,69 @@ class Account(BaseModel, CreatedUpdatedMixin, JsonSerializable):
         return f'<Account({self.id} {self.user_id}, {self.balance})>'
 
 
-tables = [Account.__table__]
+class AccountSlot(BaseModel):
+    """
+    Part of the balance of a hot account. Incoming transfers are credited to a random slot
+    instead of the account row, so concurrent credits do not conflict on Account.state.
+    Visible balance of an account is Account.balance plus the sum of its slots.
+    """
+    account_id = Column(String(255), primary_key=True)
+    slot = Column(Integer, primary_key=True, autoincrement=False)
+    balance = Column(DECIMAL(19, 4), nullable=False, default=0)
+
+    def __init__(self, account_id: str, slot: int, balance: Decimal = Decimal('0')):
+        self.account_id = account_id
+        self.slot = slot
+        self.balance = balance
+
+    def __repr__(self):
+        return f'<AccountSlot({self.account_id} #{self.slot}, {self.balance})>'
+
+
+class TransferOutbox(BaseModel):
+    """
+    Transfer to an account in another shard. Written to the sender's shard in the transaction debiting the sender,
+    stays pending until the receiver is credited (see account_app.transfers).
+    """
+    PENDING = 0
+    DELIVERED = 1
+    REFUNDED = 2  # Receiver does not exist anymore, amount returned to the sender
+
+    id = Column(String(255), primary_key=True)
+    sender_id = Column(String(255), nullable=False, index=True)
+    receiver_id = Column(String(255), nullable=False)
+    amount = Column(DECIMAL(19, 4), nullable=False)
+    state = Column(Integer, nullable=False, default=PENDING, index=True)
+    created = Column(TIMESTAMP, server_default=func.now())
+
+    def __init__(self, sender_id: str, receiver_id: str, amount: Decimal):
+        self.id = str(bson.ObjectId())
+        self.sender_id = sender_id
+        self.receiver_id = receiver_id
+        self.amount = amount
+        self.state = self.PENDING
+
+    def __repr__(self):
+        return f'<TransferOutbox({self.id} {self.sender_id} -> {self.receiver_id}, {self.amount}, {self.state})>'
+
+
+class TransferInbox(BaseModel):
+    """
+    Cross-shard transfer credited to the receiver, written to the receiver's shard in the same transaction.
+    Primary key on the transfer id makes delivery idempotent.
+    """
+    id = Column(String(255), primary_key=True)
+    receiver_id = Column(String(255), nullable=False, index=True)
+    amount = Column(DECIMAL(19, 4), nullable=False)
+    created = Column(TIMESTAMP, server_default=func.now())
+
+    def __init__(self, transfer_id: str, receiver_id: str, amount: Decimal):
+        self.id = transfer_id
+        self.receiver_id = receiver_id
+        self.amount = amount
+
+    def __repr__(self):
+        return f'<TransferInbox({self.id} {self.receiver_id}, {self.amount})>'
+
+
+tables = [Account.__table__, AccountSlot.__table__, TransferOutbox.__table__, TransferInbox.__table__]
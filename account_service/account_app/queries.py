@@ -0,0 +1,60 @@
+"""
+Read-only fast path for the hot account queries.
+Statements are built once and their compiled form is cached (compiled_cache execution option),
+rows are plain tuples serialized straight to dicts, no ORM instances or identity map involved.
+Writes go through the ORM.
+"""
+from decimal import Decimal
+from typing import List, Optional, Iterable
+
+from sqlalchemy import select, func, and_, bindparam
+
+from .models import Account, AccountSlot
+
+
+__all__ = ['user_accounts', 'user_account', 'user_accounts_by_ids']
+
+# Compiled SQL per statement and dialect, bounded by the number of statements below
+_compiled_cache = {}
+
+# Balance of hot accounts is spread over slots, NULL for regular accounts
+_slots_total = select([func.sum(AccountSlot.balance)])\
+    .where(AccountSlot.account_id == Account.id)\
+    .as_scalar()\
+    .label('slots_total')
+_columns = [Account.id, Account.user_id, Account.balance, _slots_total]
+
+_user_accounts = select(_columns)\
+    .where(Account.user_id == bindparam('user_id'))
+_user_account = select(_columns)\
+    .where(and_(Account.id == bindparam('account_id'), Account.user_id == bindparam('user_id')))
+_user_accounts_by_ids = select(_columns)\
+    .where(and_(Account.user_id == bindparam('user_id'), Account.id.in_(bindparam('ids', expanding=True))))
+
+
+def _execute(session, statement, **params):
+    # Runs within the transaction of the session
+    connection = session.connection().execution_options(compiled_cache=_compiled_cache)
+    return connection.execute(statement, params)
+
+
+def _serialize(row) -> dict:
+    """ Same fields and formatting as Account.to_dict() (see serialize_accounts) """
+    account_id, user_id, balance, slots_total = row
+    if slots_total is not None:
+        balance += Decimal(slots_total)
+    return {'id': account_id, 'user_id': user_id, 'balance': str(balance)}
+
+
+def user_accounts(session, user_id: str) -> List[dict]:
+    return [_serialize(row) for row in _execute(session, _user_accounts, user_id=user_id)]
+
+
+def user_account(session, user_id: str, account_id: str) -> Optional[dict]:
+    row = _execute(session, _user_account, user_id=user_id, account_id=account_id).first()
+    return _serialize(row) if row is not None else None
+
+
+def user_accounts_by_ids(session, user_id: str, account_ids: Iterable[str]) -> List[dict]:
+    return [_serialize(row) for row in _execute(session, _user_accounts_by_ids, user_id=user_id,
+                                                ids=list(account_ids))]
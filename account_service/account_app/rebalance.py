@@ -0,0 +1,93 @@
+import logging
+from collections import defaultdict
+from typing import List, Dict, Optional
+
+from sqlalchemy import select
+
+from account_service.service import db_session, shard_for, shard_indexes
+from .models import Account, AccountSlot, TransferOutbox, TransferInbox
+
+
+__all__ = ['rebalance_accounts']
+_logger = logging.getLogger(__name__)
+
+# Rows moved together with an account: column referencing the account id
+_ACCOUNT_ROWS = [
+    Account.__table__.c.id,
+    AccountSlot.__table__.c.account_id,
+    TransferOutbox.__table__.c.sender_id,
+    TransferInbox.__table__.c.receiver_id,
+]
+
+
+def _sources(include_database_uri: bool) -> List[Optional[int]]:
+    """
+    Shards, preceded by None (DATABASE_URI) if it has account tables:
+    accounts created before sharding was enabled are stored there and are not read anymore until moved
+    """
+    shards = shard_indexes()
+    if shards == [None]:
+        return []  # Not sharded, every account is where it belongs
+    if not include_database_uri:
+        return shards
+    with db_session() as session:
+        connection = session.connection()
+        if connection.dialect.has_table(connection, Account.__tablename__):
+            return [None] + shards
+    return shards
+
+
+def _move(account_ids: List[str], source: Optional[int], target: int):
+    rows = {}
+    # Not readonly: DATABASE_URI must be read from the primary, not from a replica
+    with db_session(shard=source) as session:
+        for column in _ACCOUNT_ROWS:
+            rows[column] = [dict(row) for row in session.execute(select([column.table]).where(column.in_(account_ids)))]
+
+    with db_session(shard=target) as session:
+        for column in _ACCOUNT_ROWS:
+            # Copies left by an interrupted run are replaced
+            session.execute(column.table.delete().where(column.in_(account_ids)))
+            if rows[column]:
+                session.execute(column.table.insert(), rows[column])
+
+    # Not atomic with the copy: if this fails, rows stay in both shards and the next run moves them again
+    with db_session(shard=source) as session:
+        for column in _ACCOUNT_ROWS:
+            session.execute(column.table.delete().where(column.in_(account_ids)))
+
+
+def rebalance_accounts(batch_size: int = 500, include_database_uri: bool = True) -> Dict[tuple, int]:
+    """
+    Moves accounts (with their slots and transfer outbox/inbox rows) to the shard of their owner
+    according to the current DATABASE_SHARD_URIS, returns {(source, target): number of accounts}.
+    Accounts of DATABASE_URI (source None), created before sharding was enabled, are moved to the shards too
+    unless include_database_uri is False.
+    Writes should be stopped while it runs: account updates made during a move are lost.
+    Safe to run again after an interruption.
+    """
+    moved = defaultdict(int)
+    for source in _sources(include_database_uri):
+        last_id = ''
+        while True:
+            with db_session(shard=source) as session:
+                batch = session.query(Account.id, Account.user_id)\
+                    .filter(Account.id > last_id)\
+                    .order_by(Account.id)\
+                    .limit(batch_size)\
+                    .all()
+            if not batch:
+                break
+            last_id = batch[-1][0]
+
+            misplaced = defaultdict(list)
+            for account_id, user_id in batch:
+                target = shard_for(user_id)
+                if target != source:
+                    misplaced[target].append(account_id)
+            for target, account_ids in misplaced.items():
+                _move(account_ids, source, target)
+                moved[(source, target)] += len(account_ids)
+                _logger.info(f'Moved {len(account_ids)} accounts from '
+                             f'{"DATABASE_URI" if source is None else f"shard {source}"} to shard {target}')
+    return dict(moved)
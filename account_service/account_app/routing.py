@@ -1,7 +1,16 @@
 from account_service.utils import Router
+from account_service.service import config, configured_bulkhead
 from account_service.account_app.views import *
 
+# Classes of traffic which could take all server threads
+streams = configured_bulkhead('stream')
+transfers = configured_bulkhead('transfer')
+
 router = Router()
 router.add_route('^/accounts$', accounts_view)
-router.add_route('^/accounts/(?P<account_id>[0-9a-z_-]+)/transfer$', account_transfer)
+router.add_route('^/accounts/summary$', accounts_summary)
+router.add_route('^/accounts/stream$', accounts_stream, bulkhead=streams)
+router.add_route('^/accounts/export$', accounts_export, bulkhead=streams)
+router.add_route('^/accounts/(?P<account_id>[0-9a-z_-]+)/transfer$', account_transfer,
+                 timeout=float(config.ACCOUNT_TRANSFER_TIMEOUT_SECONDS), bulkhead=transfers)
 router.add_route('^/accounts/(?P<account_id>[0-9a-z_-]+)$', account_detail)
@@ -0,0 +1,82 @@
+import random
+from decimal import Decimal
+from typing import List, Iterable, Dict
+
+from sqlalchemy import func
+
+from .models import Account, AccountSlot
+
+
+__all__ = ['set_hot_slots', 'credit_slot', 'sweep_slots', 'slot_balances', 'visible_balance', 'serialize_accounts']
+
+ZERO = Decimal('0')
+
+
+def set_hot_slots(session, account: Account, slots: int):
+    """ Enables (slots > 0) or disables (slots == 0) hot mode of an account """
+    if slots < 0:
+        raise ValueError('Number of slots can not be negative')
+
+    # Move everything back to the account row first, then recreate slots
+    swept = sweep_slots(session, account.id)
+    session.query(AccountSlot).filter(AccountSlot.account_id == account.id).delete(synchronize_session=False)
+    session.query(Account).filter(Account.id == account.id).update({
+        Account.balance: Account.balance + swept,
+        Account.state: Account.state + 1,
+        Account.slots: slots
+    }, synchronize_session=False)
+    session.add_all([AccountSlot(account.id, slot) for slot in range(slots)])
+
+
+def credit_slot(session, account: Account, amount: Decimal) -> int:
+    """ Credits amount to a random slot of a hot account, returns number of affected rows """
+    return session.query(AccountSlot)\
+        .filter(AccountSlot.account_id == account.id, AccountSlot.slot == random.randrange(account.slots))\
+        .update({AccountSlot.balance: AccountSlot.balance + amount}, synchronize_session=False)
+
+
+def sweep_slots(session, account_id: str) -> Decimal:
+    """
+    Empties slots of an account and returns the swept amount which the caller must add to the account row
+    within the same transaction. Subtracting the read value (instead of zeroing) keeps credits
+    that land concurrently.
+    """
+    swept = ZERO
+    slots = session.query(AccountSlot.slot, AccountSlot.balance)\
+        .filter(AccountSlot.account_id == account_id, AccountSlot.balance != 0)\
+        .all()
+    for slot, balance in slots:
+        session.query(AccountSlot)\
+            .filter(AccountSlot.account_id == account_id, AccountSlot.slot == slot)\
+            .update({AccountSlot.balance: AccountSlot.balance - balance}, synchronize_session=False)
+        swept += balance
+    return swept
+
+
+def slot_balances(session, account_ids: Iterable[str]) -> Dict[str, Decimal]:
+    account_ids = list(account_ids)
+    if not account_ids:
+        return {}
+    rows = session.query(AccountSlot.account_id, func.sum(AccountSlot.balance))\
+        .filter(AccountSlot.account_id.in_(account_ids))\
+        .group_by(AccountSlot.account_id)\
+        .all()
+    return {account_id: Decimal(total or 0) for account_id, total in rows}
+
+
+def visible_balance(session, account: Account) -> Decimal:
+    if not account.slots:
+        return account.balance
+    return account.balance + slot_balances(session, [account.id]).get(account.id, ZERO)
+
+
+def serialize_accounts(session, accounts: List[Account]) -> List[dict]:
+    """ Serializes accounts with the balance of hot accounts aggregated over their slots """
+    hot = slot_balances(session, (a.id for a in accounts if a.slots))
+    result = []
+    for account in accounts:
+        data = account.to_dict()
+        if account.id in hot:
+            data['balance'] = str(account.balance + hot[account.id])
+        result.append(data)
+    return result
@@ -0,0 +1,15 @@
+"""
+Cached per-user totals of GET /accounts/summary.
+Every code path changing balances (views and the cross-shard transfer relay) invalidates the users it touched.
+"""
+from account_service.service import config
+from account_service.utils import LocalCache
+
+
+__all__ = ['summary_cache', 'invalidate_summary']
+
+summary_cache = LocalCache(max_size=config.ACCOUNT_SUMMARY_CACHE_SIZE, ttl=config.ACCOUNT_SUMMARY_CACHE_SECONDS)
+
+
+def invalidate_summary(*user_ids):
+    summary_cache.delete(*user_ids)
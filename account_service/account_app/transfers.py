@@ -0,0 +1,159 @@
+"""
+Transfers between accounts stored in different shards (transactional outbox).
+
+1. The sender's shard: the sender is debited and a TransferOutbox row is written in the same transaction.
+2. The receiver's shard: the receiver is credited and a TransferInbox row (keyed by the transfer id) is written
+   in the same transaction, so a transfer is credited at most once however many times delivery is attempted.
+3. The sender's shard: the outbox row is marked delivered.
+
+Delivery is attempted right after the debit and retried by a background relay until it succeeds,
+so every debited transfer is eventually credited (or refunded if the receiver has disappeared).
+"""
+import logging
+import threading
+import time
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy.exc import IntegrityError
+
+from account_service.service import db_session, shard_indexes
+from .models import Account, TransferOutbox, TransferInbox
+from .slots import credit_slot, visible_balance
+from .events import publish_balance_change
+from .summary import invalidate_summary
+
+
+__all__ = ['account_shard', 'deliver_transfer', 'relay_pending_transfers', 'start_transfer_relay']
+_logger = logging.getLogger(__name__)
+
+
+def account_shard(account_id: str, first: Optional[int] = None) -> Optional[int]:
+    """
+    Shard storing the account (accounts should be sharded), None if it does not exist.
+    Shards are probed one by one starting with the given one.
+    """
+    shards = shard_indexes()
+    if first is not None:
+        shards.remove(first)
+        shards.insert(0, first)
+    for shard in shards:
+        with db_session(readonly=True, shard=shard) as session:
+            if session.query(Account.id).filter(Account.id == account_id).scalar() is not None:
+                return shard
+    return None
+
+
+def _credit(transfer_id: str, receiver_id: str, amount: Decimal, receiver_shard: int) -> Optional[tuple]:
+    """ Credits the receiver once per transfer id, returns the balance event or None if already credited """
+    try:
+        with db_session(shard=receiver_shard) as session:
+            if session.query(TransferInbox.id).filter(TransferInbox.id == transfer_id).scalar() is not None:
+                return None
+            receiver = session.query(Account).filter(Account.id == receiver_id).one()
+            balance = visible_balance(session, receiver)
+            if receiver.slots:
+                credit_slot(session, receiver, amount)
+            else:
+                # Relative update, bumping state fails concurrent optimistic transfers of the receiver
+                session.query(Account).filter(Account.id == receiver_id).update({
+                    Account.balance: Account.balance + amount,
+                    Account.state: Account.state + 1
+                }, synchronize_session=False)
+            session.add(TransferInbox(transfer_id, receiver_id, amount))
+            event = (receiver.user_id, receiver_id, balance + amount, amount)
+    except IntegrityError:
+        # Delivered concurrently (by the relay or the request), the inbox row of the other delivery won
+        return None
+    return event
+
+
+def _refund(transfer_id: str, sender_shard: int) -> Optional[tuple]:
+    with db_session(shard=sender_shard) as session:
+        outbox = session.query(TransferOutbox).filter(TransferOutbox.id == transfer_id,
+                                                      TransferOutbox.state == TransferOutbox.PENDING).first()
+        if outbox is None:
+            return None
+        outbox.state = TransferOutbox.REFUNDED
+        sender = session.query(Account).filter(Account.id == outbox.sender_id).one()
+        balance = visible_balance(session, sender)
+        session.query(Account).filter(Account.id == sender.id).update({
+            Account.balance: Account.balance + outbox.amount,
+            Account.state: Account.state + 1
+        }, synchronize_session=False)
+        return sender.user_id, sender.id, balance + outbox.amount, outbox.amount
+
+
+def deliver_transfer(transfer_id: str, sender_shard: int) -> Optional[int]:
+    """
+    Credits a pending cross-shard transfer to the receiver, safe to call concurrently and repeatedly.
+    Returns the new outbox state, None if there is no such transfer.
+    Balance events are published and summaries of the credited (or refunded) users are invalidated.
+    """
+    with db_session(readonly=True, shard=sender_shard) as session:
+        outbox = session.query(TransferOutbox).filter(TransferOutbox.id == transfer_id).first()
+        if outbox is None:
+            return None
+        if outbox.state != TransferOutbox.PENDING:
+            return outbox.state
+        receiver_id, amount = outbox.receiver_id, outbox.amount
+
+    receiver_shard = account_shard(receiver_id)
+    if receiver_shard is None:
+        _logger.warning(f'Receiver {receiver_id} of transfer {transfer_id} does not exist, refunding')
+        event = _refund(transfer_id, sender_shard)
+        if event is not None:
+            invalidate_summary(event[0])
+            publish_balance_change(*event, kind='refund')
+        return TransferOutbox.REFUNDED
+
+    event = _credit(transfer_id, receiver_id, amount, receiver_shard)
+    if event is not None:
+        invalidate_summary(event[0])
+        publish_balance_change(*event, kind='transfer')
+
+    with db_session(shard=sender_shard) as session:
+        session.query(TransferOutbox)\
+            .filter(TransferOutbox.id == transfer_id, TransferOutbox.state == TransferOutbox.PENDING)\
+            .update({TransferOutbox.state: TransferOutbox.DELIVERED}, synchronize_session=False)
+    _logger.info('Delivered transfer %s of %s to %s', transfer_id, amount, receiver_id)
+    return TransferOutbox.DELIVERED
+
+
+def relay_pending_transfers(batch_size: int = 100) -> int:
+    """ Delivers pending transfers of all shards, returns the number of processed ones """
+    processed = 0
+    for shard in shard_indexes():
+        with db_session(readonly=True, shard=shard) as session:
+            pending = [transfer_id for transfer_id, in session.query(TransferOutbox.id)
+                       .filter(TransferOutbox.state == TransferOutbox.PENDING)
+                       .order_by(TransferOutbox.id)
+                       .limit(batch_size)]
+        for transfer_id in pending:
+            try:
+                deliver_transfer(transfer_id, shard)
+                processed += 1
+            except Exception as err:
+                _logger.warning(f'Failed to deliver transfer {transfer_id}: {err}')
+    return processed
+
+
+_relay_thread = None  # type: threading.Thread
+
+
+def start_transfer_relay(interval: float):
+    """ Retries delivery of pending cross-shard transfers in a background thread """
+    global _relay_thread
+    if _relay_thread is not None:
+        return
+
+    def _run():
+        while True:
+            time.sleep(interval)
+            try:
+                relay_pending_transfers()
+            except Exception as err:
+                _logger.warning(f'Failed to relay pending transfers: {err}')
+
+    _relay_thread = threading.Thread(target=_run, name='transfer-relay', daemon=True)
+    _relay_thread.start()
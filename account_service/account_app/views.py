@@ -1,95 +1,337 @@
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
+from datetime import timezone
 import logging
 
-from account_service.utils import Request, JsonResponse, allow_methods, allow_cors, HttpError, Status
-from account_service.service import db_session, config
+from dateutil.parser import isoparse
+from sqlalchemy import func
+
+from account_service.utils import Request, JsonResponse, EventStreamResponse, ChunkedResponse, allow_methods, \
+    allow_cors, HttpError, Status, LocalCache, TieredCache
+from account_service.service import db_session, config, retry_transaction, shared_cache, shard_for, \
+    served_by_replica
 from account_service.auth_app.auth import requires_auth, get_user_from_request
-from .models import Account
+from account_service.auth_app.models import Role
+from .models import Account, AccountSlot, TransferOutbox
+from .slots import credit_slot, sweep_slots, visible_balance, serialize_accounts
+from .events import balance_hub, balance_events, publish_balance_change
+from .existence import account_id_filter
+from .export import EXPORT_FORMATS, export_accounts
+from .transfers import account_shard, deliver_transfer
+from .summary import summary_cache, invalidate_summary
+from . import queries
 
 _logger = logging.getLogger(__name__)
 
+# Negative lookups: ids of accounts that do not exist, `{user_id}/{account_id}` of accounts that do not belong
+# to the user (with sharding: are not stored in the user's shard). Accounts are never deleted or given to another user
+# and rebalance moves them with their owners, so entries can not become stale.
+_missing_accounts = TieredCache('account-missing',
+                                LocalCache(max_size=config.ACCOUNT_NEGATIVE_CACHE_SIZE,
+                                           ttl=config.ACCOUNT_NEGATIVE_CACHE_SECONDS),
+                                shared=shared_cache)
+
+
+def _parse_amount(value, message: str) -> Decimal:
+    """
+    Positive amount of a request argument: a decimal string or a number (JSON, msgpack and CBOR bodies).
+    Floats are converted through their shortest repr, so 0.1 is Decimal('0.1') and not the binary approximation.
+    """
+    if isinstance(value, float):
+        value = str(value)
+    if not isinstance(value, (str, int, Decimal)) or isinstance(value, bool):
+        raise HttpError(Status.BAD_REQUEST, message=message)
+    try:
+        amount = Decimal(value)
+    except (InvalidOperation, ValueError):
+        raise HttpError(Status.BAD_REQUEST, message=message)
+    if not amount.is_finite() or amount <= 0:
+        raise HttpError(Status.BAD_REQUEST, message=message)
+    return amount
+
+
+def _string_arg(value, message: str) -> str:
+    """ Typed bodies may carry any value where a string is expected (lists and dicts can not even be cache keys) """
+    if not isinstance(value, str):
+        raise HttpError(Status.BAD_REQUEST, message=message)
+    return value
+
 
 @allow_methods('GET', 'POST')
 @requires_auth()
+@retry_transaction()
 def accounts_view(request: Request) -> JsonResponse:
     user = get_user_from_request(request)
     user_id = user.get('id')
 
-    with db_session() as session:
-        _logger.debug('Query')
-        accounts = session.query(Account).filter(Account.user_id == user_id).all()
-        if request.method == 'POST':
-            account = Account(user_id)
-            session.add(account)
-            return JsonResponse(account.to_dict(), Status.CREATED)
+    if request.method == 'POST':
+        return _create_accounts(request, user_id)
+
+    if 'ids' in request.data:
+        return _accounts_by_ids(request, user_id)
+
+    with db_session(readonly=True, shard_key=user_id) as session:
+        return JsonResponse(queries.user_accounts(session, user_id))
+
+
+def _create_accounts(request: Request, user_id: str) -> JsonResponse:
+    """ Creates one account, or `count` accounts with a single bulk INSERT """
+    count = request.data.get('count')
+    if count is not None:
+        # Digits of a form or query string, or an integer of a typed body (not a float or a boolean)
+        if isinstance(count, str) and count.isdecimal():
+            count = int(count)
+        elif not isinstance(count, int) or isinstance(count, bool):
+            raise HttpError(Status.BAD_REQUEST, message='Invalid count')
+        if not 0 < count <= int(config.ACCOUNT_CREATE_MAX_COUNT):
+            raise HttpError(Status.BAD_REQUEST,
+                            message=f'Count should be between 1 and {config.ACCOUNT_CREATE_MAX_COUNT}')
+
+    # Ids are generated locally, no need to load anything back after the insert
+    accounts = [Account(user_id) for _ in range(count or 1)]
+    with db_session(shard_key=user_id) as session:
+        session.execute(Account.__table__.insert(),
+                        [{'id': a.id, 'user_id': a.user_id, 'balance': a.balance, 'state': 0, 'slots': 0}
+                         for a in accounts])
+
+    for account in accounts:
+        account_id_filter.add(account.id)
+    invalidate_summary(user_id)
+
+    if count is None:
+        return JsonResponse(accounts[0].to_dict(), Status.CREATED)
+    return JsonResponse([a.to_dict() for a in accounts], Status.CREATED)
+
+
+def _accounts_by_ids(request: Request, user_id: str) -> JsonResponse:
+    """ Multi-get: resolves all requested accounts of the user with a single IN query """
+    raw_ids = request.data.get('ids')
+    if isinstance(raw_ids, list):
+        raw_ids = ','.join(_string_arg(i, 'Invalid account ids') for i in raw_ids)
+    raw_ids = _string_arg(raw_ids, 'Invalid account ids')
+
+    # Keep requested order, drop duplicates and empty values
+    ids = list(dict.fromkeys(i.strip() for i in raw_ids.split(',') if i.strip()))
+    if not ids:
+        raise HttpError(Status.BAD_REQUEST, message='No account ids requested')
+    if len(ids) > int(config.ACCOUNT_MULTI_GET_MAX_IDS):
+        raise HttpError(Status.BAD_REQUEST,
+                        message=f'Too many account ids, at most {config.ACCOUNT_MULTI_GET_MAX_IDS} allowed')
+
+    with db_session(readonly=True, shard_key=user_id) as session:
+        found = {a['id']: a for a in queries.user_accounts_by_ids(session, user_id, ids)}
+
+    results = []
+    for account_id in ids:
+        account = found.get(account_id)
+        if account is None:
+            results.append({'id': account_id, 'status': Status.NOT_FOUND, 'message': 'Account not found'})
+        else:
+            results.append({'id': account_id, 'status': Status.OK, 'account': account})
+    return JsonResponse(results)
+
+
+@allow_methods('GET')
+@requires_auth()
+@retry_transaction()
+def accounts_summary(request: Request) -> JsonResponse:
+    user = get_user_from_request(request)
+    user_id = user.get('id')
+
+    summary = summary_cache.get(user_id)
+    if summary is None:
+        with db_session(readonly=True, shard_key=user_id) as session:
+            # Balances of hot accounts are spread over slots
+            slot_totals = session.query(AccountSlot.account_id, func.sum(AccountSlot.balance).label('balance'))\
+                .group_by(AccountSlot.account_id)\
+                .subquery()
+            balance = Account.balance + func.coalesce(slot_totals.c.balance, 0)
+            count, total, min_balance, max_balance = session.query(
+                func.count(Account.id),
+                func.sum(balance),
+                func.min(balance),
+                func.max(balance))\
+                .outerjoin(slot_totals, slot_totals.c.account_id == Account.id)\
+                .filter(Account.user_id == user_id)\
+                .one()
+
+        summary = {
+            'user_id': user_id,
+            'count': count,
+            'total': str(total if total is not None else Decimal('0')),
+            'min_balance': str(min_balance) if min_balance is not None else None,
+            'max_balance': str(max_balance) if max_balance is not None else None,
+        }
+        summary_cache.set(user_id, summary)
+    return JsonResponse(summary)
+
+
+@allow_methods('GET')
+@requires_auth()
+def accounts_stream(request: Request) -> EventStreamResponse:
+    """ Server-Sent Events stream of balance changes of all accounts of the current user """
+    user = get_user_from_request(request)
+    subscription = balance_hub.subscribe([user.get('id')], max_size=config.ACCOUNT_STREAM_BUFFER_SIZE)
+    return EventStreamResponse(balance_events(subscription,
+                                              heartbeat=float(config.ACCOUNT_STREAM_HEARTBEAT_SECONDS),
+                                              max_duration=float(config.ACCOUNT_STREAM_MAX_SECONDS)))
+
+
+@allow_methods('GET')
+@requires_auth()
+def accounts_export(request: Request) -> ChunkedResponse:
+    """
+    Streams accounts as CSV or NDJSON straight from a database cursor.
+    Admins may export accounts of all users or of a specific user, other users only their own accounts.
+    """
+    user = get_user_from_request(request)
+    export_format = request.data.get('format', 'csv')
+    if not isinstance(export_format, str) or export_format not in EXPORT_FORMATS:
+        raise HttpError(Status.BAD_REQUEST, message=f'Format should be one of: {", ".join(EXPORT_FORMATS)}')
+
+    user_id = request.data.get('user_id')
+    if user.get('role') != Role.ADMIN.value:
+        if user_id is not None and user_id != user.get('id'):
+            raise HttpError(Status.FORBIDDEN, message='Not allowed to export accounts of other users')
+        user_id = user.get('id')
+
+    chunks = export_accounts(export_format,
+                             user_id=user_id,
+                             updated_since=_parse_timestamp(request, 'updated_since'),
+                             updated_until=_parse_timestamp(request, 'updated_until'),
+                             batch_size=int(config.ACCOUNT_EXPORT_BATCH_SIZE),
+                             chunk_size=int(config.ACCOUNT_EXPORT_CHUNK_SIZE))
+    response = ChunkedResponse(chunks, content_type=EXPORT_FORMATS[export_format])
+    response.headers['Content-Disposition'] = f'attachment; filename="accounts.{export_format}"'
+    return response
 
-        _logger.debug('Returning')
-        return JsonResponse([a.to_dict() for a in accounts])
+
+def _parse_timestamp(request: Request, key: str):
+    value = request.data.get(key)
+    if value is None:
+        return None
+    try:
+        timestamp = isoparse(value)
+    except ValueError:
+        raise HttpError(Status.BAD_REQUEST, message=f'Invalid {key}, ISO 8601 timestamp expected')
+    if timestamp.tzinfo is not None:
+        # Timestamps are stored in UTC without timezone
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
 
 
 @allow_methods('GET', 'PUT', 'DELETE')
 @requires_auth()
+@retry_transaction()
 def account_detail(request: Request, account_id) -> JsonResponse:
     user = get_user_from_request(request)
     user_id = user.get('id')
 
-    with db_session() as session:
+    missing_key = f'{user_id}/{account_id}'
+    if not account_id_filter.might_exist(account_id) or _missing_accounts.get(missing_key):
+        raise HttpError(Status.NOT_FOUND, message='Account not found')
+
+    if request.method == 'GET':
+        with db_session(readonly=True, shard_key=user_id) as session:
+            data = queries.user_account(session, user_id, account_id)
+            lagging = served_by_replica(session)
+        if data is None and lagging:
+            # The account may have been created after the state of the replica, only the primary can tell
+            with db_session(shard_key=user_id) as session:
+                data = queries.user_account(session, user_id, account_id)
+        if data is None:
+            _missing_accounts.set(missing_key, True)
+            raise HttpError(Status.NOT_FOUND, message='Account not found')
+        return JsonResponse(data)
+
+    with db_session(shard_key=user_id) as session:
         account: Account = session.query(Account).filter(Account.id == account_id, Account.user_id == user_id).first()
         if account is None:
+            _missing_accounts.set(missing_key, True)
             raise HttpError(Status.NOT_FOUND, message='Account not found')
 
         if request.method == 'PUT':
-            amount = request.get_arg_or_bad_request('amount')
-            try:
-                float(amount)  # to check if the string value is valid
-                amount = Decimal(amount)
-            except ValueError:
-                raise HttpError(Status.BAD_REQUEST, 'Invalid deposit amount')
-            if amount <= 0:
-                raise HttpError(Status.BAD_REQUEST, 'Invalid deposit amount')
+            amount = _parse_amount(request.get_arg_or_bad_request('amount'), 'Invalid deposit amount')
             account.balance += amount
 
-        return JsonResponse(account.to_dict())
+        data = serialize_accounts(session, [account])[0]
+        response = JsonResponse(data)
+        balance = data['balance']
+
+    if request.method == 'PUT':
+        invalidate_summary(user_id)
+        publish_balance_change(user_id, account_id, balance=balance, change=amount, kind='deposit')
+    return response
 
 
 @allow_methods('POST')
 @requires_auth()
+@retry_transaction()
 def account_transfer(request: Request, account_id) -> JsonResponse:
-    receiver_id = request.get_arg_or_bad_request('receiver')
-    amount = Decimal(request.get_arg_or_bad_request('amount'))
+    receiver_id = _string_arg(request.get_arg_or_bad_request('receiver'), 'Invalid target account')
+    amount = _parse_amount(request.get_arg_or_bad_request('amount'), 'Invalid transfer amount')
 
-    if amount <= 0:
-        raise HttpError(Status.BAD_REQUEST, message='Invalid transfer amount')
+    user_id = get_user_from_request(request).get('id')
+    shard = shard_for(user_id)
+    # Sharded: the source is looked up in the user's shard only, its absence there says nothing to other users
+    source_key = account_id if shard is None else f'{user_id}/{account_id}'
+    if not account_id_filter.might_exist(account_id) or _missing_accounts.get(source_key):
+        raise HttpError(Status.NOT_FOUND, message='Invalid source account')
+    if not account_id_filter.might_exist(receiver_id) or _missing_accounts.get(receiver_id):
+        raise HttpError(Status.BAD_REQUEST, message='Invalid target account')
+
+    if shard is not None:
+        # Source is one of the user's accounts, the receiver may be stored in any shard
+        receiver_shard = account_shard(receiver_id, first=shard)
+        if receiver_shard is None:
+            _missing_accounts.set(receiver_id, True)
+            raise HttpError(Status.BAD_REQUEST, message='Invalid target account')
+        if receiver_shard != shard:
+            return _transfer_between_shards(request, account_id, receiver_id, amount, shard, receiver_shard,
+                                            source_key)
+
+    pessimistic = config.ACCOUNT_TRANSFER_STRATEGY == 'pessimistic'
+    with db_session(shard=shard) as session:
+        if pessimistic:
+            # Both rows stay locked until commit, concurrent transfers wait instead of conflicting
+            locked = _lock_accounts(session, account_id, receiver_id)
+            sender, receiver = locked.get(account_id), locked.get(receiver_id)
+        else:
+            sender = session.query(Account).filter(Account.id == account_id).first()
+            receiver = None
+            if sender is not None:
+                receiver = session.query(Account).filter(Account.id == receiver_id).first()
 
-    with db_session() as session:
-        sender: Account = session.query(Account).filter(Account.id == account_id).first()
         if sender is None:
+            _missing_accounts.set(source_key, True)
             raise HttpError(Status.NOT_FOUND, message='Invalid source account')
 
-        receiver: Account = session.query(Account).filter(Account.id == receiver_id).first()
-        if receiver is None or receiver.balance >= config.ACCOUNT_RECEIVER_MAX_AMOUNT:
+        if receiver is None:
+            _missing_accounts.set(receiver_id, True)
+            raise HttpError(Status.BAD_REQUEST, message='Invalid target account')
+
+        receiver_balance = visible_balance(session, receiver)
+        if receiver_balance >= config.ACCOUNT_RECEIVER_MAX_AMOUNT:
             raise HttpError(Status.BAD_REQUEST, message='Invalid target account')
 
         if receiver.id == sender.id:
             raise HttpError(Status.BAD_REQUEST, message='Can\'t transfer between same accounts')
 
-        if sender.balance < amount:
+        sender_balance = visible_balance(session, sender)
+        if sender_balance < amount:
             raise HttpError(Status.BAD_REQUEST, message='Insufficient funds')
 
-        # State handling to prevent race conditions
-        sender_affected_entries = session.query(Account)\
-            .filter(Account.id == sender.id)\
-            .filter(Account.state == sender.state)\
-            .update({
-                Account.balance: Account.balance - amount,
-                Account.state: Account.state + 1
-            })
+        request.check_deadline()
+        sender_affected_entries = _debit(session, sender, amount, pessimistic)
 
-        # State handling to prevent race conditions
-        receiver_affected_entries = session.query(Account) \
-            .filter(Account.id == receiver.id) \
-            .filter(Account.state == receiver.state) \
-            .update({
+        if receiver.slots:
+            # Hot receiver: credit a random slot, the account row (and its state) is not touched
+            receiver_affected_entries = credit_slot(session, receiver, amount)
+        else:
+            receiver_query = session.query(Account).filter(Account.id == receiver.id)
+            if not pessimistic:
+                # State handling to prevent race conditions
+                receiver_query = receiver_query.filter(Account.state == receiver.state)
+            receiver_affected_entries = receiver_query.update({
                 Account.balance: Account.balance + amount,
                 Account.state: Account.state + 1
             })
@@ -98,10 +340,111 @@ def account_transfer(request: Request, account_id) -> JsonResponse:
             # Exception will cause session rollback
             raise HttpError(Status.CONFLICT)
 
-        _logger.info(f'Successfully transferred {amount} from {account_id} to {receiver_id}')
-        return JsonResponse({
+        _logger.info('Successfully transferred %s from %s to %s', amount, account_id, receiver_id)
+        response = JsonResponse({
             'message': 'success',
             'sender': sender.id,
             'receiver': receiver.id,
             'amount': str(amount)
         })
+        sender_event = (sender.user_id, sender.id, sender_balance - amount, -amount)
+        receiver_event = (receiver.user_id, receiver.id, receiver_balance + amount, amount)
+
+    # Invalidate and notify after commit so concurrent readers can not observe the previous state
+    invalidate_summary(sender_event[0], receiver_event[0])
+    publish_balance_change(*sender_event, kind='transfer')
+    publish_balance_change(*receiver_event, kind='transfer')
+    return response
+
+
+def _debit(session, sender: Account, amount: Decimal, pessimistic: bool) -> int:
+    """ Returns number of affected rows, 0 - the account was modified concurrently (optimistic strategy) """
+    # Hot sender: move credited slots back to the account row before debiting
+    swept = Decimal('0')
+    if sender.slots and sender.balance < amount:
+        swept = sweep_slots(session, sender.id)
+
+    sender_query = session.query(Account).filter(Account.id == sender.id)
+    if not pessimistic:
+        # State handling to prevent race conditions
+        sender_query = sender_query.filter(Account.state == sender.state)
+    return sender_query.update({
+        Account.balance: Account.balance - amount + swept,
+        Account.state: Account.state + 1
+    })
+
+
+def _transfer_between_shards(request: Request, account_id: str, receiver_id: str, amount: Decimal,
+                             shard: int, receiver_shard: int, source_key: str) -> JsonResponse:
+    """
+    Debits the sender and writes the transfer to the outbox of its shard in one transaction,
+    then credits the receiver (see account_app.transfers). If the credit fails it is left to the relay
+    and the response is 202 Accepted.
+    """
+    with db_session(readonly=True, shard=receiver_shard) as session:
+        receiver = session.query(Account).filter(Account.id == receiver_id).first()
+        if receiver is None:
+            _missing_accounts.set(receiver_id, True)
+            raise HttpError(Status.BAD_REQUEST, message='Invalid target account')
+        if visible_balance(session, receiver) >= config.ACCOUNT_RECEIVER_MAX_AMOUNT:
+            raise HttpError(Status.BAD_REQUEST, message='Invalid target account')
+
+    pessimistic = config.ACCOUNT_TRANSFER_STRATEGY == 'pessimistic'
+    with db_session(shard=shard) as session:
+        if pessimistic:
+            sender = _lock_accounts(session, account_id).get(account_id)
+        else:
+            sender = session.query(Account).filter(Account.id == account_id).first()
+        if sender is None:
+            _missing_accounts.set(source_key, True)
+            raise HttpError(Status.NOT_FOUND, message='Invalid source account')
+
+        sender_balance = visible_balance(session, sender)
+        if sender_balance < amount:
+            raise HttpError(Status.BAD_REQUEST, message='Insufficient funds')
+
+        request.check_deadline()
+        if _debit(session, sender, amount, pessimistic) != 1:
+            raise HttpError(Status.CONFLICT)
+        outbox = TransferOutbox(sender.id, receiver_id, amount)
+        session.add(outbox)
+        transfer_id = outbox.id
+        sender_event = (sender.user_id, sender.id, sender_balance - amount, -amount)
+
+    invalidate_summary(sender_event[0])
+    publish_balance_change(*sender_event, kind='transfer')
+
+    # The debit is committed: whatever happens now, the transfer must not be run again (e.g. by retry_transaction)
+    try:
+        state = deliver_transfer(transfer_id, shard)
+    except Exception as err:
+        _logger.warning(f'Transfer {transfer_id} is left to the relay: {err}')
+        state = TransferOutbox.PENDING
+
+    data = {
+        'message': 'success',
+        'sender': account_id,
+        'receiver': receiver_id,
+        'amount': str(amount),
+        'transfer': transfer_id
+    }
+    if state == TransferOutbox.DELIVERED:
+        _logger.info('Successfully transferred %s from %s to %s (shard %s -> %s)',
+                     amount, account_id, receiver_id, shard, receiver_shard)
+        return JsonResponse(data)
+    data['message'] = 'pending'
+    return JsonResponse(data, Status.ACCEPTED)
+
+
+def _lock_accounts(session, *account_ids) -> dict:
+    """
+    Loads and locks accounts (SELECT ... FOR UPDATE) always in sorted id order,
+    so transfers between the same accounts in opposite directions can not deadlock.
+    SQLite has no row locks: the database write lock is taken upfront instead (BEGIN IMMEDIATE).
+    """
+    query = session.query(Account).filter(Account.id.in_(sorted(set(account_ids)))).order_by(Account.id)
+    if session.get_bind().dialect.name == 'sqlite':
+        session.execute('BEGIN IMMEDIATE')
+    else:
+        query = query.with_for_update()
+    return {account.id: account for account in query.all()}
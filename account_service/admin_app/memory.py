@@ -0,0 +1,93 @@
+import threading
+import tracemalloc
+from typing import Optional
+
+
+__all__ = ['MemoryProfiler', 'memory_profiler']
+
+GROUP_BY = ('lineno', 'filename', 'traceback')
+
+# Allocations of the profiler itself and of the import machinery are not interesting
+_IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+def _kb(size: int) -> float:
+    return round(size / 1024, 1)
+
+
+class MemoryProfiler(object):
+    """
+    tracemalloc wrapper: tracing is process-wide, snapshots are compared against a baseline
+    taken by the operator (e.g. after warm up), growth points to allocations that are kept alive.
+    """
+    def __init__(self):
+        self._baseline = None  # type: Optional[tracemalloc.Snapshot]
+        self._lock = threading.Lock()
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = 1):
+        """ Frames - number of stack frames stored per allocation, more frames cost more memory and CPU """
+        with self._lock:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            tracemalloc.start(frames)
+            self._baseline = None
+
+    def stop(self):
+        with self._lock:
+            tracemalloc.stop()
+            self._baseline = None
+
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        if not tracemalloc.is_tracing():
+            raise RuntimeError('Memory tracing is not started')
+        return tracemalloc.take_snapshot().filter_traces(_IGNORED)
+
+    def take_baseline(self):
+        snapshot = self._snapshot()
+        with self._lock:
+            self._baseline = snapshot
+
+    def status(self) -> dict:
+        result = {'tracing': self.tracing, 'baseline': self._baseline is not None}
+        if self.tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            result.update(traced_kb=_kb(current), peak_kb=_kb(peak), frames=tracemalloc.get_traceback_limit())
+        return result
+
+    def top(self, limit: int = 20, group_by: str = 'lineno') -> list:
+        """ Top allocation sites, by growth since the baseline if there is one, otherwise by size """
+        if group_by not in GROUP_BY:
+            raise ValueError(f'group_by should be one of: {", ".join(GROUP_BY)}')
+
+        snapshot = self._snapshot()
+        baseline = self._baseline
+        if baseline is not None:
+            stats = snapshot.compare_to(baseline, group_by)
+        else:
+            stats = snapshot.statistics(group_by)
+
+        result = []
+        for stat in stats[:limit]:
+            item = {
+                'location': str(stat.traceback),
+                'size_kb': _kb(stat.size),
+                'count': stat.count,
+            }
+            if baseline is not None:
+                item.update(size_diff_kb=_kb(stat.size_diff), count_diff=stat.count_diff)
+            if group_by == 'traceback':
+                item['traceback'] = stat.traceback.format()
+            result.append(item)
+        return result
+
+
+memory_profiler = MemoryProfiler()  # type: MemoryProfiler
@@ -0,0 +1,6 @@
+from account_service.utils import Router
+from account_service.admin_app.views import *
+
+router = Router()
+router.add_route('^/memory$', memory_view)
+router.add_route('^/memory/(?P<action>[a-z]+)$', memory_action_view)
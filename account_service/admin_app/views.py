@@ -0,0 +1,54 @@
+import logging
+
+from account_service.utils import Request, JsonResponse, allow_methods, HttpError, Status
+from account_service.auth_app.auth import requires_auth
+from account_service.auth_app.models import Role
+from .memory import memory_profiler, GROUP_BY
+
+__all__ = ['memory_view', 'memory_action_view']
+_logger = logging.getLogger(__name__)
+
+
+# tracemalloc stores at most this many frames per traceback
+_MAX_TRACEBACK_FRAMES = 65535
+
+
+def _int_arg(request: Request, key: str, default: int, min_value: int = 1, max_value: int = None) -> int:
+    try:
+        value = int(request.data.get(key, default))
+    except (TypeError, ValueError):
+        raise HttpError(Status.BAD_REQUEST, message=f'Invalid {key}')
+    if value < min_value or (max_value is not None and value > max_value):
+        bounds = f'between {min_value} and {max_value}' if max_value is not None else f'at least {min_value}'
+        raise HttpError(Status.BAD_REQUEST, message=f'{key} should be {bounds}')
+    return value
+
+
+@allow_methods('GET')
+@requires_auth(allowed_roles=[Role.ADMIN.value])
+def memory_view(request: Request) -> JsonResponse:
+    """ Tracing status and top allocation sites (growth since the baseline if it was taken) """
+    result = memory_profiler.status()
+    if memory_profiler.tracing:
+        group_by = request.data.get('group_by', 'lineno')
+        if group_by not in GROUP_BY:
+            raise HttpError(Status.BAD_REQUEST, message=f'group_by should be one of: {", ".join(GROUP_BY)}')
+        result['top'] = memory_profiler.top(limit=_int_arg(request, 'limit', 20), group_by=group_by)
+    return JsonResponse(result)
+
+
+@allow_methods('POST')
+@requires_auth(allowed_roles=[Role.ADMIN.value])
+def memory_action_view(request: Request, action: str) -> JsonResponse:
+    if action == 'start':
+        memory_profiler.start(frames=_int_arg(request, 'frames', 1, max_value=_MAX_TRACEBACK_FRAMES))
+    elif action == 'baseline':
+        if not memory_profiler.tracing:
+            raise HttpError(Status.CONFLICT, message='Memory tracing is not started')
+        memory_profiler.take_baseline()
+    elif action == 'stop':
+        memory_profiler.stop()
+    else:
+        raise HttpError(Status.NOT_FOUND)
+    _logger.warning(f'Memory tracing action: {action}')
+    return JsonResponse(memory_profiler.status())
@@ -1,8 +1,10 @@
 from typing import List
+import time
 import jwt
 
-from account_service.utils import Request, HttpError, Status
-from account_service.service import config
+from account_service.utils import Request, HttpError, Status, LocalCache, TieredCache, timed
+from account_service.service import config, shared_cache
+from .revocation import revocation_list
 
 
 __all__ = ['AuthError',
@@ -13,6 +15,12 @@ __all__ = ['AuthError',
            'requires_auth']
 
 
+# Decoded and verified token payloads, shared with other worker processes if possible
+_token_cache = TieredCache('jwt',
+                           LocalCache(max_size=config.AUTH_TOKEN_CACHE_SIZE, ttl=config.AUTH_TOKEN_CACHE_SECONDS),
+                           shared=shared_cache)
+
+
 class AuthError(HttpError):
     def __init__(self, message, status_code=Status.UNAUTHORIZED):
         super().__init__(status_code=status_code, message=message)
@@ -36,11 +44,27 @@ def get_auth_token(request: Request, raise_if_none=True):
 
 
 def get_token_payload(token: str):
+    now = time.time()
+    payload = _token_cache.get(token)
+    if payload is not None:
+        if 'exp' in payload and payload['exp'] <= now:
+            raise AuthError('Invalid token: Signature has expired')
+        return payload
+
     try:
-        return jwt.decode(token, config.JWT_SECRET, issuer=config.JWT_ISSUER, algorithms=[config.JWT_ALGORITHM])
+        with timed('jwt'):
+            payload = jwt.decode(token, config.JWT_SECRET, issuer=config.JWT_ISSUER,
+                                 algorithms=[config.JWT_ALGORITHM])
     except jwt.InvalidTokenError as err:
         raise AuthError('Invalid token: {0}'.format(err.args[0]))
 
+    ttl = float(config.AUTH_TOKEN_CACHE_SECONDS)
+    if 'exp' in payload:
+        ttl = min(ttl, payload['exp'] - now)
+    if ttl > 0:
+        _token_cache.set(token, payload, ttl=ttl)
+    return payload
+
 
 def get_user_from_token(token: str=None, kind='access'):
     if not token:
@@ -54,6 +78,10 @@ def get_user_from_token(token: str=None, kind='access'):
         raise AuthError('Invalid token')
     if kind != token_kind:
         raise AuthError('Invalid token')
+
+    jti = token_payload.get('jti', None)
+    if jti and revocation_list.is_revoked(jti):
+        raise AuthError('Token has been revoked')
     return dict(id=user_id, role=role)
 
 
@@ -74,6 +102,7 @@ def requires_auth(permited_roles: List[str]=None, allowed_roles: List[str]=None)
             if allowed_roles is not None and user['role'] not in allowed_roles:
                 raise HttpError(Status.FORBIDDEN)
 
+            request.principal = user['id']
             return fn(request, *args, **kwargs)
         return wrapper
     return decorator
\ No newline at end of file
@@ -0,0 +1,137 @@
+"""
+Bulk import of users from another system (manage.py importusers).
+
+Records are read lazily from a CSV (with a header) or NDJSON file. Fields: `email`, either `password` (hashed here)
+or `password_hash` (bcrypt hash from the old system, stored as is), optional `role` and `id`.
+Passwords are hashed in a process pool sized to the cores, users are inserted with one bulk INSERT per batch.
+
+After every committed batch the number of processed records is saved next to the file (`{path}.progress`),
+an interrupted import continues from there. Emails already present in the database are skipped,
+so records committed just before an interruption are not imported twice.
+"""
+import csv
+import json
+import os
+import time
+from itertools import islice
+from multiprocessing import Pool
+from typing import Iterator, Optional, Callable, List, Tuple
+
+import bcrypt
+import bson
+
+from account_service.service import db_session, config
+from .models import User, Role
+
+
+__all__ = ['read_user_records', 'import_users']
+
+
+def read_user_records(path: str) -> Iterator[dict]:
+    """ Streams records of a .csv or .ndjson (.jsonl) file """
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if path.endswith('.csv'):
+            yield from csv.DictReader(f)
+        elif path.endswith(('.ndjson', '.jsonl')):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            raise ValueError(f'Unknown file format of {path}, .csv or .ndjson expected')
+
+
+def _hash_password(item: tuple) -> Optional[bytes]:
+    """ Runs in pool processes: (record, rounds) -> hash, None for invalid records """
+    record, rounds = item
+    password_hash = (record.get('password_hash') or '').strip()
+    if password_hash:
+        return password_hash.encode('utf-8') if password_hash.startswith('$2') else None
+    password = (record.get('password') or '').strip()
+    if not password:
+        return None
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds))
+
+
+def _read_progress(progress_path: str) -> int:
+    if not os.path.exists(progress_path):
+        return 0
+    with open(progress_path, 'r') as f:
+        return int(json.load(f)['records'])
+
+
+def _write_progress(progress_path: str, records: int):
+    # Replaced atomically, an interruption can not leave a broken file
+    with open(progress_path + '.tmp', 'w') as f:
+        json.dump({'records': records}, f)
+    os.replace(progress_path + '.tmp', progress_path)
+
+
+def _role(record: dict) -> Optional[Role]:
+    try:
+        return Role((record.get('role') or '').strip() or Role.USER.value)
+    except ValueError:
+        return None
+
+
+def _insert_batch(records: List[dict], hashes: List[Optional[bytes]]) -> Tuple[int, int]:
+    """ Returns numbers of imported and skipped records """
+    emails = {(r.get('email') or '').strip() for r in records}
+    with db_session() as session:
+        existing = {email for email, in session.query(User.email).filter(User.email.in_(emails))}
+        rows = []
+        for record, password_hash in zip(records, hashes):
+            email = (record.get('email') or '').strip()
+            role = _role(record)
+            if not email or password_hash is None or role is None or email in existing:
+                continue
+            existing.add(email)  # Duplicates within the file
+            rows.append({
+                'id': (record.get('id') or '').strip() or str(bson.ObjectId()),
+                'email': email,
+                'password': password_hash,
+                'role': role,
+            })
+        if rows:
+            session.execute(User.__table__.insert(), rows)
+    return len(rows), len(records) - len(rows)
+
+
+def import_users(path: str,
+                 batch_size: int = 1000,
+                 workers: int = None,
+                 rounds: int = None,
+                 progress: Callable[[dict], None] = None) -> dict:
+    """
+    Imports users of a file, resuming after the last committed batch of a previous run.
+    Returns (and passes to progress after every batch) statistics:
+    processed records, imported and skipped (invalid or existing) users, elapsed seconds and users per second.
+    """
+    rounds = int(rounds or config.AUTH_BCRYPT_ROUNDS)
+    workers = int(workers or os.cpu_count() or 1)
+    progress_path = f'{path}.progress'
+    resumed_from = _read_progress(progress_path)
+
+    stats = {'processed': resumed_from, 'imported': 0, 'skipped': 0, 'seconds': 0.0, 'rate': 0.0}
+    started = time.monotonic()
+    records = islice(read_user_records(path), resumed_from, None)
+    with Pool(processes=workers) as pool:
+        while True:
+            batch = list(islice(records, batch_size))
+            if not batch:
+                break
+            hashes = pool.map(_hash_password, [(record, rounds) for record in batch],
+                              chunksize=max(1, len(batch) // (workers * 4)))
+            imported, skipped = _insert_batch(batch, hashes)
+            stats['processed'] += len(batch)
+            _write_progress(progress_path, stats['processed'])
+
+            stats['imported'] += imported
+            stats['skipped'] += skipped
+            stats['seconds'] = time.monotonic() - started
+            stats['rate'] = stats['imported'] / stats['seconds'] if stats['seconds'] > 0 else 0.0
+            if progress is not None:
+                progress(stats)
+
+    if os.path.exists(progress_path):
+        os.remove(progress_path)
+    return stats
@@ -5,7 +5,7 @@ from sqlalchemy import Column, Integer, String, Enum, TIMESTAMP, func
 from account_service.models import BaseModel, JsonSerializable
 
 
-__all__ = ['Role', 'User', 'tables']
+__all__ = ['Role', 'User', 'RevokedToken', 'tables']
 
 
 class Role(enum.Enum):
@@ -33,4 +33,17 @@ class User(BaseModel, JsonSerializable):
         return f'<User({self.id} {self.role})>'
 
 
-tables = [User.__table__]
+class RevokedToken(BaseModel):
+    jti = Column(String(255), primary_key=True)
+    expires = Column(TIMESTAMP, nullable=False, index=True)
+    created = Column(TIMESTAMP, server_default=func.now())
+
+    def __init__(self, jti: str, expires):
+        self.jti = jti
+        self.expires = expires
+
+    def __repr__(self):
+        return f'<RevokedToken({self.jti} {self.expires})>'
+
+
+tables = [User.__table__, RevokedToken.__table__]
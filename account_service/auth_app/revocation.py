@@ -0,0 +1,98 @@
+import datetime
+import logging
+import threading
+import time
+
+from account_service.utils import BloomFilter
+from account_service.service import config, db_session
+from .models import RevokedToken
+
+
+__all__ = ['RevocationList', 'revocation_list', 'revoke_token', 'start_revocation_refresh']
+_logger = logging.getLogger(__name__)
+
+
+class RevocationList(object):
+    """
+    Process-local view of the revoked tokens table.
+
+    Bloom filter answers "definitely not revoked" in constant time without locking,
+    possible hits are confirmed against the exact jti -> expiration mapping.
+    """
+    def __init__(self, capacity: int, error_rate: float):
+        self._capacity = int(capacity)
+        self._error_rate = float(error_rate)
+        self._lock = threading.Lock()
+        self._revoked = {}
+        self._bloom = BloomFilter(self._capacity, self._error_rate)
+
+    def __len__(self):
+        return len(self._revoked)
+
+    def configure(self, capacity: int, error_rate: float):
+        with self._lock:
+            self._capacity = int(capacity)
+            self._error_rate = float(error_rate)
+            self._rebuild()
+
+    def add(self, jti: str, expires: datetime.datetime):
+        with self._lock:
+            self._revoked[jti] = expires
+            if len(self._revoked) > self._bloom.capacity:
+                self._rebuild()
+            else:
+                self._bloom.add(jti)
+
+    def is_revoked(self, jti: str) -> bool:
+        if jti not in self._bloom:
+            return False
+        return jti in self._revoked
+
+    def refresh(self):
+        """ Picks up revocations made by other processes and prunes expired entries """
+        now = datetime.datetime.utcnow()
+        with db_session() as session:
+            session.query(RevokedToken).filter(RevokedToken.expires <= now).delete(synchronize_session=False)
+            loaded = session.query(RevokedToken.jti, RevokedToken.expires).filter(RevokedToken.expires > now).all()
+
+        with self._lock:
+            # Keep local revocations that might not be visible to the query yet
+            revoked = {jti: expires for jti, expires in self._revoked.items() if expires > now}
+            revoked.update(loaded)
+            self._revoked = revoked
+            self._rebuild()
+
+    def _rebuild(self):
+        capacity = max(self._capacity, 2 * len(self._revoked))
+        self._bloom = BloomFilter.from_iterable(self._revoked.keys(), capacity, self._error_rate)
+
+
+revocation_list = RevocationList(capacity=config.AUTH_REVOCATION_CAPACITY,
+                                 error_rate=config.AUTH_REVOCATION_ERROR_RATE)  # type: RevocationList
+_refresh_thread = None  # type: threading.Thread
+
+
+def revoke_token(jti: str, expires: datetime.datetime):
+    with db_session() as session:
+        session.merge(RevokedToken(jti=jti, expires=expires))
+    revocation_list.add(jti, expires)
+
+
+def start_revocation_refresh(interval: float):
+    """ Loads revoked tokens and keeps refreshing them in a background thread """
+    global _refresh_thread
+    revocation_list.configure(config.AUTH_REVOCATION_CAPACITY, config.AUTH_REVOCATION_ERROR_RATE)
+    revocation_list.refresh()
+    if _refresh_thread is not None:
+        return
+
+    def _run():
+        while True:
+            time.sleep(interval)
+            try:
+                revocation_list.refresh()
+            except Exception as err:
+                _logger.warning(f'Failed to refresh revoked tokens: {err}')
+
+    _refresh_thread = threading.Thread(target=_run, name='revocation-refresh', daemon=True)
+    _refresh_thread.start()
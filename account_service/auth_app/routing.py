@@ -1,5 +1,6 @@
 from account_service.utils import Router
+from account_service.service import configured_bulkhead
 from account_service.auth_app.views import *
 
 router = Router()
-router.add_route('^/$', auth_view)
+router.add_route('^/$', auth_view, bulkhead=configured_bulkhead('auth'))
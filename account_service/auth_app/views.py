@@ -1,13 +1,15 @@
 import logging
 import datetime
+import uuid
 
 import bcrypt
 import jwt
 
 from account_service.utils import Request, JsonResponse, allow_methods, allow_cors, HttpError, Status
-from account_service.service import config, db_session
+from account_service.service import config, db_session, retry_transaction
 from .models import User, Role
 from .auth import *
+from .revocation import revoke_token
 
 __all__ = ['auth_view']
 _logger = logging.getLogger(__name__)
@@ -21,6 +23,7 @@ def create_user_token(user: User, kind: str, encoding='utf-8', expire_seconds=60
         'iat': iat,
         'exp': exp,
         'iss': config.JWT_ISSUER,
+        'jti': uuid.uuid4().hex,
         config.JWT_USER_ID_CLAIM: user.id,
         config.JWT_ROLE_CLAIM: user.role.value,
         config.JWT_KIND_CLAIM: kind
@@ -47,6 +50,7 @@ def tokens_response(user: User, status_code=200):
 
 @allow_cors()
 @allow_methods('POST', 'PUT', 'DELETE')
+@retry_transaction()
 def auth_view(request: Request) -> JsonResponse:
     if request.method == 'POST':
         # authorize
@@ -55,8 +59,12 @@ def auth_view(request: Request) -> JsonResponse:
             # User is already authorized
             raise HttpError(Status.BAD_REQUEST, message='Already logged in')
 
-        email = request.get_arg_or_bad_request('email').strip()  # type: str
-        pwd_raw = request.get_arg_or_bad_request('password').strip()  # type: str
+        email = request.get_arg_or_bad_request('email')
+        pwd_raw = request.get_arg_or_bad_request('password')
+        # Typed bodies (JSON, msgpack, CBOR) may carry other values
+        if not isinstance(email, str) or not isinstance(pwd_raw, str):
+            raise HttpError(Status.BAD_REQUEST, message='Email and password should be strings')
+        email, pwd_raw = email.strip(), pwd_raw.strip()
 
         with db_session() as session:
             existing_user = session.query(User).filter(User.email == email).first()
@@ -67,7 +75,7 @@ def auth_view(request: Request) -> JsonResponse:
                                            salt=bcrypt.gensalt(config.AUTH_BCRYPT_ROUNDS))
                 user = User(email=email, role=Role.USER, encrypted_password=pwd_hashed)
                 session.add(user)
-                _logger.info(f'Created new user: {user}')
+                _logger.info('Created new user: %s', user.id)
 
                 # Issue new tokens
                 return tokens_response(user, Status.CREATED)
@@ -77,12 +85,21 @@ def auth_view(request: Request) -> JsonResponse:
                 # Issue new tokens
                 return tokens_response(existing_user, status_code=Status.OK)
 
-            _logger.info(f'Invalid authentication attempt: {user}')
+            _logger.info('Invalid authentication attempt: %s', email)
             raise HttpError(Status.BAD_REQUEST)
 
     if request.method == 'DELETE':
-        # Logout
-        raise HttpError(Status.NOT_IMPLEMENTED)
+        # Logout: revoke the token used to authorize this request
+        token = get_auth_token(request)
+        get_user_from_token(token)  # Rejects invalid and already revoked tokens
+        payload = get_token_payload(token)
+        jti = payload.get('jti', None)
+        if not jti or 'exp' not in payload:
+            raise HttpError(Status.BAD_REQUEST, message='Token can not be revoked')
+
+        revoke_token(jti, expires=datetime.datetime.utcfromtimestamp(payload['exp']))
+        _logger.info('Revoked token: %s', jti)
+        return JsonResponse({'message': 'success'})
 
     if request.method == 'PUT':
         # Refresh tokens
@@ -8,6 +8,157 @@ def create_tables(*args):
     srv.create_tables()
 
 
+def hot_account(account_id: str, slots: str = None, *args):
+    """ Enables hot mode of an account (splits its incoming balance over slots), 0 slots disables it """
+    srv.configure()
+    from account_service.account_app.models import Account
+    from account_service.account_app.slots import set_hot_slots
+
+    slots = int(slots) if slots is not None else int(srv.config.ACCOUNT_HOT_SLOTS)
+    shard = None
+    if srv.config.DATABASE_SHARD_URIS:
+        from account_service.account_app.transfers import account_shard
+        shard = account_shard(account_id)
+        if shard is None:
+            print(f'Account {account_id} does not exist')
+            exit(1)
+    with srv.db_session(shard=shard) as session:
+        account = session.query(Account).filter(Account.id == account_id).first()
+        if account is None:
+            print(f'Account {account_id} does not exist')
+            exit(1)
+        set_hot_slots(session, account, slots)
+    print(f'Account {account_id} now has {slots} balance slots')
+
+
+def rebalance(batch_size: str = '500', *args):
+    """
+    Moves accounts to their shards after DATABASE_SHARD_URIS has changed (shards can be added, not removed),
+    including accounts of DATABASE_URI when sharding is enabled.
+    Stop the service first: account updates made while an account is moved are lost
+    """
+    srv.configure()
+    from account_service.account_app.rebalance import rebalance_accounts
+
+    moved = rebalance_accounts(batch_size=int(batch_size))
+    for (source, target), count in sorted(moved.items(), key=lambda item: (item[0][0] is not None, item[0])):
+        print(f'{"DATABASE_URI" if source is None else f"Shard {source}"} -> {target}: {count} accounts')
+    print(f'Moved {sum(moved.values())} accounts')
+
+
+def import_users(path: str, batch_size: str = '1000', workers: str = None, *args):
+    """ Imports users from a .csv or .ndjson file, an interrupted import resumes where it stopped """
+    srv.configure()
+    from account_service.auth_app.importer import import_users as _import_users
+
+    def _progress(stats: dict):
+        print(f'\r{stats["processed"]} records: {stats["imported"]} imported, {stats["skipped"]} skipped, '
+              f'{stats["rate"]:.0f} users/s', end='', flush=True)
+
+    stats = _import_users(path, batch_size=int(batch_size), workers=int(workers) if workers else None,
+                          progress=_progress)
+    print(f'\nDone in {stats["seconds"]:.1f}s')
+
+
+def seed(users: str = '100000', accounts: str = '1000000', seed_value: str = '0', skew: str = '3', hot: str = '10',
+         base_time: str = None, *args):
+    """ Fills the database with a synthetic dataset (see account_service.seed) """
+    srv.configure()
+    from account_service.seed import seed_dataset, SEED_PASSWORD
+
+    def _progress(stats: dict):
+        print(f'\r{stats["users"]} users, {stats["accounts"]} accounts, {stats["rate"]:.0f} rows/s', end='', flush=True)
+
+    stats = seed_dataset(int(users), int(accounts), seed=int(seed_value), skew=float(skew), hot=int(hot),
+                         base_time=int(base_time) if base_time else None, progress=_progress)
+    print(f'\nDone in {stats["seconds"]:.1f}s, users: seed{seed_value}-user{{n}}@example.com / {SEED_PASSWORD}')
+    print(f'Hot accounts: {" ".join(stats["hot"])}')
+    print(f'Base time: {stats["base_time"]}')
+
+
+def _wsgi_request(method: str, path: str, token: str, data: dict = None) -> int:
+    """ Calls the application in-process, returns the status code """
+    import io
+    from urllib.parse import urlencode
+    from account_service.wsgi import application_handler
+
+    body = urlencode(data).encode('ascii') if data else b''
+    env = {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'QUERY_STRING': '',
+        'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+        'CONTENT_LENGTH': str(len(body)),
+        'HTTP_AUTHORIZATION': f'Bearer {token}',
+        'wsgi.input': io.BytesIO(body),
+    }
+    status = []
+    iterable = application_handler(env, lambda s, headers, exc_info=None: status.append(int(s.split(' ', 1)[0])))
+    try:
+        b''.join(iterable)
+    finally:
+        iterable.close()
+    return status[0]
+
+
+def mem_profile(requests: str = '2000', top: str = '15', frames: str = '1', *args):
+    """
+    Runs a synthetic request loop (against a temporary SQLite database)
+    and reports heap growth by allocation site after a warm up
+    """
+    import gc
+    import os
+    import tempfile
+
+    fd, path = tempfile.mkstemp(prefix='account_service_memprofile_', suffix='.db')
+    os.close(fd)
+    os.environ['DATABASE_URI'] = f'sqlite:///{path}'
+    os.environ.setdefault('LOG_LEVEL', 'CRITICAL')
+    srv.configure()
+
+    from account_service.auth_app.models import User, Role
+    from account_service.auth_app.views import create_access_token
+    from account_service.admin_app.memory import MemoryProfiler
+
+    user = User(email='memprofile@localhost', role=Role.USER, encrypted_password='')
+    user.id = 'memprofile'
+    token = create_access_token(user)
+
+    def _loop(iterations: int):
+        for _ in range(iterations):
+            _wsgi_request('GET', f'/accounts/{account_id}', token)
+            _wsgi_request('PUT', f'/accounts/{account_id}', token, {'amount': '1'})
+            _wsgi_request('GET', '/accounts', token)
+            _wsgi_request('GET', '/accounts/summary', token)
+            _wsgi_request('GET', '/accounts/unknown', token)
+
+    try:
+        _wsgi_request('POST', '/accounts', token)
+        from account_service.account_app.models import Account
+        with srv.db_session(shard_key=user.id) as session:
+            account_id = session.query(Account.id).filter(Account.user_id == user.id).scalar()
+
+        requests = int(requests)
+        profiler = MemoryProfiler()
+        profiler.start(frames=int(frames))
+        _loop(max(1, requests // 10))  # Warm up: caches, pools, compiled statements
+        gc.collect()
+        profiler.take_baseline()
+        baseline_kb = profiler.status()['traced_kb']
+
+        _loop(requests)
+        gc.collect()
+        status = profiler.status()
+        growth = status['traced_kb'] - baseline_kb
+        print(f'{requests} iterations ({requests * 5} requests): traced {baseline_kb} KiB -> {status["traced_kb"]} KiB '
+              f'({growth:+.1f} KiB, {growth * 1024 / (requests * 5):+.1f} bytes/request)')
+        for item in profiler.top(limit=int(top)):
+            print(f'{item["size_diff_kb"]:+10.1f} KiB {item["count_diff"]:+8d} blocks  {item["location"]}')
+        profiler.stop()
+    finally:
+        os.remove(path)
+
+
 def runtests(*args):
     import pytest
     import os
@@ -26,7 +177,17 @@ if __name__ == '__main__':
 
     if command == 'createtables':
         create_tables(*args)
-    if command == 'runtests':
+    elif command == 'hotaccount':
+        hot_account(*args)
+    elif command == 'rebalance':
+        rebalance(*args)
+    elif command == 'importusers':
+        import_users(*args)
+    elif command == 'seed':
+        seed(*args)
+    elif command == 'memprofile':
+        mem_profile(*args)
+    elif command == 'runtests':
         runtests(*args)
     else:
         print(f'Unknown command: {command}')
@@ -0,0 +1,85 @@
+import itertools
+import logging
+import threading
+import time
+from typing import List, Optional
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+
+
+__all__ = ['Replica', 'ReplicaSet', 'start_health_checks']
+_logger = logging.getLogger(__name__)
+
+
+class Replica(object):
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.session_factory = sessionmaker(bind=engine)
+        self.healthy = True
+
+    @property
+    def name(self) -> str:
+        # Without password
+        return repr(self.engine.url)
+
+    def __repr__(self):
+        return f'<Replica({self.name} {"healthy" if self.healthy else "unhealthy"})>'
+
+
+class ReplicaSet(object):
+    """
+    Read replicas, load-balanced round-robin among the healthy ones.
+    Replicas failing a health check (or a query with a connection error) are skipped until they pass one.
+    """
+    def __init__(self, engines: List[Engine]):
+        self.replicas = [Replica(engine) for engine in engines]
+        self._counter = itertools.count()
+
+    def pick(self) -> Optional[Replica]:
+        """ Next healthy replica, None if there is none """
+        healthy = [r for r in self.replicas if r.healthy]
+        if not healthy:
+            return None
+        return healthy[next(self._counter) % len(healthy)]
+
+    def mark_unhealthy(self, replica: Replica, error: Exception):
+        if replica.healthy:
+            _logger.warning(f'Replica {replica.name} is unhealthy: {error}')
+        replica.healthy = False
+
+    def check(self):
+        for replica in self.replicas:
+            try:
+                with replica.engine.connect() as connection:
+                    connection.execute('SELECT 1')
+            except Exception as err:
+                self.mark_unhealthy(replica, err)
+            else:
+                if not replica.healthy:
+                    _logger.info(f'Replica {replica.name} is healthy again')
+                replica.healthy = True
+
+    def dispose(self):
+        for replica in self.replicas:
+            replica.engine.dispose()
+
+
+_check_thread = None  # type: threading.Thread
+
+
+def start_health_checks(get_replicas, interval: float):
+    """ Checks replicas (resolved with a callable, they are replaced on reconfiguration) in a background thread """
+    global _check_thread
+    if _check_thread is not None:
+        return
+
+    def _run():
+        while True:
+            time.sleep(interval)
+            replicas = get_replicas()
+            if replicas is not None:
+                replicas.check()
+
+    _check_thread = threading.Thread(target=_run, name='replica-health-check', daemon=True)
+    _check_thread.start()
@@ -0,0 +1,213 @@
+"""
+Synthetic datasets for benchmarks (manage.py seed).
+
+The same seed and base time always produce the same users, accounts and balances. Distributions are skewed like real traffic:
+owners of accounts follow a power law (a few users have thousands of accounts, most have one or none),
+balances follow a Pareto distribution and a few accounts are hot receivers with balance slots.
+Ids are ObjectId-style (creation time, per-seed "machine" bytes, counter), computed from the row index,
+so they are unique, ordered by creation and never have to be kept in memory.
+The creation time of the first row (base time) defaults to the start of the run: a running service lets ids newer
+than its account filter scan through to the database, so seeded accounts are found without a restart.
+
+Rows are inserted with one executemany per batch (straight through the DBAPI cursor on SQLite) while the next
+batch is generated in a thread. Secondary indexes of empty tables are dropped for the load and built once at the end.
+Seed an empty database, or use another seed to add more rows.
+"""
+import random
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Iterator, Callable, Optional, List
+
+from sqlalchemy import select
+
+import bcrypt
+
+from .service import config, db_session, shard_for, shard_indexes
+from .account_app.models import Account, AccountSlot
+from .auth_app.models import User
+
+
+__all__ = ['SEED_PASSWORD', 'user_id', 'iter_users', 'iter_accounts', 'seed_dataset']
+
+SEED_PASSWORD = 'password'  # Password of every generated user
+_ROWS_PER_SECOND = 1000  # Rows "created" per second of ObjectId time
+
+
+def _object_id(machine: int, index: int, base_time: int) -> str:
+    return f'{base_time + index // _ROWS_PER_SECOND:08x}{machine:010x}{index & 0xffffff:06x}'
+
+
+def _object_ids(machine: int, count: int, base_time: int) -> Iterator[str]:
+    """ Same as _object_id for indexes 0 .. count - 1, the timestamp is formatted once per second """
+    machine = f'{machine:010x}'
+    for second in range(0, count, _ROWS_PER_SECOND):
+        prefix = f'{base_time + second // _ROWS_PER_SECOND:08x}{machine}'
+        for index in range(second, min(count, second + _ROWS_PER_SECOND)):
+            yield f'{prefix}{index & 0xffffff:06x}'
+
+
+def _machine(seed: int, kind: str) -> int:
+    return random.Random(f'{seed}:{kind}').getrandbits(40)
+
+
+def user_id(seed: int, index: int, base_time: int) -> str:
+    return _object_id(_machine(seed, 'user'), index, base_time)
+
+
+def iter_users(seed: int, count: int, password_hash: bytes, base_time: int) -> Iterator[tuple]:
+    """ (id, email, password, role) """
+    for index, id in enumerate(_object_ids(_machine(seed, 'user'), count, base_time)):
+        yield id, f'seed{seed}-user{index}@example.com', password_hash, 'USER'
+
+
+def iter_accounts(seed: int, count: int, users: int, base_time: int, skew: float = 3.0,
+                  hot: int = 10) -> Iterator[tuple]:
+    """
+    (id, user_id, balance, state, slots), balance is a decimal string.
+    Owner of an account is user int(users * u ** skew) for uniform u: skew 1 is uniform, larger values
+    concentrate accounts on the first users.
+    """
+    rng = random.Random(seed)
+    uniform = rng.random
+    hot_accounts = set(rng.sample(range(count), min(hot, count)))
+    hot_slots = int(config.ACCOUNT_HOT_SLOTS)
+    # Owner ids as in _object_id, timestamp and machine parts are formatted once per second
+    user_machine = f'{_machine(seed, "user"):010x}'
+    owner_prefixes = [f'{base_time + second:08x}{user_machine}' for second in range(users // _ROWS_PER_SECOND + 1)]
+    last_owner = users - 1
+    exponent = 1 / 1.2  # Pareto distribution (alpha 1.2) of cents, as random.paretovariate
+    for index, id in enumerate(_object_ids(_machine(seed, 'account'), count, base_time)):
+        owner = min(last_owner, int(users * uniform() ** skew))
+        cents = min(int(1000 / (1.0 - uniform()) ** exponent), 10 ** 10)
+        yield (id,
+               '%s%06x' % (owner_prefixes[owner // _ROWS_PER_SECOND], owner & 0xffffff),
+               '%d.%02d' % divmod(cents, 100),
+               0,
+               hot_slots if index in hot_accounts else 0)
+
+
+def _bulk_insert(session, table, columns: List[str], rows: List[tuple]):
+    connection = session.connection()
+    if connection.dialect.name == 'sqlite':
+        # No per-row parameter processing, sqlite3 binds the tuples as they are
+        statement = str(table.insert().compile(dialect=connection.dialect, column_keys=columns))
+        connection.connection.executemany(statement, rows)
+    else:
+        connection.execute(table.insert(), [dict(zip(columns, row)) for row in rows])
+
+
+def _fast_sqlite(session):
+    # Durability is not needed for a dataset that can be regenerated. The settings are per connection,
+    # previous values are restored when the connection goes back to the pool (see service._reset_connection_settings)
+    connection = session.connection()
+    if connection.dialect.name == 'sqlite':
+        pragmas = connection.info.setdefault('sqlite_pragmas', {})
+        for name, value in (('synchronous', 'OFF'), ('journal_mode', 'MEMORY')):
+            pragmas.setdefault(name, connection.execute(f'PRAGMA {name}').scalar())
+            connection.execute(f'PRAGMA {name} = {value}')
+
+
+def _batches(rows: Iterator[tuple], batch_size: int) -> Iterator[List[tuple]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _prefetched(batches: Iterator[List[tuple]]) -> Iterator[List[tuple]]:
+    """ Generates the next batch while the current one is inserted (drivers release the GIL while executing) """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(next, batches, None)
+        while True:
+            batch = future.result()
+            if batch is None:
+                return
+            future = executor.submit(next, batches, None)
+            yield batch
+
+
+@contextmanager
+def _deferred_indexes(table, shards: List[Optional[int]]):
+    """ Non-unique indexes of an empty table are built once after the load instead of updated for every row """
+    dropped = []
+    for shard in shards:
+        with db_session(shard=shard) as session:
+            connection = session.connection()
+            if connection.execute(select([table]).limit(1)).first() is not None:
+                continue
+            for index in table.indexes:
+                if not index.unique:
+                    index.drop(bind=connection)
+                    dropped.append((shard, index))
+    try:
+        yield
+    finally:
+        for shard, index in dropped:
+            with db_session(shard=shard) as session:
+                index.create(bind=session.connection())
+
+
+_USER_COLUMNS = ['id', 'email', 'password', 'role']
+_ACCOUNT_COLUMNS = ['id', 'user_id', 'balance', 'state', 'slots']
+_SLOT_COLUMNS = ['account_id', 'slot', 'balance']
+
+
+def seed_dataset(users: int,
+                 accounts: int,
+                 seed: int = 0,
+                 skew: float = 3.0,
+                 hot: int = 10,
+                 batch_size: int = 50000,
+                 base_time: Optional[int] = None,
+                 progress: Optional[Callable[[dict], None]] = None) -> dict:
+    """
+    Generates users (in DATABASE_URI) and their accounts (in the shards of their owners if sharded).
+    Returns (and passes to progress after every batch) statistics:
+    inserted users, accounts and slots, elapsed seconds, rows per second, ids of hot accounts and the base time
+    (current unix time if not given).
+    """
+    base_time = int(time.time()) if base_time is None else int(base_time)
+    stats = {'users': 0, 'accounts': 0, 'slots': 0, 'seconds': 0.0, 'rate': 0.0, 'hot': [], 'base_time': base_time}
+    started = time.monotonic()
+
+    def _report():
+        stats['seconds'] = time.monotonic() - started
+        rows = stats['users'] + stats['accounts'] + stats['slots']
+        stats['rate'] = rows / stats['seconds'] if stats['seconds'] > 0 else 0.0
+        if progress is not None:
+            progress(stats)
+
+    # One hash for everybody, hashing millions of passwords would take hours
+    password_hash = bcrypt.hashpw(SEED_PASSWORD.encode('utf-8'), bcrypt.gensalt(int(config.AUTH_BCRYPT_ROUNDS)))
+    for batch in _prefetched(_batches(iter_users(seed, users, password_hash, base_time), batch_size)):
+        with db_session() as session:
+            _fast_sqlite(session)
+            _bulk_insert(session, User.__table__, _USER_COLUMNS, batch)
+        stats['users'] += len(batch)
+        _report()
+
+    with _deferred_indexes(Account.__table__, shard_indexes()):
+        rows = iter_accounts(seed, accounts, users, base_time, skew=skew, hot=hot)
+        for batch in _prefetched(_batches(rows, batch_size)):
+            by_shard = defaultdict(list)
+            for row in batch:
+                by_shard[shard_for(row[1])].append(row)
+            for shard, rows in by_shard.items():
+                slots = [(row[0], slot, '0') for row in rows if row[4] for slot in range(row[4])]
+                with db_session(shard=shard) as session:
+                    _fast_sqlite(session)
+                    _bulk_insert(session, Account.__table__, _ACCOUNT_COLUMNS, rows)
+                    if slots:
+                        _bulk_insert(session, AccountSlot.__table__, _SLOT_COLUMNS, slots)
+                stats['slots'] += len(slots)
+            stats['accounts'] += len(batch)
+            stats['hot'].extend(row[0] for row in batch if row[4])
+            _report()
+    stats['seconds'] = time.monotonic() - started  # Including index builds
+    return stats
@@ -1,13 +1,21 @@
 import logging
-from typing import Optional
+import time
+import functools
+from typing import Optional, List
 from contextlib import contextmanager
 
 from sqlalchemy.orm import sessionmaker, scoped_session
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import DBAPIError, OperationalError
 
-from .utils import Config, Router
+from .utils import Config, Router, RetryPolicy, HttpError, Status, metrics, get_current_request, SharedCache, timed, \
+    Bulkhead, LocalCache, TieredCache, setup_logging
+from .replicas import ReplicaSet, start_health_checks
+from .sharding import shard_index
 
-__all__ = ['config', 'configure', 'db_session', 'router', 'create_tables']
+__all__ = ['config', 'configure', 'db_session', 'router', 'create_tables',
+           'is_transient_db_error', 'retry_transaction', 'shared_cache', 'configured_bulkhead',
+           'shard_for', 'shard_indexes', 'served_by_replica']
 _logger = logging.getLogger(__name__)
 
 
@@ -17,16 +25,86 @@ class ServiceConfig(Config):
     """
     DEBUG = True
     DATABASE_URI = 'sqlite:///database.db'
+    # Comma separated URIs of read replicas used by db_session(readonly=True), empty - all reads go to the primary
+    DATABASE_REPLICA_URIS = ''
+    DB_REPLICA_CHECK_SECONDS = 5  # Health check interval
+    DB_READ_YOUR_WRITES_SECONDS = 5  # Reads of a user go to the primary for this long after the user's write
+    # Comma separated URIs of account shards, accounts are placed by a hash of user id.
+    # Empty - accounts are stored in DATABASE_URI. Users and tokens are always stored in DATABASE_URI.
+    # Changing the list requires `manage.py rebalance`
+    DATABASE_SHARD_URIS = ''
 
     # Logging
-    LOG_LEVEL = logging.DEBUG
+    LOG_LEVEL = logging.INFO
+    # Records are written by a background thread, request threads drop records when this many are waiting.
+    # 0 - records are written synchronously
+    LOG_QUEUE_SIZE = 10000
+
+    # Cache shared by worker processes of a host (memory-mapped file, e.g. /dev/shm/account_service.cache)
+    # Empty path disables it
+    SHARED_CACHE_PATH = ''
+    SHARED_CACHE_SLOTS = 65536
+    SHARED_CACHE_SLOT_SIZE = 512
+    SHARED_CACHE_STRIPES = 64
+
+    # Requests
+    REQUEST_TIMEOUT_SECONDS = 30  # Default deadline of a request, clients may shorten it with X-Request-Timeout
+    # Phase timings (routing, parsing, JWT, database sessions, encoding) of each request
+    SERVER_TIMING_ENABLED = False  # Server-Timing response header
+    ACCESS_LOG_ENABLED = False  # JSON line per request in 'account_service.access' logger
+
+    # Bulkheads: concurrent and queued requests per class of traffic (0 concurrency disables the bulkhead),
+    # requests beyond are rejected with 503. Totals should stay below the number of server threads
+    BULKHEAD_QUEUE_TIMEOUT_SECONDS = 1
+    BULKHEAD_AUTH_CONCURRENCY = 4  # bcrypt
+    BULKHEAD_AUTH_QUEUE = 4
+    BULKHEAD_TRANSFER_CONCURRENCY = 6
+    BULKHEAD_TRANSFER_QUEUE = 6
+    BULKHEAD_STREAM_CONCURRENCY = 4  # Event streams and exports hold a thread while they are sent
+    BULKHEAD_STREAM_QUEUE = 0
+
+    # Gzip response compression (if accepted by the client)
+    RESPONSE_COMPRESSION_ENABLED = True
+    RESPONSE_COMPRESSION_MIN_SIZE = 1024  # Smaller bodies are not worth compressing
+    RESPONSE_COMPRESSION_LEVEL = 1  # Fastest, most of the gain for JSON
 
     # Account settings
     ACCOUNT_RECEIVER_MAX_AMOUNT = 100000
+    ACCOUNT_HOT_SLOTS = 8  # Default number of balance slots for "hot" accounts
+    # Transfer concurrency control:
+    #   optimistic - rows are checked with Account.state, concurrent modification fails with 409 Conflict
+    #   pessimistic - rows are locked (SELECT ... FOR UPDATE, BEGIN IMMEDIATE on SQLite), transfers wait
+    ACCOUNT_TRANSFER_STRATEGY = 'optimistic'
+    ACCOUNT_TRANSFER_TIMEOUT_SECONDS = 10
+    ACCOUNT_TRANSFER_RELAY_SECONDS = 5  # Retry interval of undelivered cross-shard transfers
+    ACCOUNT_MULTI_GET_MAX_IDS = 100
+    ACCOUNT_CREATE_MAX_COUNT = 100
+    ACCOUNT_EXPORT_BATCH_SIZE = 1000  # Rows fetched from the database cursor at once
+    ACCOUNT_EXPORT_CHUNK_SIZE = 64 * 1024  # Bytes per response chunk
+    ACCOUNT_SUMMARY_CACHE_SECONDS = 30
+    ACCOUNT_SUMMARY_CACHE_SIZE = 10000
+    ACCOUNT_STREAM_HEARTBEAT_SECONDS = 15
+    ACCOUNT_STREAM_BUFFER_SIZE = 64
+    ACCOUNT_STREAM_MAX_SECONDS = 60 * 10
+    ACCOUNT_NEGATIVE_CACHE_SECONDS = 60  # How long unknown account ids are remembered
+    ACCOUNT_NEGATIVE_CACHE_SIZE = 10000
+    # Bloom filter of existing account ids, rejects lookups of unknown ids without a database query
+    ACCOUNT_BLOOM_ENABLED = False
+    ACCOUNT_BLOOM_CAPACITY = 1000000
+    ACCOUNT_BLOOM_ERROR_RATE = 0.01
+    ACCOUNT_BLOOM_REFRESH_SECONDS = 30
+
+    # Admin endpoints (/admin), available to users with the admin role only
+    ADMIN_ENABLED = True
 
     # Auth and security settings
     AUTH_USE_INTERNAL = True
     AUTH_BCRYPT_ROUNDS = 10
+    AUTH_REVOCATION_REFRESH_SECONDS = 5
+    AUTH_REVOCATION_CAPACITY = 100000
+    AUTH_REVOCATION_ERROR_RATE = 0.001
+    AUTH_TOKEN_CACHE_SECONDS = 300  # Decoded JWT cache, entries never outlive token expiration
+    AUTH_TOKEN_CACHE_SIZE = 10000
 
     # JWT
     JWT_SECRET = 'CHANGE_ME'
@@ -39,25 +117,287 @@ class ServiceConfig(Config):
     JWT_REFRESH_EXPIRATION_SECONDS = 60 * 60 * 24 * 30  # 30-days token
     JWT_EMAIL_CONFIRMATION_SECONDS = 60 * 60 * 24 * 30  # 30-days token
 
+    # Retries of transactions failed due to transient database errors
+    DB_RETRY_ATTEMPTS = 3
+    DB_RETRY_BASE_DELAY = 0.02
+    DB_RETRY_MAX_DELAY = 0.5
+    DB_RETRY_MAX_SECONDS = 5
+
+    # Query instrumentation
+    DB_SLOW_QUERY_SECONDS = 0.5  # Statements taking longer are logged (with redacted parameters)
+    DB_QUERY_BUDGET = 20  # Warn about requests executing more statements
+    DB_REPEATED_QUERY_THRESHOLD = 10  # Warn about the same statement executed this many times (N+1 queries)
+
 
 config = ServiceConfig()  # type: ServiceConfig
 _Session = None  # type: callable()
+_shared_cache = None  # type: Optional[SharedCache]
+_replicas = None  # type: Optional[ReplicaSet]
+_shard_engines = []  # type: list
+_shards = []  # type: List[scoped_session]
 router = Router()
 
 
+def shared_cache() -> Optional[SharedCache]:
+    """ Cache shared by worker processes or None if it is not configured """
+    return _shared_cache
+
+
+# Users who have written recently (read-your-writes): user id -> wall clock time until which their reads go
+# to the primary. Shared by the worker processes if possible, then read from the shared cache only:
+# a local copy would hide a newer write of the user made through another worker
+_recent_writers = TieredCache('recent-writers', LocalCache(max_size=100000), shared=shared_cache, local_copies=False)
+
+
+def shard_for(key: str) -> Optional[int]:
+    """ Shard of account data of a user (key is the user id), None if accounts are not sharded """
+    if not _shards:
+        return None
+    return shard_index(key, len(_shards))
+
+
+def shard_indexes() -> List[Optional[int]]:
+    """ Values of db_session(shard=...) covering all account data, [None] if accounts are not sharded """
+    return list(range(len(_shards))) or [None]
+
+
 @contextmanager
-def db_session():
-    """Provide a transactional scope around a series of operations."""
-    session = _Session()
-    try:
-        yield session
-        session.commit()
-    except Exception as e:
-        _logger.warning(f'Reverting database transaction due to exception: {e}')
-        session.rollback()
-        raise e
-    finally:
-        session.close()
+def db_session(readonly: bool = False, shard_key: str = None, shard: int = None):
+    """
+    Provide a transactional scope around a series of operations.
+    Within a request with a deadline, statements are bounded by the time left.
+
+    :param readonly: session for reads only, served by a replica if there are any,
+        except for users who have written within DB_READ_YOUR_WRITES_SECONDS. Nothing is committed.
+    :param shard_key: user id, the session is bound to the shard of the user's accounts.
+        Ignored if accounts are not sharded.
+    :param shard: shard index (see shard_indexes), when the owner of the data is not known
+    """
+    request = get_current_request()
+    if request is not None:
+        request.check_deadline()
+
+    if shard is None and shard_key is not None:
+        shard = shard_for(shard_key)
+    # Replicas are set up for the main database only
+    replica = _pick_replica(request) if readonly and shard is None else None
+    with timed('db'):
+        if shard is not None:
+            session = _shards[shard]()
+        elif replica is not None:
+            session = replica.session_factory()
+            session.info['replica'] = replica.name
+        else:
+            session = _Session()
+        try:
+            if request is not None and request.deadline is not None:
+                _set_statement_timeout(session, request.remaining())
+            yield session
+            if not readonly:
+                if request is not None:
+                    request.check_deadline()
+                session.commit()
+                _remember_write(request)
+        except Exception as e:
+            _logger.warning('Reverting database transaction due to exception: %s', e)
+            session.rollback()
+            if replica is not None and isinstance(e, OperationalError):
+                _replicas.mark_unhealthy(replica, e)
+            if request is not None and not isinstance(e, HttpError):
+                # Statement cancelled or lock wait interrupted because the time is up
+                request.check_deadline()
+            raise e
+        finally:
+            # Connection goes back to the pool
+            session.close()
+
+
+def served_by_replica(session) -> bool:
+    """ Whether a db_session was served by a replica, which may lag behind the primary """
+    return 'replica' in session.info
+
+
+def _pick_replica(request):
+    if _replicas is None:
+        return None
+    if request is not None and request.principal is not None and \
+            _recent_writers.get(request.principal, 0) > time.time():
+        # Replicas may lag behind, the user should see own changes
+        return None
+    return _replicas.pick()
+
+
+def _remember_write(request):
+    window = float(config.DB_READ_YOUR_WRITES_SECONDS)
+    if _replicas is None or window <= 0 or request is None or request.principal is None:
+        return
+    if request.method not in ('GET', 'HEAD'):
+        _recent_writers.set(request.principal, time.time() + window, ttl=window)
+
+
+def _set_statement_timeout(session, seconds: float):
+    connection = session.connection()
+    milliseconds = max(1, int(seconds * 1000))
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        # No statement timeout in SQLite, but waiting for locks can be bounded
+        connection.execute(f'PRAGMA busy_timeout = {milliseconds}')
+        connection.info['busy_timeout_changed'] = True
+    elif dialect == 'postgresql':
+        # Applies to the current transaction only
+        connection.execute(f'SET LOCAL statement_timeout = {milliseconds}')
+    elif dialect == 'mysql':
+        connection.execute(f'SET SESSION max_execution_time = {milliseconds}')
+        connection.info['max_execution_time_changed'] = True
+
+
+def _reset_connection_settings(dbapi_connection, connection_record):
+    """
+    Pool checkin hook: connection-wide settings changed for a request (timeouts) or a bulk load (SQLite durability)
+    should not leak to the next user
+    """
+    for name, value in connection_record.info.pop('sqlite_pragmas', {}).items():
+        dbapi_connection.execute(f'PRAGMA {name} = {value}')
+    if connection_record.info.pop('busy_timeout_changed', False):
+        dbapi_connection.execute('PRAGMA busy_timeout = 5000')  # sqlite3 module default
+    if connection_record.info.pop('max_execution_time_changed', False):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('SET SESSION max_execution_time = DEFAULT')
+        cursor.close()
+
+
+def _redact(parameters, executemany: bool = False):
+    """ Parameter values are replaced with their types, they may contain personal data """
+    if executemany:
+        return f'<{len(parameters)} parameter sets>'
+    if isinstance(parameters, dict):
+        return {k: type(v).__name__ for k, v in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(v).__name__ for v in parameters]
+    return type(parameters).__name__
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _handle_error(exception_context):
+    # Failed statements do not reach after_cursor_execute
+    connection = exception_context.connection
+    if connection is not None and exception_context.cursor is not None and connection.info.get('query_started'):
+        connection.info['query_started'].pop()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """ Attributes the statement to the current request, logs slow and excessive queries """
+    duration = time.perf_counter() - conn.info['query_started'].pop()
+    metrics.incr('db.queries')
+    metrics.incr('db.query_seconds', duration)
+    if duration >= float(config.DB_SLOW_QUERY_SECONDS):
+        metrics.incr('db.slow_queries')
+        _logger.warning(f'Slow query ({duration * 1000:.1f} ms): {statement} '
+                        f'parameters={_redact(parameters, executemany)}')
+
+    request = get_current_request()
+    if request is None:
+        return
+    stats = request.query_stats
+    executions = stats.add(statement, duration)
+    if request.timings is not None:
+        request.timings.add('sql', duration)
+
+    if stats.count == int(config.DB_QUERY_BUDGET) + 1:
+        metrics.incr('db.query_budget_exceeded')
+        _logger.warning(f'{request.method} {request.path} exceeded query budget '
+                        f'of {config.DB_QUERY_BUDGET} statements')
+    if executions == int(config.DB_REPEATED_QUERY_THRESHOLD):
+        metrics.incr('db.repeated_queries')
+        _logger.warning(f'{request.method} {request.path} executed the same statement {executions} times '
+                        f'(N+1 queries?): {statement}')
+
+
+# Fragments of driver messages of errors after which the transaction is known to be rolled back
+_TRANSIENT_ERROR_MESSAGES = (
+    'database is locked',  # SQLite busy timeout
+    'deadlock',
+    'could not serialize access',  # PostgreSQL serialization failure
+    'lock wait timeout',  # MySQL
+)
+# Connection lost: if it happened during COMMIT the transaction may have been committed
+_CONNECTION_ERROR_MESSAGES = (
+    'server closed the connection',
+    'lost connection',
+    'connection reset',
+)
+# SQLSTATE codes: serialization failure, deadlock detected
+_TRANSIENT_SQLSTATES = ('40001', '40P01')
+
+
+def is_transient_db_error(error: Exception, idempotent: bool = False) -> bool:
+    """
+    Whether a transaction failed with this error is worth running again.
+    Lost connections are retried for idempotent units of work only: the failed transaction may have been committed.
+    """
+    if not isinstance(error, DBAPIError):
+        return False
+    if error.connection_invalidated:
+        return idempotent
+
+    orig = getattr(error, 'orig', None)
+    sqlstate = getattr(orig, 'pgcode', None) or getattr(orig, 'sqlstate', None)
+    if sqlstate in _TRANSIENT_SQLSTATES:
+        return True
+
+    if isinstance(error, OperationalError):
+        message = str(orig or error).lower()
+        fragments = _TRANSIENT_ERROR_MESSAGES + _CONNECTION_ERROR_MESSAGES if idempotent else _TRANSIENT_ERROR_MESSAGES
+        return any(fragment in message for fragment in fragments)
+    return False
+
+
+def default_retry_policy(idempotent: bool = False) -> RetryPolicy:
+    return RetryPolicy(retry_on=functools.partial(is_transient_db_error, idempotent=idempotent),
+                       attempts=config.DB_RETRY_ATTEMPTS,
+                       base_delay=config.DB_RETRY_BASE_DELAY,
+                       max_delay=config.DB_RETRY_MAX_DELAY)
+
+
+def retry_transaction(policy: RetryPolicy = None, idempotent: bool = False):
+    """
+    Re-runs the decorated unit of work (usually a view with its db_session) when it fails
+    with an error the policy considers retryable, e.g. a SQLite lock timeout or a serialization failure.
+    Every db_session inside rolls back on error, so the function starts from a clean state.
+
+    :param idempotent: running the unit of work twice does no harm (e.g. it only reads),
+        so it is retried after a lost connection too. GET and HEAD requests are always considered idempotent.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            request = get_current_request()
+            retry_policy = policy or default_retry_policy(
+                idempotent=idempotent or (request is not None and request.method in ('GET', 'HEAD')))
+            deadline = time.monotonic() + float(config.DB_RETRY_MAX_SECONDS)
+            if request is not None and request.deadline is not None:
+                deadline = min(deadline, request.deadline)
+            attempt = 1
+            while True:
+                try:
+                    return fn(*args, **kwargs)
+                except Exception as error:
+                    delay = retry_policy.next_delay(error, attempt, deadline=deadline)
+                    if delay is None:
+                        if retry_policy.is_retryable(error):
+                            metrics.incr('db.retries_exhausted')
+                            raise HttpError(Status.SERVICE_UNAVAILABLE,
+                                            message='Database is busy, try again later') from error
+                        raise
+                    metrics.incr('db.retries')
+                    _logger.warning(f'Retrying {fn.__name__} in {delay:.3f}s (attempt {attempt}): {error}')
+                    time.sleep(delay)
+                    attempt += 1
+        return wrapper
+    return decorator
 
 
 def configure(config_file: Optional[str] = None):
@@ -68,17 +408,30 @@ def configure(config_file: Optional[str] = None):
 
     # Override values from environment
     config.update_from_env()
+    if config.ACCOUNT_TRANSFER_STRATEGY not in ('optimistic', 'pessimistic'):
+        raise RuntimeError(f'Unknown transfer strategy: {config.ACCOUNT_TRANSFER_STRATEGY}')
 
-    # Set up logging (basic)
-    logging.basicConfig(level=config.LOG_LEVEL)
+    # Set up logging (basic, written in background)
+    setup_logging(config.LOG_LEVEL, queue_size=int(config.LOG_QUEUE_SIZE))
 
     # Establish database connection factory
     _logger.debug('Initializing database connection factory')
-    session_factory = sessionmaker(bind=create_engine(config.DATABASE_URI))
+    engine = _create_engine(config.DATABASE_URI)
+    session_factory = sessionmaker(bind=engine)
     global _Session
     _Session = scoped_session(session_factory)
 
+    configure_shards()
     create_tables()
+    configure_replicas()
+
+    global _shared_cache
+    if config.SHARED_CACHE_PATH and _shared_cache is None:
+        _logger.debug(f'Attaching shared cache: {config.SHARED_CACHE_PATH}')
+        _shared_cache = SharedCache(config.SHARED_CACHE_PATH,
+                                    slots=int(config.SHARED_CACHE_SLOTS),
+                                    slot_size=int(config.SHARED_CACHE_SLOT_SIZE),
+                                    stripes=int(config.SHARED_CACHE_STRIPES))
 
     # App routing
     _logger.debug('Initializing routing')
@@ -86,9 +439,76 @@ def configure(config_file: Optional[str] = None):
         from .auth_app.routing import router as auth_router
         router.nested_route('/auth', auth_router)
 
+        from .auth_app.revocation import start_revocation_refresh
+        start_revocation_refresh(float(config.AUTH_REVOCATION_REFRESH_SECONDS))
+
+    if config.ADMIN_ENABLED:
+        from .admin_app.routing import router as admin_router
+        router.nested_route('/admin', admin_router)
+
     from .account_app.routing import router as account_router
     router.nested_route('/', account_router)
 
+    if config.ACCOUNT_BLOOM_ENABLED:
+        from .account_app.existence import start_account_id_filter
+        start_account_id_filter(float(config.ACCOUNT_BLOOM_REFRESH_SECONDS))
+
+    if len(_shards) > 1:
+        from .account_app.transfers import start_transfer_relay
+        start_transfer_relay(float(config.ACCOUNT_TRANSFER_RELAY_SECONDS))
+
+
+def _create_engine(uri: str):
+    engine = create_engine(uri)
+    event.listen(engine, 'checkin', _reset_connection_settings)
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(engine, 'handle_error', _handle_error)
+    return engine
+
+
+def _shard_uris() -> List[str]:
+    return [uri.strip() for uri in config.DATABASE_SHARD_URIS.split(',') if uri.strip()]
+
+
+def configure_shards():
+    """ (Re)creates account shard engines from DATABASE_SHARD_URIS """
+    global _shards, _shard_engines
+    for session, engine in zip(_shards, _shard_engines):
+        session.remove()
+        engine.dispose()
+
+    _shard_engines = [_create_engine(uri) for uri in _shard_uris()]
+    _shards = [scoped_session(sessionmaker(bind=engine)) for engine in _shard_engines]
+    if _shards:
+        _logger.debug(f'Initialized {len(_shards)} account shards')
+
+
+def configure_replicas():
+    """ (Re)creates read replica engines from DATABASE_REPLICA_URIS """
+    global _replicas
+    if _replicas is not None:
+        _replicas.dispose()
+        _replicas = None
+
+    uris = [uri.strip() for uri in config.DATABASE_REPLICA_URIS.split(',') if uri.strip()]
+    if uris:
+        _logger.debug(f'Initializing {len(uris)} read replicas')
+        _replicas = ReplicaSet([_create_engine(uri) for uri in uris])
+        _replicas.check()
+        start_health_checks(lambda: _replicas, float(config.DB_REPLICA_CHECK_SECONDS))
+
+
+def configured_bulkhead(name: str) -> Optional[Bulkhead]:
+    """ Bulkhead of a class of traffic configured with BULKHEAD_{NAME}_* settings, None if disabled """
+    concurrency = int(getattr(config, f'BULKHEAD_{name.upper()}_CONCURRENCY', 0))
+    if concurrency <= 0:
+        return None
+    return Bulkhead(name,
+                    max_concurrent=concurrency,
+                    max_queue=int(getattr(config, f'BULKHEAD_{name.upper()}_QUEUE', 0)),
+                    queue_timeout=float(config.BULKHEAD_QUEUE_TIMEOUT_SECONDS))
+
 
 def create_tables():
     from .account_app.models import tables as account_tables
@@ -97,7 +517,11 @@ def create_tables():
     # Create database tables if not exist
     _logger.debug('Attempting to create tables')
     engine = create_engine(config.DATABASE_URI)
-    BaseModel.metadata.create_all(engine, tables=account_tables)
+    shard_uris = _shard_uris()
+    if not shard_uris:
+        BaseModel.metadata.create_all(engine, tables=account_tables)
+    for uri in shard_uris:
+        BaseModel.metadata.create_all(create_engine(uri), tables=account_tables)
 
     if config.AUTH_USE_INTERNAL:
         from .auth_app.models import tables as auth_tables
@@ -0,0 +1,29 @@
+import hashlib
+
+
+__all__ = ['shard_index']
+
+
+def _key_hash(key: str) -> int:
+    # Stable between processes and Python versions, unlike hash()
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+
+def _jump_hash(key: int, buckets: int) -> int:
+    """
+    Jump consistent hash (Lamping, Veach, 2014): when the number of buckets grows from N to N+1
+    only 1/(N+1) of the keys move, all of them to the new bucket
+    """
+    bucket, jump = -1, 0
+    while jump < buckets:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return bucket
+
+
+def shard_index(key: str, shards: int) -> int:
+    """ Shard (0 .. shards - 1) of a key, e.g. of a user id """
+    if shards <= 0:
+        raise ValueError('Number of shards should be positive')
+    return _jump_hash(_key_hash(key), shards)
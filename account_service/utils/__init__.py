@@ -1,6 +1,18 @@
 from .request import *
 from .response import *
+from .codecs import *
+from .compression import *
 from .errors import *
+from .bulkhead import *
 from .routing import *
 from .config import *
 from .misc import *
+from .bloom import *
+from .cache import *
+from .pubsub import *
+from .retry import *
+from .metrics import *
+from .logs import *
+from .context import *
+from .timing import *
+from .shm import *
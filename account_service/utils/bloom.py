@@ -0,0 +1,63 @@
+import math
+import hashlib
+import threading
+from typing import Iterable
+
+
+__all__ = ['BloomFilter']
+
+
+class BloomFilter(object):
+    """
+    Probabilistic set membership. `key in bloom` returning False means the key
+    was definitely never added, True means it probably was.
+    Lookups are lock-free, additions are serialized.
+    """
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        capacity = max(1, int(capacity))
+        error_rate = float(error_rate)
+        if not 0 < error_rate < 1:
+            raise ValueError('Error rate should be in (0, 1) range')
+
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.count = 0
+
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_iterable(cls, keys: Iterable[str], capacity: int, error_rate: float = 0.01) -> 'BloomFilter':
+        bloom = cls(capacity, error_rate)
+        for key in keys:
+            bloom.add(key)
+        return bloom
+
+    def _positions(self, key):
+        if isinstance(key, str):
+            key = key.encode('utf-8')
+
+        # Double hashing: k positions out of a single 128-bit digest
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key):
+        positions = self._positions(key)
+        with self._lock:
+            for pos in positions:
+                self._bits[pos >> 3] |= 1 << (pos & 7)
+            self.count += 1
+
+    def __contains__(self, key) -> bool:
+        bits = self._bits
+        for pos in self._positions(key):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def __len__(self):
+        return self.count
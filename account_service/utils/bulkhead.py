@@ -0,0 +1,62 @@
+import threading
+import time
+from typing import Optional
+
+from .errors import HttpError, Status
+from .metrics import metrics
+
+
+__all__ = ['Bulkhead']
+
+
+class Bulkhead(object):
+    """
+    Bounds the number of concurrently handled requests of a class of traffic (e.g. bcrypt-heavy auth).
+    Up to max_concurrent requests run, up to max_queue more wait for a slot (at most queue_timeout seconds),
+    anything beyond is rejected immediately with 503 so that other traffic keeps its server threads.
+    Waiting requests occupy a server thread too: max_concurrent + max_queue should be well below its pool size.
+    """
+    def __init__(self, name: str, max_concurrent: int, max_queue: int = 0, queue_timeout: float = 1.0):
+        if int(max_concurrent) <= 0:
+            raise ValueError('Bulkhead should allow at least one concurrent request')
+        self.name = name
+        self.max_concurrent = int(max_concurrent)
+        self.max_queue = int(max_queue)
+        self.queue_timeout = float(queue_timeout)
+        self.active = 0
+        self.waiting = 0
+        self._condition = threading.Condition(threading.Lock())
+
+    def _reject(self, reason: str):
+        metrics.incr(f'bulkhead.{self.name}.rejected')
+        raise HttpError(Status.SERVICE_UNAVAILABLE, message=f'Server is busy ({self.name}: {reason}), retry later')
+
+    def acquire(self, timeout: Optional[float] = None):
+        """ Takes a slot or raises HttpError(503), timeout - time left to the request deadline if any """
+        with self._condition:
+            if self.active < self.max_concurrent:
+                self.active += 1
+                return
+            if self.waiting >= self.max_queue:
+                self._reject('queue is full')
+
+            wait = self.queue_timeout if timeout is None else max(0.0, min(self.queue_timeout, timeout))
+            ends_at = time.monotonic() + wait
+            self.waiting += 1
+            try:
+                while self.active >= self.max_concurrent:
+                    remaining = ends_at - time.monotonic()
+                    if remaining <= 0:
+                        self._reject('queue timeout')
+                    self._condition.wait(remaining)
+                self.active += 1
+            finally:
+                self.waiting -= 1
+
+    def release(self):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+    def __repr__(self):
+        return f'<Bulkhead({self.name} {self.active}/{self.max_concurrent}, waiting {self.waiting}/{self.max_queue})>'
@@ -0,0 +1,104 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+
+__all__ = ['LocalCache', 'TieredCache']
+
+_MISSING = object()
+
+
+class LocalCache(object):
+    """
+    Thread-safe in-process cache with per-entry TTL and LRU eviction
+    """
+    def __init__(self, max_size: int = 1024, ttl: float = 60):
+        self.max_size = int(max_size)
+        self.ttl = float(ttl)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float = None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TieredCache(object):
+    """
+    LocalCache in front of a cache shared by all worker processes of a host (see SharedCache).
+    Shared cache is resolved with a callable since it is set up at configuration time, None disables it.
+    Values should be JSON serializable.
+
+    Values read from the shared cache are kept in the local one for its TTL. With local_copies=False
+    the local cache is only used while there is no shared one, so updates of other workers are seen at once.
+    """
+    def __init__(self, namespace: str, local: LocalCache, shared: Callable[[], Optional[object]] = None,
+                 local_copies: bool = True):
+        self.namespace = namespace
+        self.local = local
+        self.local_copies = local_copies
+        self._shared = shared or (lambda: None)
+
+    def _key(self, key) -> str:
+        return f'{self.namespace}:{key}'
+
+    def get(self, key, default=None):
+        shared = self._shared()
+        if shared is not None and not self.local_copies:
+            return shared.get(self._key(key), default)
+
+        value = self.local.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        if shared is not None:
+            value = shared.get(self._key(key), _MISSING)
+            if value is not _MISSING:
+                self.local.set(key, value)
+                return value
+        return default
+
+    def set(self, key, value, ttl: float = None):
+        ttl = self.local.ttl if ttl is None else ttl
+        self.local.set(key, value, ttl=ttl)
+        shared = self._shared()
+        if shared is not None:
+            shared.set(self._key(key), value, ttl=ttl)
+
+    def delete(self, key):
+        self.local.delete(key)
+        shared = self._shared()
+        if shared is not None:
+            shared.delete(self._key(key))
@@ -0,0 +1,112 @@
+import json
+from typing import Callable, Optional
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:  # pragma: no cover - optional dependency
+    cbor2 = None
+
+
+__all__ = ['Codec', 'register_codec', 'unregister_codec', 'get_codec', 'negotiate_codec', 'available_codecs',
+           'serializable', 'JSON_CODEC']
+
+ENCODING = 'utf-8'
+
+
+def serializable(value):
+    """
+    Fallback for values codecs can not encode natively: models are serialized
+    with their JsonSerializable.to_dict(), anything else (e.g. Decimal) as a string
+    """
+    if hasattr(value, 'to_dict'):
+        return value.to_dict()
+    return str(value)
+
+
+class Codec(object):
+    """ Body serialization format, identified by its media type """
+    def __init__(self, media_type: str, dumps: Callable[[object], bytes], loads: Callable[[bytes], object],
+                 charset: str = None):
+        self.media_type = media_type
+        self.dumps = dumps
+        self.loads = loads
+        self.content_type = media_type if charset is None else '{0}; charset={1}'.format(media_type, charset)
+
+    def __repr__(self):
+        return f'<Codec({self.media_type})>'
+
+
+JSON_CODEC = Codec('application/json',
+                   dumps=lambda data: json.dumps(data, default=serializable).encode(ENCODING),
+                   loads=lambda data: json.loads(data.decode(ENCODING)),
+                   charset=ENCODING)
+
+_codecs = {JSON_CODEC.media_type: JSON_CODEC}
+
+
+def register_codec(codec: Codec):
+    _codecs[codec.media_type] = codec
+
+
+def unregister_codec(media_type: str):
+    _codecs.pop(media_type, None)
+
+
+if msgpack is not None:
+    register_codec(Codec('application/msgpack',
+                         dumps=lambda data: msgpack.packb(data, default=serializable, use_bin_type=True),
+                         loads=lambda data: msgpack.unpackb(data, raw=False)))
+if cbor2 is not None:
+    register_codec(Codec('application/cbor',
+                         dumps=lambda data: cbor2.dumps(data, default=lambda encoder, value:
+                                                        encoder.encode(serializable(value))),
+                         loads=cbor2.loads))
+
+
+def available_codecs():
+    return list(_codecs.values())
+
+
+def _media_type(header_value: str) -> str:
+    return header_value.split(';', 1)[0].strip().lower()
+
+
+def get_codec(content_type: Optional[str]) -> Optional[Codec]:
+    """ Codec for a Content-Type header value, None if the type is not registered """
+    if not content_type:
+        return None
+    return _codecs.get(_media_type(content_type))
+
+
+def negotiate_codec(accept: Optional[str]) -> Codec:
+    """ Picks the codec preferred by an Accept header value, JSON if nothing else matches """
+    if not accept or len(_codecs) == 1:
+        return JSON_CODEC
+
+    preferences = []
+    for position, item in enumerate(accept.split(',')):
+        media_type, *params = item.split(';')
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        # Highest quality first, keep the order of the header otherwise
+        preferences.append((-quality, position, media_type.strip().lower()))
+
+    for negative_quality, _, media_type in sorted(preferences):
+        if negative_quality >= 0:
+            break
+        if media_type in _codecs:
+            return _codecs[media_type]
+        if media_type in ('*/*', 'application/*'):
+            return JSON_CODEC
+    return JSON_CODEC
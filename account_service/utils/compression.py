@@ -0,0 +1,123 @@
+import zlib
+from typing import Optional
+
+from .response import Response, CONTENT_LENGTH, CONTENT_TYPE
+from .timing import timed
+
+
+__all__ = ['accepts_gzip', 'compress_response', 'GzipStreamResponse']
+
+CONTENT_ENCODING = 'Content-Encoding'
+VARY = 'Vary'
+# Compressed formats (images, archives, ...) would only grow
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/x-ndjson', 'application/msgpack',
+                      'application/cbor', 'application/xml', 'application/javascript')
+# zlib window bits for the gzip container
+_GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """ Whether Accept-Encoding header value allows gzip (explicitly or with *) """
+    if not accept_encoding:
+        return False
+    accepted = False
+    for item in accept_encoding.split(','):
+        coding, *params = item.split(';')
+        coding = coding.strip().lower()
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding == 'gzip':
+            # Explicit preference wins over the wildcard
+            return quality > 0
+        if coding == '*':
+            accepted = quality > 0
+    return accepted
+
+
+def _add_vary(headers: dict, value: str):
+    current = headers.get(VARY)
+    if not current:
+        headers[VARY] = value
+    elif value.lower() not in (v.strip().lower() for v in current.split(',')):
+        headers[VARY] = f'{current}, {value}'
+
+
+class GzipStreamResponse(Response):
+    """
+    Compresses another response on the fly, sent chunked (without Content-Length).
+    With flush=True every chunk is flushed to the client as soon as it is produced (event streams).
+    """
+    def __init__(self, response: Response, headers: dict, level: int = 1, flush: bool = False):
+        headers = dict(headers)
+        headers.pop(CONTENT_LENGTH, None)
+        headers[CONTENT_ENCODING] = 'gzip'
+        super().__init__(None, status_code=response.status, status_message=response.status_message,
+                         content_type=None, headers=headers)
+        self.body = response
+        self.streaming = response.streaming
+        self.level = level
+        self.flush = flush
+
+    def __iter__(self):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, _GZIP_WBITS)
+        for chunk in self.body:
+            data = compressor.compress(chunk)
+            if self.flush:
+                data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+
+    def close(self):
+        try:
+            self.body.close()
+        finally:
+            super().close()
+
+
+def compress_response(response: Response, accept_encoding: Optional[str],
+                      min_size: int = 1024, level: int = 1) -> Response:
+    """
+    Gzip-compresses the response if the client accepts it and the body is large enough.
+    Bodies with a known length below min_size are sent as is, responses without a length are always compressed.
+    """
+    headers = dict(response.headers_as_tuples())
+    content_type = headers.get(CONTENT_TYPE, '')
+    if CONTENT_ENCODING in headers or not content_type.startswith(COMPRESSIBLE_TYPES):
+        return response
+    if 'Accept-Ranges' in headers:
+        # Byte ranges refer to the uncompressed file, files may also be sent by the server (file_wrapper)
+        return response
+
+    # Representation depends on Accept-Encoding, caches should know
+    _add_vary(response.headers, 'Accept-Encoding')
+    _add_vary(headers, 'Accept-Encoding')
+    if response.status in (204, 304) or not accepts_gzip(accept_encoding):
+        return response
+
+    content_length = headers.get(CONTENT_LENGTH)
+    if content_length is not None and int(content_length) < min_size:
+        return response
+
+    if isinstance(response.body, (bytes, bytearray)):
+        with timed('gzip'):
+            compressed = _gzip(response.body, level)
+        if len(compressed) >= len(response.body):
+            return response
+        headers[CONTENT_ENCODING] = 'gzip'
+        headers[CONTENT_LENGTH] = len(compressed)
+        return Response(compressed, status_code=response.status, status_message=response.status_message,
+                        content_type=None, headers=headers)
+
+    return GzipStreamResponse(response, headers, level=level, flush=content_type.startswith('text/event-stream'))
+
+
+def _gzip(data: bytes, level: int) -> bytes:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, _GZIP_WBITS)
+    return compressor.compress(data) + compressor.flush()
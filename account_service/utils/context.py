@@ -0,0 +1,16 @@
+import threading
+
+
+__all__ = ['get_current_request', 'set_current_request']
+
+# WSGI server handles each request within a single thread
+_local = threading.local()
+
+
+def set_current_request(request):
+    _local.request = request
+
+
+def get_current_request():
+    """ Request being handled by the current thread or None (e.g. background jobs) """
+    return getattr(_local, 'request', None)
@@ -0,0 +1,86 @@
+import atexit
+import logging
+import queue
+from decimal import Decimal
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+from .metrics import metrics
+
+
+__all__ = ['DroppingQueueHandler', 'setup_logging', 'stop_logging']
+
+# Immutable values that are safe to format in another thread later
+_PLAIN_TYPES = (str, int, float, Decimal, type(None))
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Puts records into a bounded queue, a QueueListener thread formats and writes them.
+    When the queue is full the record is dropped, request threads never wait for logging.
+    The number of dropped records is logged as soon as the queue has room again.
+
+    Unlike QueueHandler records with plain arguments (strings, numbers, None) are not formatted before
+    they are queued, messages are built by the listener. Other arguments (ORM instances bound to a session
+    of the request thread, mutable containers) are formatted right away.
+    """
+    def __init__(self, records: queue.Queue):
+        super().__init__(records)
+        self.dropped = 0  # Guarded by the handler lock (held by handle() around emit)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        args = record.args
+        if args and not (isinstance(args, tuple) and all(isinstance(arg, _PLAIN_TYPES) for arg in args)):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            if self.dropped:
+                self.queue.put_nowait(logging.makeLogRecord({
+                    'name': __name__,
+                    'levelno': logging.WARNING,
+                    'levelname': logging.getLevelName(logging.WARNING),
+                    'msg': 'Dropped %d log records, logging queue is full',
+                    'args': (self.dropped,),
+                }))
+                self.dropped = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            metrics.incr('logging.dropped')
+
+
+_listener = None  # type: Optional[QueueListener]
+
+
+def setup_logging(level, queue_size: int, log_format: str = logging.BASIC_FORMAT):
+    """
+    Same as logging.basicConfig(level=level) (does nothing if the root logger has handlers already),
+    but with queue_size > 0 records are written to stderr by a background thread through a queue
+    of at most queue_size records (see DroppingQueueHandler)
+    """
+    global _listener
+    root = logging.getLogger()
+    if root.handlers:
+        return
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(log_format))
+    if queue_size > 0:
+        records = queue.Queue(maxsize=queue_size)
+        _listener = QueueListener(records, handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+        handler = DroppingQueueHandler(records)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+
+def stop_logging():
+    """ Writes out queued records and stops the listener thread """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
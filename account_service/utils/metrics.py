@@ -0,0 +1,26 @@
+import threading
+from collections import defaultdict
+
+
+__all__ = ['Metrics', 'metrics']
+
+
+class Metrics(object):
+    """ Process-wide counters """
+    def __init__(self):
+        self._counters = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def incr(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] += value
+
+    def get(self, name: str) -> float:
+        return self._counters.get(name, 0)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._counters)
+
+
+metrics = Metrics()
@@ -0,0 +1,85 @@
+import queue
+import threading
+from typing import Iterable
+
+
+__all__ = ['Hub', 'Subscription']
+
+
+class Subscription(object):
+    """
+    Bounded per-consumer event buffer. When a consumer falls behind and the buffer
+    overflows the subscription is dropped instead of growing.
+    """
+    def __init__(self, hub: 'Hub', topics: Iterable[str], max_size: int = 64):
+        self.topics = frozenset(topics)
+        self.dropped = False
+        self._hub = hub
+        self._queue = queue.Queue(maxsize=int(max_size))
+
+    def push(self, event) -> bool:
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            self.dropped = True
+            return False
+
+    def get(self, timeout: float = None):
+        """ Returns next event or None if nothing was published within timeout """
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self._hub.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class Hub(object):
+    """
+    In-process publish/subscribe. Publishing never blocks: slow subscribers are dropped.
+    """
+    def __init__(self):
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, topics: Iterable[str], max_size: int = 64) -> Subscription:
+        subscription = Subscription(self, topics, max_size=max_size)
+        with self._lock:
+            for topic in subscription.topics:
+                self._subscriptions.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            for topic in subscription.topics:
+                subscribers = self._subscriptions.get(topic)
+                if subscribers is None:
+                    continue
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscriptions[topic]
+
+    def publish(self, topic: str, event) -> int:
+        """ Returns number of subscribers the event was delivered to """
+        with self._lock:
+            subscribers = list(self._subscriptions.get(topic, ()))
+
+        delivered = 0
+        for subscription in subscribers:
+            if subscription.push(event):
+                delivered += 1
+            else:
+                self.unsubscribe(subscription)
+        return delivered
+
+    def subscribers_count(self, topic: str) -> int:
+        with self._lock:
+            return len(self._subscriptions.get(topic, ()))
@@ -1,17 +1,29 @@
 from urllib.parse import parse_qs
+from typing import Optional
+import time
 import cgi
 
 from .errors import HttpError, Status
+from .codecs import Codec, get_codec
+from .timing import Timings, QueryStats, timed
 
 
 __all__ = ['Request']
 
 
+TIMEOUT_HEADER = 'X-Request-Timeout'
+
+
 class Request(object):
     _headers = {}
 
     def __init__(self, wsgi_env: dict):
         self._wsgi_env = wsgi_env
+        self.started = time.monotonic()
+        self.deadline = None  # type: Optional[float]
+        self.timings = None  # type: Optional[Timings]
+        self.query_stats = QueryStats()
+        self.principal = None  # type: Optional[str]  # Id of the authenticated user
 
         self._path = wsgi_env.get('PATH_INFO')
         self._uri = wsgi_env.get('REQUEST_URI')
@@ -24,13 +36,19 @@ class Request(object):
         self._parsed_data = None
 
         # Parse WSGI HTTP headers
-        # All HTTP headers starts with HTTP_ (5 symbols) in WSGI env
-        self._headers = {k[5:].lower(): wsgi_env[k] for k in wsgi_env if k.startswith('HTTP_')}
+        # All HTTP headers starts with HTTP_ (5 symbols) in WSGI env, dashes are replaced with underscores
+        self._headers = {k[5:].lower().replace('_', '-'): wsgi_env[k] for k in wsgi_env if k.startswith('HTTP_')}
         if self._content_len_header is not None:
             self._headers['content-length'] = self._content_len_header
         if self._content_type_header is not None:
             self._headers['content-type'] = self._content_type_header
 
+        # Client may ask to give up earlier than the server would (seconds)
+        try:
+            self._client_timeout = float(self._headers.get(TIMEOUT_HEADER.lower()))
+        except (TypeError, ValueError):
+            self._client_timeout = None
+
     @property
     def method(self):
         return self._method
@@ -52,33 +70,75 @@ class Request(object):
     @property
     def data(self):
         if self._parsed_data is None:
-            # Parse query parameters first
-            self._parsed_data = self.query_parameters
-
-            if self.method in ['POST', 'PUT']:
-                if self._content_type_header is not None:
-                    try:
-                        headers = cgi.Message()
-                        headers.set_type(self._content_type_header)
-                        headers['Content-Length'] = self._content_len_header
-                        fields = cgi.FieldStorage(self._wsgi_env.get('wsgi.input'),
-                                                  headers=headers,
-                                                  encoding='utf-8',
-                                                  errors='replace',
-                                                  environ={'REQUEST_METHOD': 'POST'})
-                        for key in fields:
-                            if key in self._parsed_data:
-                                self._parsed_data[key] += _get_post_values(fields, key)
-                            else:
-                                self._parsed_data[key] = _get_post_values(fields, key)
-                    except Exception:
-                        raise HttpError(Status.BAD_REQUEST)
-            for key in self._parsed_data:
-                val = self._parsed_data[key]
-                if isinstance(val, list) and len(val) == 1:
-                    self._parsed_data[key] = val[0]
+            with timed('parse'):
+                self._parse_data()
         return self._parsed_data
 
+    def _parse_data(self):
+        # Parse query parameters first
+        self._parsed_data = self.query_parameters
+
+        body_codec = get_codec(self._content_type_header)
+
+        if self.method in ['POST', 'PUT'] and body_codec is None:
+            if self._content_type_header is not None:
+                try:
+                    headers = cgi.Message()
+                    headers.set_type(self._content_type_header)
+                    headers['Content-Length'] = self._content_len_header
+                    fields = cgi.FieldStorage(self._wsgi_env.get('wsgi.input'),
+                                              headers=headers,
+                                              encoding='utf-8',
+                                              errors='replace',
+                                              environ={'REQUEST_METHOD': 'POST'})
+                    for key in fields:
+                        if key in self._parsed_data:
+                            self._parsed_data[key] += _get_post_values(fields, key)
+                        else:
+                            self._parsed_data[key] = _get_post_values(fields, key)
+                except Exception:
+                    raise HttpError(Status.BAD_REQUEST)
+        for key in self._parsed_data:
+            val = self._parsed_data[key]
+            if isinstance(val, list) and len(val) == 1:
+                self._parsed_data[key] = val[0]
+
+        if self.method in ['POST', 'PUT'] and body_codec is not None:
+            # Serialized (JSON, MessagePack, ...) body, values keep their types
+            self._parsed_data.update(self._decode_body(body_codec))
+
+    def _decode_body(self, codec: Codec) -> dict:
+        try:
+            length = int(self._content_len_header or 0)
+        except ValueError:
+            raise HttpError(Status.BAD_REQUEST, message='Invalid Content-Length')
+        if not length:
+            return {}
+        try:
+            data = codec.loads(self._wsgi_env.get('wsgi.input').read(length))
+        except Exception:
+            raise HttpError(Status.BAD_REQUEST, message=f'Unable to decode {codec.media_type} body')
+        if not isinstance(data, dict):
+            raise HttpError(Status.BAD_REQUEST, message='Request body should be an object')
+        return data
+
+    def set_timeout(self, seconds: Optional[float]):
+        """ Sets deadline relative to the request start, client timeout header can only shorten it """
+        if self._client_timeout is not None:
+            seconds = self._client_timeout if seconds is None else min(seconds, self._client_timeout)
+        self.deadline = None if seconds is None else self.started + seconds
+
+    def remaining(self) -> Optional[float]:
+        """ Seconds left until the deadline, None if there is no deadline """
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    def check_deadline(self):
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            raise HttpError(Status.GATEWAY_TIMEOUT, message='Request deadline exceeded')
+
     def get_header_value(self, header_name: str, default=None) -> str:
         return self._headers.get(header_name.lower(), default)
 
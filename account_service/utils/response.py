@@ -1,11 +1,16 @@
 import json
 import os
 import mimetypes
+from email.utils import formatdate, parsedate_to_datetime
 from io import RawIOBase
+from typing import Iterable
 from http.client import responses
 
+from .codecs import Codec, JSON_CODEC, negotiate_codec, available_codecs
+from .timing import timed
 
-__all__ = ['Response', 'JsonResponse', 'FileResponse', 'StreamedResponse', 'FileResponse']
+
+__all__ = ['Response', 'JsonResponse', 'FileResponse', 'StreamedResponse', 'ChunkedResponse', 'EventStreamResponse']
 
 ENCODING = 'utf-8'
 JSON_CONTENT_TYPE = 'application/json; charset={}'.format(ENCODING)
@@ -14,12 +19,16 @@ CONTENT_TYPE = 'Content-Type'
 
 
 class Response(object):
+    # Body is produced while it is being sent, after the handler has returned
+    streaming = False
+
     def __init__(self, data=None,
                  status_code: int=200,
                  status_message=None,
                  content_type='application/json',
                  content_len=None,
                  headers: dict=None):
+        self._close_callbacks = []
         if not headers:
             self.headers = {}
         else:
@@ -34,7 +43,7 @@ class Response(object):
 
         if content_len is not None:
             self.headers[CONTENT_LENGTH] = content_len
-        elif CONTENT_LENGTH not in self.headers:
+        elif CONTENT_LENGTH not in self.headers and data is not None:
             self.headers[CONTENT_LENGTH] = len(data)
 
         if content_type is not None and CONTENT_TYPE not in self.headers:
@@ -60,13 +69,37 @@ class Response(object):
     def __iter__(self):
         yield self.body
 
+    def negotiate(self, request):
+        """ Called before the response is sent, to adapt it to what the client accepts """
+        pass
+
+    def wsgi_body(self, env: dict):
+        """ Iterable returned to the WSGI server """
+        return self
+
+    def call_on_close(self, callback):
+        """ Callback is invoked once the response is sent (or aborted) """
+        self._close_callbacks.append(callback)
+
+    def close(self):
+        callbacks, self._close_callbacks = self._close_callbacks, []
+        for callback in callbacks:
+            callback()
+
 
 class JsonResponse(Response):
+    """
+    Serialized data response. Data is encoded lazily, once the format is negotiated
+    from the Accept header of the request (see codecs), JSON by default.
+    """
     def __init__(self, data,
                  status_code: int=200,
                  status_message=None,
                  headers: dict=None):
-        super().__init__(json.dumps(data).encode(ENCODING),
+        self._body = None
+        self.data = data
+        self.codec = JSON_CODEC  # type: Codec
+        super().__init__(None,
                          status_code=status_code,
                          status_message=status_message,
                          headers=headers,
@@ -75,35 +108,213 @@ class JsonResponse(Response):
         # Nosniff header for security purposes:
         # see: https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/X-Content-Type-Options
         self.headers['X-Content-Type-Options'] = 'nosniff'
+        if len(available_codecs()) > 1:
+            self.headers['Vary'] = 'Accept'
+
+    @property
+    def body(self) -> bytes:
+        if self._body is None:
+            with timed('encode'):
+                self._body = self.codec.dumps(self.data)
+        return self._body
+
+    @body.setter
+    def body(self, value):
+        self._body = value
+
+    def negotiate(self, request):
+        codec = negotiate_codec(request.get_header_value('Accept'))
+        if codec is not self.codec:
+            self.codec = codec
+            self._body = None
+
+    def headers_as_tuples(self):
+        self.headers[CONTENT_TYPE] = self.codec.content_type
+        self.headers[CONTENT_LENGTH] = len(self.body)
+        return super().headers_as_tuples()
 
 
 class StreamedResponse(Response):
-    def __init__(self, stream: RawIOBase, chunk_size=4096, *args, **kwargs):
+    """
+    Sends a binary stream in chunks, read into a reused buffer.
+    set_range() restricts the response to a part of the stream.
+    """
+    def __init__(self, stream: RawIOBase, chunk_size=64 * 1024, *args, **kwargs):
         self.chunk_size = chunk_size
 
         # Get content-size
         stream.seek(0, os.SEEK_END)
-        content_length = stream.tell()
+        self.stream_size = stream.tell()
         stream.seek(0, os.SEEK_SET)
+        self._remaining = self.stream_size
+        self._view = None
 
-        super().__init__(stream, content_len=content_length, *args, **kwargs)
+        super().__init__(stream, content_len=self.stream_size, *args, **kwargs)
+
+    def set_range(self, offset: int, length: int):
+        self.body.seek(offset, os.SEEK_SET)
+        self._remaining = length
+        self.content_len = length
 
     def __iter__(self):
         return self
 
     def __next__(self):
-        data = self.body.read(self.chunk_size)
-        if not data:
+        if self._view is None:
+            self._view = memoryview(bytearray(self.chunk_size))
+        size = 0
+        if self._remaining > 0:
+            size = self.body.readinto(self._view[:min(self.chunk_size, self._remaining)]) or 0
+        if not size:
             self.body.close()
             raise StopIteration
-        return data
+        self._remaining -= size
+        return self._view[:size].tobytes()
+
+    def close(self):
+        try:
+            self.body.close()
+        finally:
+            super().close()
 
 
 class FileResponse(StreamedResponse):
-    def __init__(self, path: str, *args, **kwargs):
-        stream = open(path, 'rb')
+    """
+    File download with conditional (If-Modified-Since) and partial (single Range) requests support.
+    Whole files are handed to the server with wsgi.file_wrapper when it is provided (e.g. to use sendfile),
+    otherwise the file is read in large chunks.
+    """
+    def __init__(self, path: str, chunk_size=256 * 1024, *args, **kwargs):
+        stream = open(path, 'rb', buffering=0)
         mime_type = mimetypes.guess_type(path)[0]
         if mime_type is None:
             mime_type = 'application/octet-stream'
 
-        super().__init__(stream, content_type=mime_type, *args, **kwargs)
+        super().__init__(stream, chunk_size, content_type=mime_type, *args, **kwargs)
+        self.modified = int(os.fstat(stream.fileno()).st_mtime)
+        self.headers['Last-Modified'] = formatdate(self.modified, usegmt=True)
+        self.headers['Accept-Ranges'] = 'bytes'
+
+    def _set_status(self, status_code: int):
+        self.status = status_code
+        self.status_message = responses.get(status_code, '')
+
+    def _not_modified(self, request) -> bool:
+        header = request.get_header_value('If-Modified-Since')
+        if not header:
+            return False
+        try:
+            since = parsedate_to_datetime(header).timestamp()
+        except (TypeError, ValueError, OverflowError):
+            return False
+        return self.modified <= since
+
+    def _parse_range(self, header: str):
+        """ Returns (offset, length) of a single byte range, None if ignored, raises ValueError if unsatisfiable """
+        unit, _, ranges = header.partition('=')
+        if unit.strip().lower() != 'bytes' or ',' in ranges:
+            # Multiple ranges are not supported, the whole file is sent
+            return None
+        first, _, last = (part.strip() for part in ranges.partition('-'))
+        if not first:
+            if not last.isdigit():
+                return None
+            if int(last) == 0:
+                raise ValueError('Empty suffix range')
+            offset = max(0, self.stream_size - int(last))
+            end = self.stream_size - 1
+        else:
+            if not first.isdigit() or (last and not last.isdigit()):
+                return None
+            offset = int(first)
+            end = min(int(last), self.stream_size - 1) if last else self.stream_size - 1
+        if offset >= self.stream_size or end < offset:
+            raise ValueError('Range not satisfiable')
+        return offset, end - offset + 1
+
+    def negotiate(self, request):
+        if request.method not in ('GET', 'HEAD') or self.status != 200:
+            return
+
+        if self._not_modified(request):
+            self._set_status(304)
+            self._remaining = 0
+            self.headers.pop(CONTENT_LENGTH, None)
+            return
+
+        header = request.get_header_value('Range')
+        if not header:
+            return
+        try:
+            byte_range = self._parse_range(header)
+        except ValueError:
+            self._set_status(416)
+            self._remaining = 0
+            self.content_len = 0
+            self.headers['Content-Range'] = 'bytes */{0}'.format(self.stream_size)
+            return
+        if byte_range is not None:
+            offset, length = byte_range
+            self._set_status(206)
+            self.set_range(offset, length)
+            self.headers['Content-Range'] = 'bytes {0}-{1}/{2}'.format(offset, offset + length - 1, self.stream_size)
+
+    def wsgi_body(self, env: dict):
+        file_wrapper = env.get('wsgi.file_wrapper')
+        if file_wrapper is not None and self.status == 200:
+            # File wrapper sends the file till the end
+            return file_wrapper(self.body, self.chunk_size)
+        return self
+
+
+class ChunkedResponse(Response):
+    """
+    Response of unknown length produced by an iterable of bytes (e.g. a generator), sent chunked.
+    The iterable is closed with the response.
+    """
+    streaming = True
+
+    def __init__(self, chunks: Iterable, *args, **kwargs):
+        super().__init__(None, *args, **kwargs)
+        self.body = chunks
+
+    def __iter__(self):
+        return iter(self.body)
+
+    def close(self):
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            super().close()
+
+
+class EventStreamResponse(Response):
+    """
+    Server-Sent Events response without Content-Length (sent chunked).
+    Events iterable should produce (event_name, data) tuples, None produces a heartbeat comment.
+    """
+    streaming = True
+
+    def __init__(self, events: Iterable, *args, **kwargs):
+        super().__init__(None, content_type='text/event-stream; charset={}'.format(ENCODING), *args, **kwargs)
+        self.headers['Cache-Control'] = 'no-cache'
+        self.headers['X-Accel-Buffering'] = 'no'
+        self.body = events
+
+    def __iter__(self):
+        # Comment line to send headers immediately
+        yield b': connected\n\n'
+        for event in self.body:
+            if event is None:
+                yield b': heartbeat\n\n'
+            else:
+                name, data = event
+                yield 'event: {0}\ndata: {1}\n\n'.format(name, json.dumps(data)).encode(ENCODING)
+
+    def close(self):
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            super().close()
@@ -0,0 +1,42 @@
+import random
+import time
+from typing import Callable, Optional
+
+
+__all__ = ['RetryPolicy']
+
+
+class RetryPolicy(object):
+    """
+    Describes which errors are worth retrying and how long to wait between attempts:
+    capped exponential backoff with full jitter, bounded by the number of attempts
+    and optionally by a deadline.
+    """
+    def __init__(self,
+                 retry_on: Callable[[Exception], bool],
+                 attempts: int = 3,
+                 base_delay: float = 0.02,
+                 max_delay: float = 0.5):
+        self.retry_on = retry_on
+        self.attempts = max(1, int(attempts))
+        self.base_delay = float(base_delay)
+        self.max_delay = float(max_delay)
+
+    def is_retryable(self, error: Exception) -> bool:
+        return bool(self.retry_on(error))
+
+    def backoff(self, attempt: int) -> float:
+        """ Delay before the attempt following the given (1-based) failed attempt """
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+    def next_delay(self, error: Exception, attempt: int, deadline: Optional[float] = None) -> Optional[float]:
+        """
+        Returns delay before the next attempt or None if the error should be propagated.
+        Deadline is a time.monotonic() value.
+        """
+        if attempt >= self.attempts or not self.is_retryable(error):
+            return None
+        delay = self.backoff(attempt)
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return None
+        return delay
@@ -2,6 +2,8 @@ import re
 from typing import Callable
 from urllib.parse import unquote
 from account_service.utils import HttpError, Status, Request, Response
+from .timing import timed
+from .bulkhead import Bulkhead
 
 
 __all__ = ['Router']
@@ -12,8 +14,12 @@ class Router(object):
         self._routes = []
         self._nested_routers = []
 
-    def add_route(self, route_pattern: str, handler: Callable):
-        self._routes.append((re.compile(route_pattern), handler))
+    def add_route(self, route_pattern: str, handler: Callable, timeout: float = None, bulkhead: Bulkhead = None):
+        """
+        :param timeout: seconds the handler is allowed to take, overrides the default deadline of the request
+        :param bulkhead: limits concurrency of the class of traffic the route belongs to (may be shared by routes)
+        """
+        self._routes.append((re.compile(route_pattern), handler, timeout, bulkhead))
 
     def nested_route(self, prefix: str, router: 'Router'):
         self._nested_routers.append((prefix, router))
@@ -33,17 +39,35 @@ class Router(object):
                 return router.dispatch(relative_path, request)
 
         # Then try all the routes
-        for compiled_pattern, handler in self._routes:
-            match = compiled_pattern.match(path)
-            if not match:
-                continue
+        with timed('route'):
+            for compiled_pattern, handler, timeout, bulkhead in self._routes:
+                match = compiled_pattern.match(path)
+                if match:
+                    break
+            else:
+                # No route found
+                raise HttpError(Status.NOT_FOUND)
+
+            if timeout is not None:
+                request.set_timeout(timeout)
 
             # Resolve named path arguments
             kwargs = match.groupdict()  # type: dict
             kwargs = {k: unquote(v) for k, v in kwargs.items() if v}
 
-            # Invoke actual request handler
+        # Invoke actual request handler
+        if bulkhead is None:
             return handler(request, **kwargs)
 
-        # No route found
-        raise HttpError(Status.NOT_FOUND)
+        bulkhead.acquire(request.remaining())
+        try:
+            response = handler(request, **kwargs)
+        except BaseException:
+            bulkhead.release()
+            raise
+        if isinstance(response, Response) and response.streaming:
+            # Streams hold the slot until they are sent
+            response.call_on_close(bulkhead.release)
+        else:
+            bulkhead.release()
+        return response
@@ -0,0 +1,157 @@
+import os
+import json
+import mmap
+import time
+import struct
+import hashlib
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+
+__all__ = ['SharedCache']
+
+_MAGIC = b'ASSHMC01'
+# magic, number of groups, ways per group, slot size
+_HEADER = struct.Struct('<8sIII')
+_HEADER_SIZE = 4096
+# key digest, expiration (unix time), value length
+_SLOT_HEADER = struct.Struct('<16sdI')
+_EMPTY_DIGEST = b'\0' * 16
+
+
+class SharedCache(object):
+    """
+    Fixed-size hash table with TTL in a memory-mapped file, shared by all worker processes on a host.
+
+    The table is set-associative: a key may be stored in one of `ways` slots of its group,
+    when the group is full the entry expiring first is evicted.
+    Groups are protected by lock stripes: a thread lock within a process
+    and an fcntl byte-range lock across processes.
+    Values should be JSON serializable.
+    """
+    def __init__(self, path: str, slots: int = 65536, slot_size: int = 512, stripes: int = 64, ways: int = 8):
+        if fcntl is None:
+            raise RuntimeError('Shared cache requires fcntl (POSIX) support')
+
+        self.path = path
+        self.ways = int(ways)
+        self.groups = max(1, int(slots) // self.ways)
+        self.slot_size = int(slot_size)
+        self.max_value_size = self.slot_size - _SLOT_HEADER.size
+        # One lock byte per stripe in the header region
+        self.stripes = max(1, min(int(stripes), _HEADER_SIZE - _HEADER.size))
+        if self.max_value_size <= 0:
+            raise ValueError('Slot size is too small')
+
+        self._size = _HEADER_SIZE + self.groups * self.ways * self.slot_size
+        self._thread_locks = [threading.Lock() for _ in range(self.stripes)]
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._init_file()
+        self._mmap = mmap.mmap(self._fd, self._size)
+
+    def _init_file(self):
+        header = _HEADER.pack(_MAGIC, self.groups, self.ways, self.slot_size)
+        # Lock the header region while checking/initializing, other workers may start at the same time
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, _HEADER_SIZE, 0)
+        try:
+            if os.pread(self._fd, _HEADER.size, 0) != header or os.fstat(self._fd).st_size != self._size:
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, self._size)
+                os.pwrite(self._fd, header, 0)
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, _HEADER_SIZE, 0)
+
+    def close(self):
+        self._mmap.close()
+        os.close(self._fd)
+
+    @staticmethod
+    def _digest(key: str) -> bytes:
+        return hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+
+    @contextmanager
+    def _locked(self, group: int):
+        stripe = group % self.stripes
+        with self._thread_locks[stripe]:
+            # Lock a single byte per stripe within the (otherwise unused) header region
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, _HEADER.size + stripe)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, _HEADER.size + stripe)
+
+    def _offsets(self, group: int):
+        first = _HEADER_SIZE + group * self.ways * self.slot_size
+        return range(first, first + self.ways * self.slot_size, self.slot_size)
+
+    def _group_offsets(self, digest: bytes):
+        group = int.from_bytes(digest[:8], 'little') % self.groups
+        return group, self._offsets(group)
+
+    def get(self, key: str, default=None):
+        digest = self._digest(key)
+        group, offsets = self._group_offsets(digest)
+        now = time.time()
+        with self._locked(group):
+            for offset in offsets:
+                slot_digest, expires, length = _SLOT_HEADER.unpack_from(self._mmap, offset)
+                if slot_digest == digest:
+                    if expires < now:
+                        return default
+                    start = offset + _SLOT_HEADER.size
+                    value = self._mmap[start:start + length]
+                    break
+            else:
+                return default
+        return json.loads(value.decode('utf-8'))
+
+    def set(self, key: str, value, ttl: float) -> bool:
+        """ Returns False if the value does not fit into a slot """
+        data = json.dumps(value, separators=(',', ':')).encode('utf-8')
+        if len(data) > self.max_value_size:
+            return False
+
+        digest = self._digest(key)
+        group, offsets = self._group_offsets(digest)
+        now = time.time()
+        with self._locked(group):
+            target = None
+            free = None
+            oldest, oldest_expires = None, None
+            for offset in offsets:
+                slot_digest, expires, _ = _SLOT_HEADER.unpack_from(self._mmap, offset)
+                if slot_digest == digest:
+                    target = offset
+                    break
+                if free is None and (slot_digest == _EMPTY_DIGEST or expires < now):
+                    free = offset
+                if oldest is None or expires < oldest_expires:
+                    oldest, oldest_expires = offset, expires
+
+            if target is None:
+                # Otherwise evict the entry which is closest to expiration
+                target = free if free is not None else oldest
+            _SLOT_HEADER.pack_into(self._mmap, target, digest, now + ttl, len(data))
+            start = target + _SLOT_HEADER.size
+            self._mmap[start:start + len(data)] = data
+        return True
+
+    def delete(self, key: str):
+        digest = self._digest(key)
+        group, offsets = self._group_offsets(digest)
+        with self._locked(group):
+            for offset in offsets:
+                if _SLOT_HEADER.unpack_from(self._mmap, offset)[0] == digest:
+                    _SLOT_HEADER.pack_into(self._mmap, offset, _EMPTY_DIGEST, 0, 0)
+                    return
+
+    def clear(self):
+        for group in range(self.groups):
+            with self._locked(group):
+                for offset in self._offsets(group):
+                    _SLOT_HEADER.pack_into(self._mmap, offset, _EMPTY_DIGEST, 0, 0)
@@ -0,0 +1,93 @@
+import time
+from collections import OrderedDict, Counter
+
+from .context import get_current_request
+
+
+__all__ = ['Timings', 'QueryStats', 'timed']
+
+
+class _Span(object):
+    __slots__ = ('_timings', '_name', '_started')
+
+    def __init__(self, timings: 'Timings', name: str):
+        self._timings = timings
+        self._name = name
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._timings.add(self._name, time.perf_counter() - self._started)
+
+
+class _NoopSpan(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Timings(object):
+    """
+    Phase timings of a request: total duration and number of spans per name, in order of first appearance.
+    Requests are handled by a single thread, no locking.
+    """
+    def __init__(self):
+        self._spans = OrderedDict()
+
+    def span(self, name: str) -> _Span:
+        return _Span(self, name)
+
+    def add(self, name: str, duration: float):
+        total, count = self._spans.get(name, (0.0, 0))
+        self._spans[name] = (total + duration, count + 1)
+
+    def as_dict(self) -> dict:
+        """ {name: milliseconds} """
+        return {name: round(total * 1000, 3) for name, (total, _) in self._spans.items()}
+
+    def server_timing(self, total: float = None) -> str:
+        """ Server-Timing header value, see https://www.w3.org/TR/server-timing/ """
+        entries = []
+        for name, (duration, count) in self._spans.items():
+            entry = '{0};dur={1:.3f}'.format(name, duration * 1000)
+            if count > 1:
+                entry += ';desc="{0}x"'.format(count)
+            entries.append(entry)
+        if total is not None:
+            entries.append('total;dur={0:.3f}'.format(total * 1000))
+        return ', '.join(entries)
+
+
+class QueryStats(object):
+    """ SQL statements executed within a request """
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()  # statement: number of executions
+
+    def add(self, statement: str, duration: float) -> int:
+        """ Returns how many times the statement was executed so far """
+        self.count += 1
+        self.seconds += duration
+        self.statements[statement] += 1
+        return self.statements[statement]
+
+
+def timed(name: str):
+    """
+    Context manager measuring a phase of the current request.
+    Does nothing if there is no current request or timings are not collected for it.
+    """
+    timings = getattr(get_current_request(), 'timings', None)
+    if timings is None:
+        return _NOOP_SPAN
+    return timings.span(name)
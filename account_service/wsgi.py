@@ -1,9 +1,13 @@
+import json
 import logging
+import time
 
-from account_service.service import configure, router
-from account_service.utils import HttpError, Request, Status, JsonResponse, Response
+from account_service.service import configure, router, config
+from account_service.utils import HttpError, Request, Status, JsonResponse, Response, set_current_request, \
+    compress_response, Timings
 
 _logger = logging.getLogger(__name__)
+_access_logger = logging.getLogger('account_service.access')
 
 
 def application_handler(env, start_response):
@@ -12,33 +16,67 @@ def application_handler(env, start_response):
 
     :param env: WSGI env dictionary
     :param start_response: WSGI callback
-    :return: response bytes
+    :return: iterable of response bytes, closed by the server once sent
     """
+    request = None
     try:
         request = Request(env)
+        request.set_timeout(float(config.REQUEST_TIMEOUT_SECONDS))
+        if config.SERVER_TIMING_ENABLED or config.ACCESS_LOG_ENABLED:
+            request.timings = Timings()
+        set_current_request(request)
         response = router.dispatch(request.path, request)
         if not response or not isinstance(response, Response):
             raise HttpError(Status.INTERNAL_SERVER_ERROR, message='Unable to respond')
         else:
-            _logger.info('{} {} {}'.format(request.method, request.path, response.status_string))
+            _logger.info('%s %s %s', request.method, request.path, response.status_string)
     except HttpError as http_error:
         response = JsonResponse({'message': http_error.message},
                                 status_code=http_error.status_code,
                                 status_message=http_error.status_message)
-        _logger.error('{} {} {}: message={}'.format(
-            env.get('REQUEST_METHOD', ''),
-            env.get('PATH_INFO', ''),
-            response.status_string,
-            http_error.message))
+        _logger.error('%s %s %s: message=%s',
+                      env.get('REQUEST_METHOD', ''),
+                      env.get('PATH_INFO', ''),
+                      response.status_string,
+                      http_error.message)
     except Exception as error:
         response = JsonResponse({'message': 'Internal server error, please contact server administrator'},
                                 status_code=Status.INTERNAL_SERVER_ERROR)
-        _logger.error('{0} {1}'.format(env.get('PATH_INFO', ''), response.status_string))
+        _logger.error('%s %s', env.get('PATH_INFO', ''), response.status_string)
         _logger.exception(error, exc_info=True)
-    if response is not None:
+
+    try:
+        if request is not None:
+            response.negotiate(request)
+            if config.RESPONSE_COMPRESSION_ENABLED:
+                response = compress_response(response, request.get_header_value('Accept-Encoding'),
+                                             min_size=int(config.RESPONSE_COMPRESSION_MIN_SIZE),
+                                             level=int(config.RESPONSE_COMPRESSION_LEVEL))
+            if request.timings is not None:
+                _report_timings(request, response)
         start_response(response.status_string, response.headers_as_tuples())
-        for chunk in response:
-            yield chunk
+    finally:
+        set_current_request(None)
+    return response.wsgi_body(env)
+
+
+def _report_timings(request: Request, response: Response):
+    """ Server-Timing header and access log line, streamed bodies are not included """
+    # Headers of serialized responses are known once the body is encoded
+    response.headers_as_tuples()
+    total = time.monotonic() - request.started
+    if config.SERVER_TIMING_ENABLED:
+        response.headers['Server-Timing'] = request.timings.server_timing(total)
+    if config.ACCESS_LOG_ENABLED and _access_logger.isEnabledFor(logging.INFO):
+        _access_logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status,
+            'duration_ms': round(total * 1000, 3),
+            'timings': request.timings.as_dict(),
+            'queries': request.query_stats.count,
+            'query_ms': round(request.query_stats.seconds * 1000, 3),
+        }))
 
 
 if __name__ == '__main__':
@@ -49,6 +87,8 @@ if __name__ == '__main__':
     parser.add_argument('--host', type=str, default='0.0.0.0', help='Host')
     parser.add_argument('--port', type=int, default=8081, help='Port')
     parser.add_argument('--name', type=str, default='MindRecord API', help='Server name')
+    parser.add_argument('--threads', type=int, default=32,
+                        help='Worker threads, should exceed the sum of bulkhead limits (BULKHEAD_*)')
     args = parser.parse_args()
 
     configure()
@@ -56,5 +96,6 @@ if __name__ == '__main__':
     logging.info('Starting WSGI server on: http://{0}:{1}'.format(args.host, args.port))
 
     # Running
-    server = wsgiserver.WSGIServer(application_handler, host=args.host, port=args.port, server_name=args.name)
+    server = wsgiserver.WSGIServer(application_handler, host=args.host, port=args.port, server_name=args.name,
+                                   numthreads=args.threads)
     server.start()
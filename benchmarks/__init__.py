@@ -0,0 +1,68 @@
+"""
+Helpers for in-process benchmarks: requests are passed straight to the WSGI
+application handler, so numbers do not include HTTP server overhead.
+"""
+import io
+import os
+import tempfile
+from urllib.parse import urlencode
+
+from account_service.utils import Config
+
+
+__all__ = ['setup_service', 'issue_token', 'call']
+
+
+def setup_service(**config_values) -> str:
+    """ Configures the service against a fresh SQLite database, returns its path """
+    import account_service.service as srv
+
+    fd, path = tempfile.mkstemp(prefix='account_service_bench_', suffix='.db')
+    os.close(fd)
+    cfg = Config.from_dict(dict({'DATABASE_URI': f'sqlite:///{path}', 'LOG_LEVEL': 'CRITICAL'}, **config_values))
+    srv.config.update(cfg)
+    srv.configure()
+    return path
+
+
+def issue_token(user_id: str, role: str = 'user') -> str:
+    from account_service.auth_app.models import User, Role
+    from account_service.auth_app.views import create_access_token
+
+    user = User(email=f'{user_id}@bench', role=Role(role), encrypted_password='')
+    user.id = user_id
+    return create_access_token(user)
+
+
+def call(method: str, path: str, data: dict = None, token: str = None, headers: dict = None):
+    """ Returns (status code, headers dict, body bytes) """
+    from account_service.wsgi import application_handler
+
+    body = urlencode(data).encode('ascii') if data else b''
+    path, _, query = path.partition('?')
+    env = {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': io.BytesIO(body),
+    }
+    if token:
+        env['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+    for k, v in (headers or {}).items():
+        env['HTTP_' + k.upper().replace('-', '_')] = v
+
+    result = {}
+
+    def start_response(status, response_headers, exc_info=None):
+        result['status'] = int(status.split(' ', 1)[0])
+        result['headers'] = dict(response_headers)
+
+    iterable = application_handler(env, start_response)
+    try:
+        content = b''.join(iterable)
+    finally:
+        if hasattr(iterable, 'close'):
+            iterable.close()
+    return result['status'], result['headers'], content
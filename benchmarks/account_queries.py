@@ -0,0 +1,73 @@
+"""
+Per-request overhead of account reads: ORM queries hydrating Account instances
+vs. the precompiled Core fast path (account_app.queries), for the data access alone
+and for whole requests through the application handler.
+
+    python -m benchmarks.account_queries --accounts 20 --repeat 2000
+"""
+import argparse
+import os
+import time
+from decimal import Decimal
+
+from benchmarks import setup_service, issue_token, call
+from benchmarks.transfer_contention import create_funded_accounts
+
+
+def measure(name: str, fn, repeat: int):
+    fn()  # Warm up (connection, compiled statements)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    elapsed = time.perf_counter() - started
+    print(f'{name:>24}: {elapsed / repeat * 1e6:9.1f} us/call')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--accounts', type=int, default=20, help='Accounts of the user (listing size)')
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    path = setup_service()
+    try:
+        from account_service.service import db_session
+        from account_service.account_app import queries
+        from account_service.account_app.models import Account
+        from account_service.account_app.slots import serialize_accounts
+
+        user_id = 'bench-reader'
+        ids = create_funded_accounts(user_id, args.accounts, Decimal('100'))
+        account_id = ids[0]
+
+        def orm_detail():
+            with db_session() as session:
+                account = session.query(Account).filter(Account.id == account_id, Account.user_id == user_id).first()
+                return serialize_accounts(session, [account])[0]
+
+        def core_detail():
+            with db_session() as session:
+                return queries.user_account(session, user_id, account_id)
+
+        def orm_listing():
+            with db_session() as session:
+                return serialize_accounts(session, session.query(Account).filter(Account.user_id == user_id).all())
+
+        def core_listing():
+            with db_session() as session:
+                return queries.user_accounts(session, user_id)
+
+        measure('orm detail', orm_detail, args.repeat)
+        measure('core detail', core_detail, args.repeat)
+        measure(f'orm listing ({args.accounts})', orm_listing, args.repeat)
+        measure(f'core listing ({args.accounts})', core_listing, args.repeat)
+
+        token = issue_token(user_id)
+        measure('GET /accounts/{id}', lambda: call('GET', f'/accounts/{account_id}', token=token), args.repeat)
+        measure('GET /accounts', lambda: call('GET', '/accounts', token=token), args.repeat)
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
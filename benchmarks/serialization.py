@@ -0,0 +1,38 @@
+"""
+Payload size and encode/decode time of the registered body codecs (JSON, MessagePack, CBOR)
+for an accounts listing and a single account response.
+Binary codecs are only registered when their package (msgpack, cbor2) is installed.
+
+    python -m benchmarks.serialization --accounts 100 --repeat 2000
+"""
+import argparse
+import timeit
+from decimal import Decimal
+
+from account_service.utils import available_codecs
+from account_service.account_app.models import Account
+
+
+def run(name: str, data, repeat: int):
+    for codec in available_codecs():
+        payload = codec.dumps(data)
+        encode = timeit.timeit(lambda: codec.dumps(data), number=repeat) / repeat
+        decode = timeit.timeit(lambda: codec.loads(payload), number=repeat) / repeat
+        print(f'{name:>8} {codec.media_type:<20} {len(payload):8d} bytes  '
+              f'encode {encode * 1e6:8.1f} us  decode {decode * 1e6:8.1f} us')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--accounts', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    # Same per-model serialization the views use
+    accounts = [Account('5d1b2c3a4e5f6a7b8c9d0e1f', balance=Decimal(i) / 7).to_dict() for i in range(args.accounts)]
+    run('listing', accounts, args.repeat)
+    run('account', accounts[0], args.repeat * 10)
+
+
+if __name__ == '__main__':
+    main()
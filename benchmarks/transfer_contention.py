@@ -0,0 +1,87 @@
+"""
+Concurrent transfers from many senders into a single receiver,
+regular receiver account vs. hot account with balance slots.
+
+    python -m benchmarks.transfer_contention --threads 8 --seconds 5 --slots 8
+"""
+import argparse
+import os
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+
+from benchmarks import setup_service, issue_token, call
+
+
+def create_funded_accounts(user_id: str, count: int, balance: Decimal):
+    from account_service.service import db_session
+    from account_service.account_app.models import Account
+
+    accounts = [Account(user_id, balance=balance) for _ in range(count)]
+    ids = [a.id for a in accounts]
+    with db_session() as session:
+        session.add_all(accounts)
+    return ids
+
+
+def run_scenario(name: str, threads: int, seconds: float, slots: int):
+    from account_service.service import db_session
+    from account_service.account_app.models import Account
+    from account_service.account_app.slots import set_hot_slots, visible_balance
+
+    receiver_id = create_funded_accounts(f'merchant-{name}', 1, Decimal('0'))[0]
+    if slots:
+        with db_session() as session:
+            set_hot_slots(session, session.query(Account).get(receiver_id), slots)
+
+    senders = create_funded_accounts(f'payer-{name}', threads, Decimal('1000000'))
+    token = issue_token(f'payer-{name}')
+    statuses = Counter()
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def _worker(sender_id):
+        local = Counter()
+        while time.monotonic() < deadline:
+            status, _, _ = call('POST', f'/accounts/{sender_id}/transfer', token=token,
+                                data={'receiver': receiver_id, 'amount': '1'})
+            local[status] += 1
+        with lock:
+            statuses.update(local)
+
+    workers = [threading.Thread(target=_worker, args=(sender,)) for sender in senders]
+    started = time.monotonic()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.monotonic() - started
+
+    with db_session() as session:
+        receiver_balance = visible_balance(session, session.query(Account).get(receiver_id))
+
+    total = sum(statuses.values())
+    succeeded = statuses[200]
+    print(f'{name:>8}: {total / elapsed:8.1f} req/s, {succeeded / elapsed:8.1f} transfers/s, '
+          f'conflict rate {statuses[409] / max(total, 1):6.1%}, statuses {dict(statuses)}')
+    assert receiver_balance == succeeded, f'Inconsistent balance {receiver_balance} != {succeeded}'
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--slots', type=int, default=8)
+    args = parser.parse_args()
+
+    path = setup_service()
+    try:
+        run_scenario('regular', args.threads, args.seconds, slots=0)
+        run_scenario('hot', args.threads, args.seconds, slots=args.slots)
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Optimistic vs. pessimistic transfer strategy at several contention levels.
+Every worker owns one sender account and transfers to a random receiver from a pool,
+the smaller the pool the higher the contention. Like a real client, a worker repeats
+a transfer that failed with 409 Conflict, latency is measured per completed transfer.
+
+    python -m benchmarks.transfer_strategies --threads 8 --seconds 5 --receivers 1,4,32
+"""
+import argparse
+import os
+import random
+import threading
+import time
+from decimal import Decimal
+
+from benchmarks import setup_service, issue_token, call
+from benchmarks.transfer_contention import create_funded_accounts
+
+
+MAX_ATTEMPTS = 100
+
+
+def percentile(values, p):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def run(strategy: str, threads: int, seconds: float, receivers_count: int):
+    from account_service.service import config
+
+    config.ACCOUNT_TRANSFER_STRATEGY = strategy
+    name = f'{strategy}-{receivers_count}'
+    receivers = create_funded_accounts(f'receiver-{name}', receivers_count, Decimal('0'))
+    senders = create_funded_accounts(f'sender-{name}', threads, Decimal('1000000'))
+    token = issue_token(f'sender-{name}')
+
+    latencies = []
+    attempts = []
+    failures = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def _worker(sender_id):
+        rnd = random.Random(sender_id)
+        local_latencies, local_attempts, local_failures = [], [], 0
+        while time.monotonic() < deadline:
+            receiver_id = rnd.choice(receivers)
+            started = time.perf_counter()
+            for attempt in range(1, MAX_ATTEMPTS + 1):
+                status, _, _ = call('POST', f'/accounts/{sender_id}/transfer', token=token,
+                                    data={'receiver': receiver_id, 'amount': '1'})
+                if status != 409:
+                    break
+            if status == 200:
+                local_latencies.append(time.perf_counter() - started)
+                local_attempts.append(attempt)
+            else:
+                local_failures += 1
+        with lock:
+            latencies.extend(local_latencies)
+            attempts.extend(local_attempts)
+            failures.append(local_failures)
+
+    workers = [threading.Thread(target=_worker, args=(sender,)) for sender in senders]
+    started = time.monotonic()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.monotonic() - started
+
+    completed = len(latencies)
+    print(f'{strategy:>11} receivers={receivers_count:<4} '
+          f'{completed / elapsed:8.1f} transfers/s  '
+          f'p50 {percentile(latencies, 50) * 1000:7.2f} ms  '
+          f'p99 {percentile(latencies, 99) * 1000:7.2f} ms  '
+          f'attempts/transfer {sum(attempts) / max(completed, 1):5.2f}  '
+          f'failed {sum(failures)}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--receivers', type=str, default='1,4,32',
+                        help='Comma separated receiver pool sizes (contention levels)')
+    args = parser.parse_args()
+
+    path = setup_service()
+    try:
+        for receivers_count in (int(r) for r in args.receivers.split(',')):
+            for strategy in ('optimistic', 'pessimistic'):
+                run(strategy, args.threads, args.seconds, receivers_count)
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 import pytest
 import json
+import uuid
 from decimal import Decimal
 from urllib.request import urlopen, Request, HTTPError
 from urllib.parse import urlencode
@@ -87,6 +88,11 @@ def get_user_token(email='user1@mail.mail', pwd='qweqwe'):
     return response.json()['access_token']
 
 
+def unique_email(name: str) -> str:
+    """ Email of a user that does not exist yet, for tests that assert all accounts of the user """
+    return f'{name}-{uuid.uuid4().hex[:12]}@mail'
+
+
 def create_account_and_get_id(token):
     response = request('/accounts', method='POST', auth_token=token)
     assert 201 == response.status
@@ -138,6 +144,8 @@ deposit_test_data = [
     (0, 400, 0),
     (-1, 400, 0),
     (0.00001, 200, 0),
+    ('NaN', 400, 0),
+    ('Infinity', 400, 0),
 ]
 
 
@@ -171,6 +179,25 @@ def test_transfer_between_own_accounts():
     assert_balance(account2, token1, 100)
 
 
+def test_pessimistic_transfer():
+    token1 = get_user_token('test_transfer@mail')
+    account1 = create_account_and_get_id(token1)
+    account2 = create_account_and_get_id(token1)
+    deposit(account1, token1, 1000)
+
+    strategy = config.ACCOUNT_TRANSFER_STRATEGY
+    config.ACCOUNT_TRANSFER_STRATEGY = 'pessimistic'
+    try:
+        assert transfer(account1, account2, token1, 100).status == 200
+        assert transfer(account2, account1, token1, 30).status == 200
+        assert transfer(account2, account1, token1, 71).status == 400
+        assert transfer(account1, 'completely invalid id', token1, 1).status == 400
+    finally:
+        config.ACCOUNT_TRANSFER_STRATEGY = strategy
+    assert_balance(account1, token1, 930)
+    assert_balance(account2, token1, 70)
+
+
 def test_fail_transfer_between_same_accounts():
     token1 = get_user_token('test_transfer@mail')
     account1 = create_account_and_get_id(token1)
@@ -180,6 +207,55 @@ def test_fail_transfer_between_same_accounts():
     assert_balance(account1, token1, 1000)
 
 
+def json_request(path: str, method: str, data, auth_token: str) -> Response:
+    return request(path, method=method, auth_token=auth_token, headers={'Content-Type': 'application/json'},
+                   data=json.dumps(data).encode('utf-8'))
+
+
+@pytest.mark.parametrize('amount,expected_code,expected_balance', [
+    (0.1, 200, '0.1'),
+    (100, 200, 100),
+    (None, 400, 0),
+    ([100], 400, 0),
+    ({'value': 100}, 400, 0),
+    (True, 400, 0),
+])
+def test_json_amounts(amount, expected_code, expected_balance):
+    token1 = get_user_token('test_transfer@mail')
+    account1 = create_account_and_get_id(token1)
+    account2 = create_account_and_get_id(token1)
+
+    response = json_request(f'/accounts/{account1}', 'PUT', {'amount': amount}, token1)
+    assert expected_code == response.status, response.body
+    assert_balance(account1, token1, expected_balance)
+
+    deposit(account2, token1, 1000)
+    response = json_request(f'/accounts/{account2}/transfer', 'POST', {'receiver': account1, 'amount': amount}, token1)
+    assert expected_code == response.status, response.body
+    assert_balance(account2, token1, Decimal(1000) - Decimal(expected_balance))
+
+
+@pytest.mark.parametrize('value', [1, [1], {'a': 1}, None])
+def test_json_string_arguments(value):
+    token = get_user_token('test_transfer@mail')
+    account1 = create_account_and_get_id(token)
+    deposit(account1, token, 1000)
+
+    response = json_request(f'/accounts/{account1}/transfer', 'POST', {'receiver': value, 'amount': 1}, token)
+    assert 400 == response.status, response.body
+    assert_balance(account1, token, 1000)
+
+    assert json_request('/auth', 'POST', {'email': value, 'password': 'qweqwe'}, None).status == 400
+    assert json_request('/auth', 'POST', {'email': 'test_transfer@mail', 'password': value}, None).status == 400
+
+
+@pytest.mark.parametrize('count,expected_code', [(2, 201), ('2', 201), (2.7, 400), (True, 400), ('2.7', 400)])
+def test_json_account_count(count, expected_code):
+    token = get_user_token(unique_email('test_count'))
+    assert json_request('/accounts', 'POST', {'count': count}, token).status == expected_code
+    assert len(request('/accounts', auth_token=token).json()) == (2 if expected_code == 201 else 0)
+
+
 def test_transfer_to_unknown():
     token1 = get_user_token('test_transfer@mail')
     account1 = create_account_and_get_id(token1)
@@ -211,6 +287,565 @@ def test_fail_transfer_when_target_is_too_rich():
     assert_balance(account2, token2, config.ACCOUNT_RECEIVER_MAX_AMOUNT + 1)
 
 
+def test_logout_revokes_token():
+    token = get_user_token('test_logout@mail')
+    assert request('/accounts', auth_token=token).status == 200
+
+    response = request('/auth', method='DELETE', auth_token=token)
+    assert response.status == 200, response.body
+    assert request('/accounts', auth_token=token).status == 401
+    assert request('/auth', method='DELETE', auth_token=token).status == 401
+
+    # Other tokens of the same user are not affected
+    assert request('/accounts', auth_token=get_user_token('test_logout@mail')).status == 200
+
+
+def test_accounts_summary():
+    token = get_user_token('test_summary@mail')
+    before = request('/accounts/summary', auth_token=token).json()
+
+    account1 = create_account_and_get_id(token)
+    account2 = create_account_and_get_id(token)
+    deposit(account1, token, 300)
+    deposit(account2, token, 100)
+    transfer(account1, account2, token, 50)
+
+    response = request('/accounts/summary', auth_token=token)
+    assert response.status == 200
+    summary = response.json()
+    assert summary['count'] == before['count'] + 2
+    assert Decimal(summary['total']) == Decimal(before['total']) + 400
+    assert Decimal(summary['max_balance']) >= Decimal(250)
+
+
+def test_balance_stream():
+    token = get_user_token('test_stream@mail')
+    account = create_account_and_get_id(token)
+
+    stream = urlopen(Request(f'http://{HOST}:{PORT}/accounts/stream',
+                             headers={'Authorization': f'Bearer {token}'}), timeout=10)
+    assert stream.status == 200
+    assert stream.headers['Content-Type'].startswith('text/event-stream')
+    assert stream.readline() == b': connected\n'
+
+    deposit(account, token, 100)
+    lines = []
+    while not lines or lines[-1] != b'\n':
+        line = stream.readline()
+        if line.startswith(b':') or (not lines and line == b'\n'):
+            continue
+        lines.append(line)
+    stream.close()
+
+    assert lines[0] == b'event: balance\n'
+    event = json.loads(lines[1][len(b'data: '):])
+    assert event['account'] == account
+    assert event['kind'] == 'deposit'
+    assert Decimal(event['balance']) == Decimal(100)
+
+
+def test_accounts_multi_get():
+    token = get_user_token('test_multi_get@mail')
+    foreign_account = create_account_and_get_id(get_user_token('test_multi_get2@mail'))
+    account1 = create_account_and_get_id(token)
+    account2 = create_account_and_get_id(token)
+    deposit(account2, token, 10)
+
+    ids = ','.join([account2, 'unknown', foreign_account, account1, account2])
+    response = request(f'/accounts?ids={ids}', auth_token=token)
+    assert response.status == 200
+    results = response.json()
+    assert [r['id'] for r in results] == [account2, 'unknown', foreign_account, account1]
+    assert [r['status'] for r in results] == [200, 404, 404, 200]
+    assert Decimal(results[0]['account']['balance']) == Decimal(10)
+
+    too_many = ','.join(str(i) for i in range(config.ACCOUNT_MULTI_GET_MAX_IDS + 1))
+    assert request(f'/accounts?ids={too_many}', auth_token=token).status == 400
+
+
+def test_create_accounts_bulk():
+    token = get_user_token(unique_email('test_bulk_create'))
+    response = request('/accounts', method='POST', auth_token=token, data={'count': 3})
+    assert response.status == 201
+    created = response.json()
+    assert len(created) == 3
+    assert len(set(a['id'] for a in created)) == 3
+    assert all(Decimal(a['balance']) == 0 for a in created)
+
+    accounts = request('/accounts', auth_token=token).json()
+    assert sorted(a['id'] for a in accounts) == sorted(a['id'] for a in created)
+    deposit(created[0]['id'], token, 10)
+
+    for count in (0, config.ACCOUNT_CREATE_MAX_COUNT + 1, 'many'):
+        assert request('/accounts', method='POST', auth_token=token, data={'count': count}).status == 400
+
+
+def test_msgpack_negotiation():
+    msgpack = pytest.importorskip('msgpack')
+    token = get_user_token(unique_email('test_msgpack'))
+    account_id = create_account_and_get_id(token)
+    headers = {'Accept': 'application/msgpack', 'Content-Type': 'application/msgpack'}
+
+    response = request(f'/accounts/{account_id}', method='PUT', auth_token=token, headers=dict(headers),
+                       data=msgpack.packb({'amount': '12.5'}))
+    assert response.status == 200
+    assert response.headers['Content-Type'] == 'application/msgpack'
+    assert Decimal(msgpack.unpackb(response.body, raw=False)['balance']) == Decimal('12.5')
+
+    response = request('/accounts', auth_token=token, headers={'Accept': 'application/msgpack'})
+    assert [a['id'] for a in msgpack.unpackb(response.body, raw=False)] == [account_id]
+
+    # JSON stays the default
+    response = request('/accounts', auth_token=token)
+    assert response.headers['Content-Type'].startswith('application/json')
+    assert response.json()[0]['id'] == account_id
+
+
+def test_gzip_compression():
+    import gzip
+    token = get_user_token(unique_email('test_gzip'))
+    request('/accounts', method='POST', auth_token=token, data={'count': 30})
+
+    response = request('/accounts', auth_token=token, headers={'Accept-Encoding': 'gzip'})
+    assert response.status == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert int(response.headers['Content-Length']) == len(response.body)
+    assert len(json.loads(gzip.decompress(response.body))) == 30
+
+    response = request('/accounts', auth_token=token)
+    assert 'Content-Encoding' not in response.headers
+    assert len(response.json()) == 30
+
+
+def test_accounts_export():
+    import csv
+    from account_service.auth_app.models import User, Role
+    from account_service.auth_app.views import create_access_token
+
+    token = get_user_token(unique_email('test_export'))
+    created = request('/accounts', method='POST', auth_token=token, data={'count': 3}).json()
+    deposit(created[0]['id'], token, 5)
+    other_account = create_account_and_get_id(get_user_token('test_export2@mail'))
+    created_ids = sorted(a['id'] for a in created)
+
+    response = request('/accounts/export', auth_token=token)
+    assert response.status == 200
+    assert response.headers['Content-Type'].startswith('text/csv')
+    rows = list(csv.DictReader(response.body.decode('utf-8').splitlines()))
+    assert [r['id'] for r in rows] == created_ids
+    assert Decimal(rows[created_ids.index(created[0]['id'])]['balance']) == Decimal(5)
+
+    response = request('/accounts/export?format=ndjson', auth_token=token)
+    assert response.headers['Content-Type'] == 'application/x-ndjson'
+    rows = [json.loads(line) for line in response.body.decode('utf-8').splitlines()]
+    assert [r['id'] for r in rows] == created_ids
+
+    response = request('/accounts/export?format=ndjson&updated_since=2100-01-01T00:00:00Z', auth_token=token)
+    assert response.status == 200 and response.body == b''
+
+    assert request('/accounts/export?format=xml', auth_token=token).status == 400
+    assert request('/accounts/export?updated_since=yesterday', auth_token=token).status == 400
+    other_user = rows[0]['user_id'] + 'x'
+    assert request(f'/accounts/export?user_id={other_user}', auth_token=token).status == 403
+
+    # Admins can export accounts of everybody
+    admin = User(email='test_export_admin@mail', role=Role.ADMIN, encrypted_password='')
+    admin.id = 'test_export_admin'
+    response = request('/accounts/export?format=ndjson', auth_token=create_access_token(admin))
+    ids = [json.loads(line)['id'] for line in response.body.decode('utf-8').splitlines()]
+    assert set(created_ids + [other_account]) <= set(ids)
+    response = request(f'/accounts/export?format=ndjson&user_id={rows[0]["user_id"]}',
+                       auth_token=create_access_token(admin))
+    assert [json.loads(line)['id'] for line in response.body.decode('utf-8').splitlines()] == created_ids
+
+    # Fixed size chunks
+    from account_service.account_app.export import export_accounts
+    chunks = list(export_accounts('csv', batch_size=2, chunk_size=100))
+    assert all(len(chunk) == 100 for chunk in chunks[:-1])
+    assert 0 < len(chunks[-1]) <= 100
+
+
+def test_server_timing_and_access_log(caplog):
+    import logging
+    token = get_user_token('test_timing@mail')
+    account_id = create_account_and_get_id(token)
+    assert 'Server-Timing' not in request(f'/accounts/{account_id}', auth_token=token).headers
+
+    config.SERVER_TIMING_ENABLED = True
+    config.ACCESS_LOG_ENABLED = True
+    try:
+        with caplog.at_level(logging.INFO, logger='account_service.access'):
+            response = request(f'/accounts/{account_id}', method='PUT', auth_token=token, data={'amount': 1})
+    finally:
+        config.SERVER_TIMING_ENABLED = False
+        config.ACCESS_LOG_ENABLED = False
+    assert response.status == 200
+    phases = [entry.split(';')[0] for entry in response.headers['Server-Timing'].split(', ')]
+    assert {'route', 'parse', 'db', 'encode', 'total'} <= set(phases)
+
+    lines = [json.loads(r.getMessage()) for r in caplog.records if r.name == 'account_service.access']
+    line = [l for l in lines if l['path'] == f'/accounts/{account_id}'][-1]
+    assert line['method'] == 'PUT' and line['status'] == 200
+    assert line['duration_ms'] > 0 and 'db' in line['timings']
+
+
+def test_query_instrumentation(caplog):
+    import logging
+    from account_service.utils import metrics
+    token = get_user_token('test_queries@mail')
+    account_id = create_account_and_get_id(token)
+
+    queries = metrics.get('db.queries')
+    budget, slow = config.DB_QUERY_BUDGET, config.DB_SLOW_QUERY_SECONDS
+    config.DB_QUERY_BUDGET, config.DB_SLOW_QUERY_SECONDS = 1, 0
+    config.ACCESS_LOG_ENABLED = True
+    try:
+        with caplog.at_level(logging.INFO):
+            response = request(f'/accounts/{account_id}', method='PUT', auth_token=token, data={'amount': 7})
+    finally:
+        config.DB_QUERY_BUDGET, config.DB_SLOW_QUERY_SECONDS = budget, slow
+        config.ACCESS_LOG_ENABLED = False
+    assert response.status == 200
+    assert metrics.get('db.queries') > queries
+
+    messages = [r.getMessage() for r in caplog.records]
+    assert any('exceeded query budget' in m for m in messages)
+    slow_queries = [m for m in messages if m.startswith('Slow query') and 'UPDATE account' in m]
+    assert slow_queries and "'str'" in slow_queries[0] and account_id not in slow_queries[0]
+
+    line = [json.loads(m) for m in messages if m.startswith('{') and account_id in m][-1]
+    assert line['queries'] >= 2 and line['query_ms'] > 0
+
+
+def test_fast_path_queries_match_orm():
+    from account_service.service import db_session
+    from account_service.account_app import queries
+    from account_service.account_app.models import Account
+    from account_service.account_app.slots import set_hot_slots, credit_slot, serialize_accounts
+
+    regular, hot = Account('test_fast_path', Decimal('10.5')), Account('test_fast_path', Decimal('1'))
+    hot_id = hot.id
+    with db_session() as session:
+        session.add_all([regular, hot])
+        session.flush()
+        set_hot_slots(session, hot, 2)
+    with db_session() as session:
+        hot = session.query(Account).get(hot_id)
+        credit_slot(session, hot, Decimal('2.25'))
+
+    with db_session() as session:
+        accounts = session.query(Account).filter(Account.user_id == 'test_fast_path').all()
+        expected = sorted(serialize_accounts(session, accounts), key=lambda a: a['id'])
+        assert sorted(queries.user_accounts(session, 'test_fast_path'), key=lambda a: a['id']) == expected
+        ids = [a['id'] for a in expected]
+        assert sorted(queries.user_accounts_by_ids(session, 'test_fast_path', ids + ['unknown']),
+                      key=lambda a: a['id']) == expected
+        for account in expected:
+            assert queries.user_account(session, 'test_fast_path', account['id']) == account
+        assert queries.user_account(session, 'another_user', ids[0]) is None
+    assert {Decimal(a['balance']) for a in expected} == {Decimal('10.5'), Decimal('3.25')}
+
+
+def test_read_replicas():
+    import os
+    from sqlalchemy import create_engine
+    from account_service import service
+    from account_service.models import BaseModel
+    from account_service.account_app.models import tables as account_tables
+
+    token = get_user_token(unique_email('test_replicas'))
+    account_id = create_account_and_get_id(token)
+    user_id = request(f'/accounts/{account_id}', auth_token=token).json()['user_id']
+
+    # Replica without any data: reads served by it come back empty
+    replica_path = 'test_replica.db'
+    BaseModel.metadata.create_all(create_engine(f'sqlite:///{replica_path}'), tables=account_tables)
+    config.DATABASE_REPLICA_URIS = f'sqlite:///{replica_path}'
+    service.configure_replicas()
+    try:
+        assert request('/accounts', auth_token=token).json() == []
+        # An account missing in the lagging replica is looked up in the primary (and not cached as missing)
+        assert request(f'/accounts/{account_id}', auth_token=token).status == 200
+
+        # Read-your-writes: after a write reads of the user go to the primary
+        create_account_and_get_id(token)
+        assert len(request('/accounts', auth_token=token).json()) == 2
+        service._recent_writers.delete(user_id)
+        assert request('/accounts', auth_token=token).json() == []
+
+        # No healthy replicas: fall back to the primary, health check brings the replica back
+        replica = service._replicas.replicas[0]
+        service._replicas.mark_unhealthy(replica, Exception('test'))
+        assert len(request('/accounts', auth_token=token).json()) == 2
+        service._replicas.check()
+        assert replica.healthy
+        assert request('/accounts', auth_token=token).json() == []
+    finally:
+        config.DATABASE_REPLICA_URIS = ''
+        service.configure_replicas()
+        os.remove(replica_path)
+    assert len(request('/accounts', auth_token=token).json()) == 2
+    assert request(f'/accounts/{account_id}', auth_token=token).status == 200
+
+
+def test_sharded_accounts():
+    import os
+    from account_service import service
+    from account_service.auth_app.auth import get_user_from_token
+    from account_service.account_app.models import Account, TransferOutbox, TransferInbox
+    from account_service.account_app.transfers import deliver_transfer, relay_pending_transfers
+    from account_service.account_app.rebalance import rebalance_accounts
+    from account_service.sharding import shard_index
+
+    shard_paths = ['test_shard0.db', 'test_shard1.db']
+    shard_uris = [f'sqlite:///{path}' for path in shard_paths]
+
+    def _configure_shards(uris):
+        config.DATABASE_SHARD_URIS = ','.join(uris)
+        service.configure_shards()
+        service.create_tables()
+
+    def _shard_of(account_id):
+        for shard in range(2):
+            with service.db_session(shard=shard) as session:
+                if session.query(Account).get(account_id) is not None:
+                    return shard
+
+    # Users are placed by a stable hash of their ids
+    users = {}
+    for i in range(20):
+        token = get_user_token(f'test_shard{i}@mail')
+        users.setdefault(shard_index(get_user_from_token(token)['id'], 2), token)
+        if len(users) == 2:
+            break
+    token1, token2 = users[0], users[1]
+
+    # Single shard first, the second one is added and accounts are rebalanced
+    _configure_shards(shard_uris[:1])
+    try:
+        account1 = create_account_and_get_id(token1)
+        account2 = create_account_and_get_id(token2)
+        assert deposit(account1, token1, 100).status == 200
+        _configure_shards(shard_uris)
+        # Accounts of the other tests stay in test.db
+        assert rebalance_accounts(include_database_uri=False) == {(0, 1): 1}
+        assert rebalance_accounts(include_database_uri=False) == {}
+        assert (_shard_of(account1), _shard_of(account2)) == (0, 1)
+        assert_balance(account1, token1, 100)
+        assert [a['id'] for a in request('/accounts', auth_token=token2).json()] == [account2]
+
+        # The source is looked up in the shard of the requester, a miss there is not cached for the owner
+        assert transfer(account1, account2, token2, 30).status == 404
+        assert transfer(account2, account1, token1, 30).status == 404
+
+        # Cross-shard transfer: debit and outbox in shard 0, credit and inbox in shard 1
+        response = transfer(account1, account2, token1, 30)
+        assert response.status == 200
+        transfer_id = response.json()['transfer']
+        assert_balance(account1, token1, 70)
+        assert_balance(account2, token2, 30)
+        with service.db_session(shard=0) as session:
+            assert session.query(TransferOutbox).get(transfer_id).state == TransferOutbox.DELIVERED
+        with service.db_session(shard=1) as session:
+            assert session.query(TransferInbox).get(transfer_id) is not None
+        assert transfer(account2, account1, token2, 31).status == 400
+
+        # Delivery is idempotent: a pending transfer is credited once however many times it is relayed
+        with service.db_session(shard=1) as session:
+            outbox = TransferOutbox(account2, account1, Decimal('5'))
+            session.add(outbox)
+            pending_id = outbox.id
+        assert Decimal(request('/accounts/summary', auth_token=token1).json()['total']) == 70
+        assert relay_pending_transfers() == 1
+        assert Decimal(request('/accounts/summary', auth_token=token1).json()['total']) == 75
+        assert relay_pending_transfers() == 0
+        assert deliver_transfer(pending_id, 1) == TransferOutbox.DELIVERED
+        assert_balance(account1, token1, 75)
+    finally:
+        config.DATABASE_SHARD_URIS = ''
+        service.configure_shards()
+        for path in shard_paths:
+            os.remove(path)
+
+
+def test_import_users(tmp_path):
+    import bcrypt
+    from account_service.auth_app.importer import import_users
+
+    skipped, imported1, imported2, existing, invalid = (unique_email(f'test_import_{name}') for name in
+                                                        ['skipped', '1', '2', 'existing', 'invalid'])
+    get_user_token(existing, 'existing')
+    pre_hashed = bcrypt.hashpw(b'hashed', bcrypt.gensalt(4)).decode('ascii')
+    path = tmp_path / 'users.ndjson'
+    path.write_text('\n'.join(json.dumps(record) for record in [
+        {'email': skipped, 'password': 'skipped'},
+        {'email': imported1, 'password': 'plain'},
+        {'email': imported2, 'password_hash': pre_hashed, 'role': 'admin'},
+        {'email': existing, 'password': 'other'},
+        {'email': imported1, 'password': 'duplicate'},
+        {'email': invalid},
+    ]))
+    # Resumes after the first record (imported by a previous interrupted run)
+    (tmp_path / 'users.ndjson.progress').write_text(json.dumps({'records': 1}))
+
+    progress = []
+    stats = import_users(str(path), batch_size=2, workers=2, rounds=4, progress=lambda s: progress.append(dict(s)))
+    assert (stats['processed'], stats['imported'], stats['skipped']) == (6, 2, 3)
+    assert [s['processed'] for s in progress] == [3, 5, 6]
+    assert not (tmp_path / 'users.ndjson.progress').exists()
+
+    assert request('/auth', method='POST', data={'email': imported1, 'password': 'plain'}).status == 200
+    assert request('/auth', method='POST', data={'email': imported2, 'password': 'hashed'}).status == 200
+    assert request('/auth', method='POST', data={'email': existing, 'password': 'existing'}).status == 200
+    assert request('/auth', method='POST', data={'email': skipped, 'password': 'skipped'}).status == 201
+
+
+def test_seed_dataset():
+    import time
+    from collections import Counter
+    from itertools import islice
+    from account_service.seed import seed_dataset, iter_accounts, user_id, SEED_PASSWORD
+
+    assert list(islice(iter_accounts(7, 1000, 50, 0), 100)) == list(islice(iter_accounts(7, 1000, 50, 0), 100))
+    assert list(islice(iter_accounts(7, 1000, 50, 0), 100)) != list(islice(iter_accounts(8, 1000, 50, 0), 100))
+    assert list(islice(iter_accounts(7, 1000, 50, 0), 100)) != list(islice(iter_accounts(7, 1000, 50, 1), 100))
+
+    # Emails of a seed are unique, every run of the test uses another one
+    seed = uuid.uuid4().int % 10 ** 9
+    stats = seed_dataset(50, 1000, seed=seed, hot=2, batch_size=300)
+    assert (stats['users'], stats['accounts'], len(stats['hot'])) == (50, 1000, 2)
+    assert stats['slots'] == 2 * int(config.ACCOUNT_HOT_SLOTS)
+    assert abs(stats['base_time'] - time.time()) < 60
+
+    # Skewed: the first user owns a large share of accounts
+    base_time = stats['base_time']
+    owners = Counter(owner for _, owner, *_ in iter_accounts(seed, 1000, 50, base_time, hot=2))
+    assert set(owners) <= {user_id(seed, index, base_time) for index in range(50)}
+    assert owners[user_id(seed, 0, base_time)] > 1000 / 50 * 5
+
+    response = request('/auth', method='POST', data={'email': f'seed{seed}-user0@example.com',
+                                                     'password': SEED_PASSWORD})
+    assert response.status == 200
+    token = response.json()['access_token']
+    accounts = request('/accounts', auth_token=token).json()
+    assert len(accounts) == owners[user_id(seed, 0, base_time)]
+    # Ids are newer than the scans of the account filter, accounts are found without a restart
+    assert request(f'/accounts/{accounts[0]["id"]}', auth_token=token).status == 200
+
+
+def test_seed_restores_sqlite_durability(tmp_path):
+    from sqlalchemy import create_engine, event
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import QueuePool
+    from account_service import service
+    from account_service.seed import _fast_sqlite
+
+    # A single pooled connection, as the service's engines pool them
+    engine = create_engine(f'sqlite:///{tmp_path / "seed.db"}', poolclass=QueuePool, pool_size=1, max_overflow=0)
+    event.listen(engine, 'checkin', service._reset_connection_settings)
+    session = sessionmaker(bind=engine)()
+    _fast_sqlite(session)
+    assert session.execute('PRAGMA synchronous').scalar() == 0
+    session.close()
+
+    with engine.connect() as connection:
+        assert connection.execute('PRAGMA synchronous').scalar() == 2
+        assert connection.execute('PRAGMA journal_mode').scalar() == 'delete'
+
+
+def test_admin_memory_diagnostics():
+    from account_service.auth_app.models import User, Role
+    from account_service.auth_app.views import create_access_token
+
+    admin = User(email='test_memory_admin@mail', role=Role.ADMIN, encrypted_password='')
+    admin.id = 'test_memory_admin'
+    admin_token = create_access_token(admin)
+    token = get_user_token('test_memory@mail')
+
+    assert request('/admin/memory', auth_token=token).status == 403
+    assert request('/admin/memory/start', method='POST', auth_token=token).status == 403
+    assert request('/admin/memory').status == 401
+
+    assert request('/admin/memory/baseline', method='POST', auth_token=admin_token).status == 409
+    for frames in (0, -1, 65536, 'all'):
+        assert request('/admin/memory/start', method='POST', auth_token=admin_token,
+                       data={'frames': frames}).status == 400
+    try:
+        response = request('/admin/memory/start', method='POST', auth_token=admin_token, data={'frames': 2})
+        assert response.status == 200 and response.json()['tracing']
+        assert request('/admin/memory/baseline', method='POST', auth_token=admin_token).json()['baseline']
+        create_account_and_get_id(token)
+
+        response = request('/admin/memory?limit=5&group_by=traceback', auth_token=admin_token)
+        assert response.status == 200
+        result = response.json()
+        assert result['frames'] == 2 and 0 < len(result['top']) <= 5
+        assert {'location', 'size_kb', 'size_diff_kb', 'count_diff', 'traceback'} <= set(result['top'][0])
+        assert request('/admin/memory?group_by=module', auth_token=admin_token).status == 400
+        assert request('/admin/memory?limit=0', auth_token=admin_token).status == 400
+    finally:
+        response = request('/admin/memory/stop', method='POST', auth_token=admin_token)
+    assert response.status == 200 and not response.json()['tracing']
+
+
+def test_hot_account_transfers():
+    from account_service.service import db_session
+    from account_service.account_app.models import Account
+    from account_service.account_app.slots import set_hot_slots
+
+    token1 = get_user_token('test_hot@mail')
+    token2 = get_user_token('test_hot2@mail')
+    account1 = create_account_and_get_id(token1)
+    hot_account = create_account_and_get_id(token2)
+    deposit(account1, token1, 1000)
+    deposit(hot_account, token2, 10)
+    with db_session() as session:
+        set_hot_slots(session, session.query(Account).get(hot_account), 4)
+
+    for _ in range(5):
+        assert transfer(account1, hot_account, token1, 100).status == 200
+    assert_balance(hot_account, token2, 510)
+    assert_balance(account1, token1, 500)
+
+    # Debit of a hot account sweeps its slots
+    assert transfer(hot_account, account1, token2, 505).status == 200
+    assert_balance(hot_account, token2, 5)
+    assert_balance(account1, token1, 1005)
+    assert transfer(hot_account, account1, token2, 6).status == 400
+
+
+def test_request_deadline_from_header():
+    token = get_user_token('test_accounts@mail')
+    response = request('/accounts', auth_token=token, headers={'X-Request-Timeout': '0.000001'})
+    assert response.status == 504
+    response = request('/accounts', auth_token=token, headers={'X-Request-Timeout': '5'})
+    assert response.status == 200
+
+
+def test_account_id_filter():
+    from account_service.service import db_session
+    from account_service.account_app.models import Account
+    from account_service.account_app.existence import AccountIdFilter
+
+    old_account = Account('test_filter_user')
+    old_account.id = '00000001' + old_account.id[8:]  # Created long ago
+    old_account_id = old_account.id
+    with db_session() as session:
+        session.add(old_account)
+
+    account_filter = AccountIdFilter(capacity=1000, error_rate=0.001)
+    assert account_filter.might_exist('anything')
+    account_filter.build()
+    assert account_filter.might_exist(old_account_id)
+    assert not account_filter.might_exist('00000002' + old_account_id[8:])
+    assert not account_filter.might_exist('completely invalid id')
+
+    # Recent ids might have been created by other processes after the scan
+    token = get_user_token('test_filter@mail')
+    assert account_filter.might_exist(create_account_and_get_id(token))
+
+
 def test_accounts():
     token = get_user_token('test_accounts@mail')
     response = request('/accounts', auth_token=token)
@@ -0,0 +1,14 @@
+from account_service.utils import BloomFilter
+
+
+def test_bloom_has_no_false_negatives():
+    keys = [f'key-{i}' for i in range(1000)]
+    bloom = BloomFilter.from_iterable(keys, capacity=1000, error_rate=0.01)
+    assert len(bloom) == 1000
+    assert all(key in bloom for key in keys)
+
+
+def test_bloom_false_positive_rate():
+    bloom = BloomFilter.from_iterable((f'key-{i}' for i in range(1000)), capacity=1000, error_rate=0.01)
+    false_positives = sum(1 for i in range(10000) if f'other-{i}' in bloom)
+    assert false_positives < 10000 * 0.03
@@ -0,0 +1,77 @@
+import threading
+import time
+
+import pytest
+
+from account_service.utils import Bulkhead, HttpError, Router, Request, JsonResponse, ChunkedResponse
+
+
+def test_concurrency_and_queue_limits():
+    bulkhead = Bulkhead('test', max_concurrent=1, max_queue=1, queue_timeout=5)
+    bulkhead.acquire()
+
+    acquired = threading.Event()
+
+    def _waiter():
+        bulkhead.acquire()
+        acquired.set()
+
+    waiter = threading.Thread(target=_waiter)
+    waiter.start()
+    while bulkhead.waiting == 0:
+        time.sleep(0.001)
+
+    # Queue is full: rejected immediately
+    started = time.monotonic()
+    with pytest.raises(HttpError) as error:
+        bulkhead.acquire()
+    assert error.value.status_code == 503
+    assert time.monotonic() - started < 1
+
+    bulkhead.release()
+    assert acquired.wait(5)
+    waiter.join()
+    assert bulkhead.active == 1 and bulkhead.waiting == 0
+    bulkhead.release()
+    assert bulkhead.active == 0
+
+
+def test_queue_timeout():
+    bulkhead = Bulkhead('test', max_concurrent=1, max_queue=5, queue_timeout=0.05)
+    bulkhead.acquire()
+    with pytest.raises(HttpError):
+        bulkhead.acquire()
+    assert bulkhead.waiting == 0
+
+    # Deadline of the request is shorter than the queue timeout
+    bulkhead = Bulkhead('test', max_concurrent=1, max_queue=5, queue_timeout=10)
+    bulkhead.acquire()
+    started = time.monotonic()
+    with pytest.raises(HttpError):
+        bulkhead.acquire(timeout=0.01)
+    assert time.monotonic() - started < 1
+
+
+def test_router_releases_slots():
+    bulkhead = Bulkhead('test', max_concurrent=1)
+    router = Router()
+    router.add_route('^/json$', lambda request: JsonResponse({}), bulkhead=bulkhead)
+    router.add_route('^/stream$', lambda request: ChunkedResponse(iter([b'data'])), bulkhead=bulkhead)
+    router.add_route('^/error$', lambda request: 1 / 0, bulkhead=bulkhead)
+
+    router.dispatch('/json', Request({}))
+    assert bulkhead.active == 0
+    with pytest.raises(ZeroDivisionError):
+        router.dispatch('/error', Request({}))
+    assert bulkhead.active == 0
+
+    # Streams keep the slot until they are sent
+    response = router.dispatch('/stream', Request({}))
+    assert bulkhead.active == 1
+    with pytest.raises(HttpError):
+        router.dispatch('/json', Request({}))
+    assert b''.join(response) == b'data'
+    response.close()
+    assert bulkhead.active == 0
+    response.close()
+    assert bulkhead.active == 0
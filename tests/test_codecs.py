@@ -0,0 +1,65 @@
+from decimal import Decimal
+
+import pytest
+
+from account_service.utils import Codec, JSON_CODEC, JsonResponse, negotiate_codec, get_codec, register_codec, \
+    unregister_codec
+from account_service.account_app.models import Account
+
+
+def test_json_is_default():
+    assert negotiate_codec(None) is JSON_CODEC
+    assert negotiate_codec('') is JSON_CODEC
+    assert negotiate_codec('*/*') is JSON_CODEC
+    assert negotiate_codec('text/html, application/xml;q=0.9') is JSON_CODEC
+
+
+def test_get_codec():
+    assert get_codec('application/json; charset=utf-8') is JSON_CODEC
+    assert get_codec('application/x-www-form-urlencoded') is None
+    assert get_codec(None) is None
+
+
+def test_negotiate_by_quality():
+    codec = Codec('application/x-test', dumps=lambda data: repr(data).encode(), loads=lambda data: data)
+    register_codec(codec)
+    try:
+        assert negotiate_codec('application/x-test') is codec
+        assert negotiate_codec('application/json, application/x-test') is JSON_CODEC
+        assert negotiate_codec('application/json;q=0.5, application/x-test') is codec
+        assert negotiate_codec('application/x-test;q=0, */*') is JSON_CODEC
+    finally:
+        unregister_codec(codec.media_type)
+    assert get_codec('application/x-test') is None
+
+
+def test_model_serialization():
+    account = Account('user', balance=Decimal('10.5'))
+    data = JSON_CODEC.loads(JSON_CODEC.dumps({'account': account, 'total': Decimal('1.25')}))
+    assert data == {'account': account.to_dict(), 'total': '1.25'}
+
+
+@pytest.mark.parametrize('module,media_type', [('msgpack', 'application/msgpack'), ('cbor2', 'application/cbor')])
+def test_binary_codecs(module, media_type):
+    pytest.importorskip(module)
+    codec = get_codec(media_type)
+    data = [Account('user', balance=Decimal('1')), {'total': Decimal('2')}]
+    account, totals = codec.loads(codec.dumps(data))
+    assert account == data[0].to_dict()
+    assert Decimal(totals['total']) == Decimal('2')  # CBOR has a native decimal type
+    assert negotiate_codec(f'{media_type}, application/json;q=0.9') is codec
+
+
+def test_response_negotiation():
+    pytest.importorskip('msgpack')
+
+    class _Request(object):
+        def get_header_value(self, name, default=None):
+            return {'Accept': 'application/msgpack'}.get(name, default)
+
+    response = JsonResponse({'balance': Decimal('1.5')})
+    response.negotiate(_Request())
+    headers = dict(response.headers_as_tuples())
+    assert headers['Content-Type'] == 'application/msgpack'
+    assert int(headers['Content-Length']) == len(response.body)
+    assert get_codec('application/msgpack').loads(b''.join(response)) == {'balance': '1.5'}
@@ -0,0 +1,63 @@
+import io
+import gzip
+import zlib
+
+from account_service.utils import JsonResponse, StreamedResponse, EventStreamResponse, Response, \
+    accepts_gzip, compress_response
+
+
+def test_accepts_gzip():
+    assert accepts_gzip('gzip, deflate, br')
+    assert accepts_gzip('*')
+    assert not accepts_gzip(None)
+    assert not accepts_gzip('identity')
+    assert not accepts_gzip('gzip;q=0, *')
+    assert accepts_gzip('br;q=1.0, gzip;q=0.8')
+
+
+def test_compress_buffered():
+    data = [{'id': str(i), 'balance': '0'} for i in range(100)]
+    response = compress_response(JsonResponse(data), 'gzip', min_size=1024)
+    headers = dict(response.headers_as_tuples())
+    body = b''.join(response)
+    assert headers['Content-Encoding'] == 'gzip'
+    assert headers['Vary'].endswith('Accept-Encoding')
+    assert int(headers['Content-Length']) == len(body)
+    assert JsonResponse(data).body == gzip.decompress(body)
+
+
+def test_small_and_not_accepted_are_not_compressed():
+    small = JsonResponse({'message': 'ok'})
+    assert compress_response(small, 'gzip', min_size=1024) is small
+    assert 'Accept-Encoding' in small.headers['Vary']
+
+    large = JsonResponse(['x' * 10] * 1000)
+    assert compress_response(large, None, min_size=1024) is large
+    assert 'Content-Encoding' not in large.headers
+
+
+def test_incompressible_type_is_skipped():
+    response = Response(b'\0' * 4096, content_type='image/png')
+    assert compress_response(response, 'gzip', min_size=1024) is response
+    assert 'Vary' not in response.headers
+
+
+def test_compress_stream():
+    content = b'{"a": 1}\n' * 10000
+    response = compress_response(StreamedResponse(io.BytesIO(content), content_type='application/x-ndjson'), 'gzip')
+    headers = dict(response.headers_as_tuples())
+    assert 'Content-Length' not in headers
+    assert headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(b''.join(response)) == content
+    response.close()
+
+
+def test_event_stream_chunks_are_flushed():
+    response = compress_response(EventStreamResponse(iter([('balance', {'balance': '1'}), None])), 'gzip')
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    chunks = iter(response)
+    # Every event can be decoded by the client as soon as its chunk arrives
+    assert decompressor.decompress(next(chunks)) == b': connected\n\n'
+    assert decompressor.decompress(next(chunks)).startswith(b'event: balance\n')
+    assert decompressor.decompress(next(chunks)) == b': heartbeat\n\n'
+    response.close()
@@ -0,0 +1,103 @@
+import os
+from email.utils import formatdate
+
+import pytest
+
+from account_service.utils import FileResponse
+
+
+class _Request(object):
+    def __init__(self, method='GET', **headers):
+        self.method = method
+        self._headers = {k.lower().replace('_', '-'): v for k, v in headers.items()}
+
+    def get_header_value(self, name, default=None):
+        return self._headers.get(name.lower(), default)
+
+
+CONTENT = bytes(range(256)) * 1024
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / 'statement.bin')
+    with open(path, 'wb') as f:
+        f.write(CONTENT)
+    return path
+
+
+def _send(response: FileResponse, request: _Request):
+    response.negotiate(request)
+    headers = dict(response.headers_as_tuples())
+    body = b''.join(response)
+    response.close()
+    return response.status, headers, body
+
+
+def test_whole_file(path):
+    status, headers, body = _send(FileResponse(path, chunk_size=1000), _Request())
+    assert status == 200
+    assert body == CONTENT
+    assert int(headers['Content-Length']) == len(CONTENT)
+    assert headers['Accept-Ranges'] == 'bytes'
+    assert headers['Content-Type'] == 'application/octet-stream'
+
+
+@pytest.mark.parametrize('header,start,end', [
+    ('bytes=0-99', 0, 99),
+    ('bytes=1000-', 1000, len(CONTENT) - 1),
+    ('bytes=-500', len(CONTENT) - 500, len(CONTENT) - 1),
+    ('bytes=100-99999999', 100, len(CONTENT) - 1),
+])
+def test_range(path, header, start, end):
+    status, headers, body = _send(FileResponse(path, chunk_size=4096), _Request(Range=header))
+    assert status == 206
+    assert body == CONTENT[start:end + 1]
+    assert int(headers['Content-Length']) == end - start + 1
+    assert headers['Content-Range'] == f'bytes {start}-{end}/{len(CONTENT)}'
+
+
+def test_unsatisfiable_and_ignored_ranges(path):
+    status, headers, body = _send(FileResponse(path), _Request(Range=f'bytes={len(CONTENT)}-'))
+    assert status == 416
+    assert headers['Content-Range'] == f'bytes */{len(CONTENT)}'
+    assert body == b''
+
+    # Multiple and malformed ranges are ignored
+    for header in ('bytes=0-1,5-6', 'bytes=abc', 'items=0-1'):
+        status, _, body = _send(FileResponse(path), _Request(Range=header))
+        assert status == 200
+        assert body == CONTENT
+
+
+def test_if_modified_since(path):
+    modified = int(os.stat(path).st_mtime)
+    status, headers, body = _send(FileResponse(path), _Request(If_Modified_Since=formatdate(modified, usegmt=True)))
+    assert status == 304
+    assert body == b''
+    assert 'Content-Length' not in headers
+
+    status, _, body = _send(FileResponse(path), _Request(If_Modified_Since=formatdate(modified - 10, usegmt=True)))
+    assert status == 200
+    assert body == CONTENT
+
+
+def test_file_wrapper(path):
+    wrapped = []
+
+    def file_wrapper(f, block_size):
+        wrapped.append((f, block_size))
+        return iter([f.read()])
+
+    response = FileResponse(path)
+    response.negotiate(_Request())
+    assert list(response.wsgi_body({'wsgi.file_wrapper': file_wrapper})) == [CONTENT]
+    assert wrapped[0][1] == response.chunk_size
+    response.close()
+
+    # Ranges are sent by the response itself
+    response = FileResponse(path)
+    response.negotiate(_Request(Range='bytes=0-9'))
+    assert response.wsgi_body({'wsgi.file_wrapper': file_wrapper}) is response
+    assert b''.join(response) == CONTENT[:10]
+    response.close()
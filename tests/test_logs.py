@@ -0,0 +1,90 @@
+import logging
+import queue
+import threading
+from logging.handlers import QueueListener
+
+from account_service.utils import DroppingQueueHandler, metrics
+
+
+class _ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(self.format(record))
+
+
+def _logger(name: str, handler: logging.Handler) -> logging.Logger:
+    logger = logging.getLogger(name)
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+def test_full_queue_drops_records_and_reports_them():
+    records = queue.Queue(maxsize=2)
+    logger = _logger('test_logs.drop', DroppingQueueHandler(records))
+    dropped_before = metrics.get('logging.dropped')
+
+    for i in range(5):
+        logger.info('record %d', i)
+    assert records.qsize() == 2
+    assert metrics.get('logging.dropped') - dropped_before == 3
+
+    assert [records.get_nowait().getMessage() for _ in range(2)] == ['record 0', 'record 1']
+    logger.info('record %d', 5)
+    report, record = records.get_nowait(), records.get_nowait()
+    assert report.levelno == logging.WARNING
+    assert report.getMessage() == 'Dropped 3 log records, logging queue is full'
+    assert record.getMessage() == 'record 5'
+
+
+def test_records_are_formatted_by_listener():
+    formatted_in = []
+
+    class _Argument(str):
+        def __str__(self):
+            formatted_in.append(threading.current_thread())
+            return 'argument'
+
+    records = queue.Queue(maxsize=100)
+    output = _ListHandler()
+    listener = QueueListener(records, output)
+    logger = _logger('test_logs.listener', DroppingQueueHandler(records))
+    listener.start()
+    try:
+        logger.info('message with %s', _Argument('argument'))
+        logger.debug('disabled %s', _Argument('argument'))
+    finally:
+        listener.stop()
+
+    assert output.messages == ['message with argument']
+    # Once, in the listener thread; disabled records are not formatted at all
+    assert len(formatted_in) == 1 and formatted_in[0] is not threading.current_thread()
+
+
+def test_records_with_objects_are_formatted_when_logged():
+    class _Instance(object):
+        # Like an ORM instance that can not be loaded once its session is closed
+        closed = False
+
+        def __str__(self):
+            if self.closed:
+                raise RuntimeError('Instance is detached')
+            return 'instance'
+
+    records = queue.Queue(maxsize=100)
+    logger = _logger('test_logs.objects', DroppingQueueHandler(records))
+    instance, values = _Instance(), [1]
+    logger.info('%s %s %s', instance, 'text', 2)
+    logger.info('values %s', values)
+    logger.info('plain %s %d', 'text', 2)
+    instance.closed = True
+    values.append(2)
+
+    objects, mutable, plain = [records.get_nowait() for _ in range(3)]
+    assert (objects.getMessage(), objects.args) == ('instance text 2', None)
+    assert (mutable.getMessage(), mutable.args) == ('values [1]', None)
+    assert plain.args == ('text', 2)
@@ -0,0 +1,24 @@
+from account_service.utils import Hub
+
+
+def test_publish_to_subscribed_topics_only():
+    hub = Hub()
+    with hub.subscribe(['user1']) as subscription:
+        assert hub.publish('user1', 'event') == 1
+        assert hub.publish('user2', 'other') == 0
+        assert subscription.get(timeout=0) == 'event'
+        assert subscription.get(timeout=0) is None
+    assert hub.subscribers_count('user1') == 0
+
+
+def test_slow_subscriber_is_dropped():
+    hub = Hub()
+    slow = hub.subscribe(['user1'], max_size=2)
+    fast = hub.subscribe(['user1'], max_size=10)
+    for i in range(3):
+        hub.publish('user1', i)
+        assert fast.get(timeout=0) == i
+
+    assert slow.dropped
+    assert not fast.dropped
+    assert hub.subscribers_count('user1') == 1
@@ -0,0 +1,48 @@
+from decimal import Decimal
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from account_service import service
+from account_service.models import BaseModel
+from account_service.account_app.models import Account, AccountSlot, tables as account_tables
+from account_service.account_app.rebalance import rebalance_accounts
+
+
+def test_rebalance_drains_database_uri(tmp_path, monkeypatch):
+    # Accounts created before sharding was enabled stay in DATABASE_URI until they are rebalanced
+    primary = create_engine(f'sqlite:///{tmp_path / "primary.db"}')
+    BaseModel.metadata.create_all(primary, tables=account_tables)
+    monkeypatch.setattr(service, '_Session', scoped_session(sessionmaker(bind=primary)))
+    with service.db_session() as session:
+        accounts = [Account(f'user{i}', balance=Decimal(i)) for i in range(10)]
+        session.add_all(accounts)
+        session.flush()
+        session.add(AccountSlot(accounts[0].id, 0, Decimal('5')))
+        owners = {account.id: account.user_id for account in accounts}
+        hot_id = accounts[0].id
+
+    shard_uris = [f'sqlite:///{tmp_path / f"shard{i}.db"}' for i in range(2)]
+    for uri in shard_uris:
+        BaseModel.metadata.create_all(create_engine(uri), tables=account_tables)
+    monkeypatch.setattr(service.config, 'DATABASE_SHARD_URIS', ','.join(shard_uris))
+    service.configure_shards()
+    try:
+        moved = rebalance_accounts(batch_size=3)
+        assert set(moved) <= {(None, 0), (None, 1)}
+        assert sum(moved.values()) == 10
+        assert rebalance_accounts() == {}
+
+        with service.db_session() as session:
+            assert session.query(Account).count() == 0
+            assert session.query(AccountSlot).count() == 0
+        for account_id, user_id in owners.items():
+            with service.db_session(shard_key=user_id) as session:
+                account = session.query(Account).get(account_id)
+                assert account.user_id == user_id
+                assert account.balance == Decimal(user_id[len('user'):])
+        with service.db_session(shard_key='user0') as session:
+            assert session.query(AccountSlot).get((hot_id, 0)).balance == 5
+    finally:
+        monkeypatch.undo()
+        service.configure_shards()
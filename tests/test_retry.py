@@ -0,0 +1,69 @@
+import sqlite3
+import pytest
+from sqlalchemy.exc import OperationalError, IntegrityError
+
+from account_service.service import retry_transaction, is_transient_db_error
+from account_service.utils import RetryPolicy, HttpError, Status
+
+
+def locked_error():
+    return OperationalError('UPDATE account', {}, sqlite3.OperationalError('database is locked'))
+
+
+def failing(errors):
+    calls = []
+
+    def _fn():
+        calls.append(1)
+        if errors:
+            raise errors.pop(0)
+        return 'ok'
+    return _fn, calls
+
+
+def test_transient_error_classification():
+    assert is_transient_db_error(locked_error())
+    assert not is_transient_db_error(IntegrityError('INSERT', {}, sqlite3.IntegrityError('UNIQUE failed')))
+    assert not is_transient_db_error(ValueError('database is locked'))
+
+
+def test_lost_connection_is_retried_for_idempotent_work_only():
+    # The transaction may have been committed before the connection was lost
+    lost = OperationalError('COMMIT', {}, Exception('server closed the connection unexpectedly'))
+    invalidated = OperationalError('COMMIT', {}, Exception('terminated'), connection_invalidated=True)
+    for error in (lost, invalidated):
+        assert not is_transient_db_error(error)
+        assert is_transient_db_error(error, idempotent=True)
+
+    fn, calls = failing([lost])
+    with pytest.raises(OperationalError):
+        retry_transaction(RetryPolicy(is_transient_db_error, base_delay=0.001))(fn)()
+    assert len(calls) == 1
+
+
+def test_retries_transient_errors():
+    fn, calls = failing([locked_error(), locked_error()])
+    policy = RetryPolicy(is_transient_db_error, attempts=3, base_delay=0.001)
+    assert retry_transaction(policy)(fn)() == 'ok'
+    assert len(calls) == 3
+
+
+def test_exhausted_retries_respond_service_unavailable():
+    fn, calls = failing([locked_error() for _ in range(3)])
+    policy = RetryPolicy(is_transient_db_error, attempts=2, base_delay=0.001)
+    with pytest.raises(HttpError) as error:
+        retry_transaction(policy)(fn)()
+    assert error.value.status_code == Status.SERVICE_UNAVAILABLE
+    assert len(calls) == 2
+
+
+def test_does_not_retry_other_errors():
+    fn, calls = failing([HttpError(Status.CONFLICT)])
+    with pytest.raises(HttpError):
+        retry_transaction(RetryPolicy(is_transient_db_error, base_delay=0.001))(fn)()
+    assert len(calls) == 1
+
+
+def test_backoff_is_capped():
+    policy = RetryPolicy(is_transient_db_error, attempts=10, base_delay=0.1, max_delay=0.3)
+    assert all(0 <= policy.backoff(attempt) <= 0.3 for attempt in range(1, 10))
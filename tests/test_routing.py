@@ -73,3 +73,29 @@ parametric_test_data = [
 def test_parametric_routing(parametric_router: Router, empty_request: Request, path, expectation):
     with expectation as expected_return:
         assert parametric_router.dispatch(path, empty_request) == expected_return
+
+
+def test_route_timeout_sets_request_deadline(empty_request: Request):
+    router = Router()
+    router.add_route('^/slow$', dummy_request_handler('slow'), timeout=5)
+    router.add_route('^/default$', dummy_request_handler('default'))
+
+    router.dispatch('/default', empty_request)
+    assert empty_request.deadline is None
+
+    router.dispatch('/slow', empty_request)
+    assert 0 < empty_request.remaining() <= 5
+
+
+def test_timeout_header_only_shortens_deadline():
+    request = Request({'HTTP_X_REQUEST_TIMEOUT': '1'})
+    request.set_timeout(5)
+    assert request.remaining() <= 1
+
+    request.set_timeout(None)
+    assert request.remaining() <= 1
+
+    request = Request({'HTTP_X_REQUEST_TIMEOUT': '0'})
+    request.set_timeout(5)
+    with pytest.raises(HttpError):
+        request.check_deadline()
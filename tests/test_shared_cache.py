@@ -0,0 +1,81 @@
+import time
+import multiprocessing
+import pytest
+
+from account_service.utils import SharedCache, LocalCache, TieredCache
+
+
+@pytest.fixture
+def cache(tmp_path) -> SharedCache:
+    cache = SharedCache(str(tmp_path / 'cache.shm'), slots=64, slot_size=128, stripes=4, ways=4)
+    yield cache
+    cache.close()
+
+
+def test_set_get_delete(cache: SharedCache):
+    assert cache.get('a') is None
+    assert cache.set('a', {'id': 'user', 'role': 'admin'}, ttl=10)
+    assert cache.get('a') == {'id': 'user', 'role': 'admin'}
+    cache.set('a', 1, ttl=10)
+    assert cache.get('a') == 1
+    cache.delete('a')
+    assert cache.get('a', 'default') == 'default'
+
+
+def test_expiration_and_size_limit(cache: SharedCache):
+    cache.set('short', True, ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get('short') is None
+    assert not cache.set('large', 'x' * cache.max_value_size, ttl=10)
+
+
+def test_full_group_evicts_entries(cache: SharedCache):
+    for i in range(1000):
+        cache.set(f'key-{i}', i, ttl=10 + i)
+    assert cache.get('key-999') == 999
+    assert sum(1 for i in range(1000) if cache.get(f'key-{i}') is not None) <= 64
+
+
+def _write_from_other_process(path):
+    other = SharedCache(path, slots=64, slot_size=128, stripes=4, ways=4)
+    other.set('from-child', [1, 2, 3], ttl=10)
+    other.close()
+
+
+def test_shared_between_processes(cache: SharedCache):
+    process = multiprocessing.get_context('fork').Process(target=_write_from_other_process, args=(cache.path,))
+    process.start()
+    process.join()
+    assert cache.get('from-child') == [1, 2, 3]
+
+
+def test_tiered_cache_fills_local_level(cache: SharedCache):
+    tiered = TieredCache('ns', LocalCache(ttl=10), shared=lambda: cache)
+    cache.set('ns:key', 'shared value', ttl=10)
+    assert tiered.get('key') == 'shared value'
+    assert tiered.local.get('key') == 'shared value'
+    tiered.delete('key')
+    assert cache.get('ns:key') is None
+
+
+def test_tiered_cache_without_local_copies(cache: SharedCache):
+    # Two workers sharing one cache: local copies hide updates made by the other worker until they expire
+    worker1 = TieredCache('ns', LocalCache(ttl=10), shared=lambda: cache)
+    worker2 = TieredCache('ns', LocalCache(ttl=10), shared=lambda: cache)
+    worker2.set('copied', 1)
+    assert worker1.get('copied') == 1
+    worker2.set('copied', 2)
+    assert worker1.get('copied') == 1
+
+    worker1 = TieredCache('ns', LocalCache(ttl=10), shared=lambda: cache, local_copies=False)
+    worker2 = TieredCache('ns', LocalCache(ttl=10), shared=lambda: cache, local_copies=False)
+    worker2.set('key', 1)
+    assert worker1.get('key') == 1
+    worker2.set('key', 2)
+    assert worker1.get('key') == 2
+    assert worker1.get('missing', 'default') == 'default'
+
+    # Without a shared cache the local one is used
+    local = TieredCache('ns', LocalCache(ttl=10), local_copies=False)
+    local.set('key', 3)
+    assert local.get('key') == 3
@@ -0,0 +1,37 @@
+from account_service.utils import Timings, timed, set_current_request
+
+
+class _Request(object):
+    timings = None
+
+
+def test_timings():
+    timings = Timings()
+    timings.add('db', 0.001)
+    timings.add('db', 0.002)
+    timings.add('jwt', 0.0005)
+    assert timings.as_dict() == {'db': 3.0, 'jwt': 0.5}
+    assert timings.server_timing(0.01) == 'db;dur=3.000;desc="2x", jwt;dur=0.500, total;dur=10.000'
+
+
+def test_timed_current_request():
+    request = _Request()
+    set_current_request(request)
+    try:
+        # Not collected
+        with timed('db'):
+            pass
+
+        request.timings = Timings()
+        with timed('db'):
+            pass
+        with timed('db'):
+            pass
+        assert list(request.timings.as_dict()) == ['db']
+        assert 'desc="2x"' in request.timings.server_timing()
+    finally:
+        set_current_request(None)
+
+    # No current request
+    with timed('db'):
+        pass